@@ -7,11 +7,15 @@ from django.db.models import Q
 from .models.geo_models import Continent, Country
 from .models.asset_models import AssetType, Asset, AssetLink, AssetVulnerabilityAnswer, AssetCriticalityAnswer, AssetVulnerabilityQuestion, AssetCriticalityQuestion
 from .models.risk_models import (
-    RiskType, RiskSubtype, BaselineThreatAssessment, Scenario, RiskScenarioAssessment, 
-    FinalRiskMatrix, ScenarioQuestion, QuestionChoice, AssetScenarioAnswer
+    RiskType, RiskSubtype, BaselineThreatAssessment, CurrentBaselineThreat, Scenario, RiskScenarioAssessment, 
+    FinalRiskMatrix, ScenarioQuestion, QuestionChoice, AssetScenarioAnswer, ResidualRiskDistribution
 )
 from .models.barrier_models import Barrier, BarrierQuestion, BarrierEffectivenessScore, BarrierQuestionAnswer, BarrierIssueReport, BarrierCategory
-from .models.log_models import RiskLog
+from .models.log_models import RiskLog, RiskLogRollup
+from .models.job_models import RiskJob
+from .models.cache_models import TableChangeCounter
+from .risk_engine.dependencies import BASELINE_THREAT
+from .risk_engine.jobs import enqueue_invalidation
 
 
 admin.site.site_header = "GEMS Admin"
@@ -66,10 +70,8 @@ class BaselineThreatAssessmentAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        # Trigger risk matrix generation for affected assets
-        assets = Asset.objects.filter(country=obj.country)
-        for asset in assets:
-            FinalRiskMatrix.generate_matrices(asset)
+        # Queue risk matrix generation for the affected cells
+        enqueue_invalidation(BASELINE_THREAT, country_id=obj.country_id, risk_type_ids=[obj.risk_type_id])
 
 class QuestionChoiceInline(admin.TabularInline):
     model = QuestionChoice
@@ -457,6 +459,12 @@ class RiskLogAdmin(admin.ModelAdmin):
     search_fields = ('asset__name', 'risk_type__name')
     readonly_fields = ('timestamp',)
 
+@admin.register(RiskLogRollup)
+class RiskLogRollupAdmin(admin.ModelAdmin):
+    list_display = ('asset', 'risk_type', 'resolution', 'bucket_start', 'count', 'residual_risk_score_min', 'residual_risk_score_max', 'residual_risk_score_last')
+    list_filter = ('resolution', 'risk_type')
+    search_fields = ('asset__name',)
+
 @admin.register(BarrierCategory)
 class BarrierCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
@@ -561,6 +569,31 @@ class BarrierQuestionAnswerAdmin(admin.ModelAdmin):
         # Trigger risk matrix generation
         FinalRiskMatrix.generate_matrices(obj.asset)
 
+@admin.register(RiskJob)
+class RiskJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'lease_owner', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at')
+
+@admin.register(CurrentBaselineThreat)
+class CurrentBaselineThreatAdmin(admin.ModelAdmin):
+    list_display = ('country', 'risk_type', 'baseline_score', 'date_assessed')
+    list_filter = ('risk_type',)
+    search_fields = ('country__name',)
+    readonly_fields = ('country', 'risk_type', 'assessment', 'baseline_score', 'date_assessed')
+
+@admin.register(ResidualRiskDistribution)
+class ResidualRiskDistributionAdmin(admin.ModelAdmin):
+    list_display = ('asset', 'risk_type', 'mean', 'p5', 'p50', 'p95', 'draws', 'seed', 'computed_at')
+    list_filter = ('risk_type',)
+    search_fields = ('asset__name',)
+
+@admin.register(TableChangeCounter)
+class TableChangeCounterAdmin(admin.ModelAdmin):
+    list_display = ('table', 'version', 'changed_at')
+    search_fields = ('table',)
+    readonly_fields = ('table', 'version', 'changed_at')
+
 # Register the remaining models
 admin.site.register(AssetType)
 
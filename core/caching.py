@@ -0,0 +1,365 @@
+"""
+Tag-versioned response cache.
+
+A cached view declares the tags its response depends on: model names such as
+"Barrier" or "RiskType" for whole tables, and "Asset:{asset_id}" style
+templates, filled from the view's URL arguments, for single rows. Every tag
+has a version stored in the cache, and a response is stored under a key
+derived from the request and the current versions of its tags, so changing
+a version makes every response that depends on it unreachable.
+
+Versions are bumped by the post_save, post_delete and m2m_changed receivers
+connected by connect_receivers() when the app is ready. A saved or deleted
+row bumps its model tag, its own "Model:pk" tag and the "Parent:pk" tag of
+every row it has a foreign key to, so an answer bumps "Asset:<asset id>". An
+m2m change bumps the through table's tag, such as "Asset_barriers", and the
+"Model:pk" tags of the rows on both sides; views listing a relation for
+every row declare the through table's tag.
+
+Bulk writers (bulk_create, bulk_update, queryset update and delete) fire no
+signals and call invalidate_model() themselves. Bumps made inside a
+transaction are coalesced and applied once it commits, so other requests
+cannot cache data read before the commit under the new versions.
+
+The same bumps increment a TableChangeCounter, in the database, for each
+table-level tag. Inside a transaction the counters are incremented in the
+transaction itself, once per table, so they commit or roll back with the
+data; autocommit writes increment them right away. Counting is best-effort:
+a failed increment is logged and never fails the write. Row tags are not
+counted: "Asset:5" is also bumped by writes
+to the asset's answers and matrices, which are not changes to the Asset
+table. Views cached with conditional=True declare every table they read,
+including the tables of their row tags, and derive a strong ETag and
+Last-Modified from the counters of those tables with one query, so every
+process agrees on them. A matching If-None-Match or If-Modified-Since is
+answered with 304 before the view runs. The counters are also part of the
+key the response is cached under, so a body cached before a write made by
+another process is never sent under the version stamp of that write.
+
+Only the cache API (get_many, add, delete_many) is used, so this works with
+the local-memory and file-based backends. A missing version, whether never
+set, invalidated or culled, is replaced by a fresh random one, which can only
+cause a miss. With the local-memory backend invalidations stay in the
+process that made the write, so writes made by risk worker processes are
+only picked up when RESPONSE_CACHE_TIMEOUT runs out; use a shared backend
+such as FileBasedCache where that matters.
+"""
+
+import functools
+import hashlib
+import logging
+import threading
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import DatabaseError, models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models.model_imports import get_model
+
+# Seconds a response is kept at most, as a bound for invalidations the
+# process does not see
+RESPONSE_CACHE_TIMEOUT = 300
+
+TAG_KEY_PREFIX = 'cache_tag:'
+RESPONSE_KEY_PREFIX = 'cached_response:'
+
+# History and bookkeeping tables, written far more often than they are read
+# and never cached; they get no receivers and cannot be used as tags
+UNTRACKED_MODELS = {
+    'RiskLog', 'RiskLogRollup', 'RiskJob', 'BarrierEffectivenessSnapshot', 'ResidualRiskDistribution',
+    'TableChangeCounter',
+}
+
+# Derived tables rewritten in bulk by the risk engine. Their writers and
+# their parents' post_delete invalidate them, so no post_delete receiver is
+# connected: one would turn every cascade and queryset delete of these
+# tables into row-by-row deletes.
+BULK_MODELS = {
+    'RiskScenarioAssessment', 'FinalRiskMatrix', 'BarrierRiskEffectiveness', 'CurrentBaselineThreat',
+}
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _tag_keys(tags):
+    return {tag: TAG_KEY_PREFIX + tag for tag in tags}
+
+
+def _tables(tags):
+    """Tables named by the table-level tags among ``tags``."""
+    return {tag for tag in tags if ':' not in tag}
+
+
+def _count_changes(tables):
+    """Increment the change counters of the tables; a failure is logged, not raised."""
+    TableChangeCounter = get_model('core', 'TableChangeCounter')
+    if not tables:
+        return
+    try:
+        # A savepoint inside a transaction, so a failure leaves it usable
+        with transaction.atomic():
+            TableChangeCounter.objects.bulk_create(
+                [TableChangeCounter(table=table) for table in tables], ignore_conflicts=True
+            )
+            TableChangeCounter.objects.filter(table__in=tables).update(
+                version=F('version') + 1, changed_at=timezone.now()
+            )
+    except DatabaseError:
+        logger.exception("Could not count the changes to %s", ', '.join(sorted(tables)))
+
+
+def table_versions(tables):
+    """Version stamp of the given tables: their (table, version) pairs and last change."""
+    TableChangeCounter = get_model('core', 'TableChangeCounter')
+    counters = {
+        table: (version, changed_at)
+        for table, version, changed_at in TableChangeCounter.objects.filter(
+            table__in=tables
+        ).values_list('table', 'version', 'changed_at')
+    }
+    versions = sorted((table, counters.get(table, (0, None))[0]) for table in tables)
+    changed = [changed_at for _, changed_at in counters.values() if changed_at is not None]
+    return versions, max(changed) if changed else None
+
+
+def tag_versions(tags):
+    """Current version of each tag, in order, creating missing ones."""
+    keys = _tag_keys(tags)
+    stored = cache.get_many(keys.values())
+    versions = []
+    for tag, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # Another process may have created it in the meantime
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions.append(version)
+    return versions
+
+
+class PendingTags(set):
+    """Tags bumped in the current transaction, invalidated once it commits."""
+
+    def __init__(self):
+        super().__init__()
+        # Tables already counted in the transaction, with the savepoints open
+        # when they were; a count is kept while those savepoints are
+        self.counted = {}
+
+    def count(self, tables, connection):
+        """Count the changes to the tables not counted yet in the transaction."""
+        savepoints = tuple(connection.savepoint_ids)
+        # Counts made in a savepoint that was since left may have been rolled
+        # back with it, so those tables are counted again
+        tables = {
+            table for table in tables
+            if savepoints[:len(self.counted.get(table, ()))] != self.counted.get(table)
+        }
+        if tables:
+            _count_changes(tables)
+            self.counted.update(dict.fromkeys(tables, savepoints))
+
+    def flush(self):
+        if getattr(_local, 'pending', None) is self:
+            _local.pending = None
+        if self:
+            cache.delete_many(_tag_keys(self).values())
+
+
+def invalidate_tags(tags):
+    """Bump the versions of the given tags, on commit when in a transaction."""
+    tags = set(tags)
+    if not tags:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        cache.delete_many(_tag_keys(tags).values())
+        _count_changes(_tables(tags))
+        return
+
+    pending = getattr(_local, 'pending', None)
+    if pending is None or not any(entry[1] == pending.flush for entry in connection.run_on_commit):
+        # Nothing pending, or the transaction that scheduled it rolled back
+        pending = _local.pending = PendingTags()
+        transaction.on_commit(pending.flush)
+    pending.update(tags)
+    pending.count(_tables(tags), connection)
+
+
+def instance_tags(instance):
+    """Tags bumped when a row is saved or deleted."""
+    model = type(instance)
+    tags = {model.__name__, f'{model.__name__}:{instance.pk}'}
+    for field in model._meta.concrete_fields:
+        if isinstance(field, models.ForeignKey):
+            value = getattr(instance, field.attname)
+            if value is not None:
+                tags.add(f'{field.related_model.__name__}:{value}')
+    return tags
+
+
+def invalidate_model(model, **parent_ids):
+    """Invalidate the tags of rows written in bulk.
+
+    ``model`` is a model class or name; ``parent_ids`` maps model names to
+    the ids of the written rows' parents, or of the rows themselves, e.g.
+    ``invalidate_model('FinalRiskMatrix', Asset=asset_ids)``.
+    """
+    name = model if isinstance(model, str) else model.__name__
+    invalidate_tags({name} | {
+        f'{parent}:{pk}' for parent, ids in parent_ids.items() for pk in ids
+    })
+
+
+def _invalidate_instance(sender, instance, **kwargs):
+    invalidate_tags(instance_tags(instance))
+
+
+def _invalidate_relation(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    tags = {sender.__name__, f'{type(instance).__name__}:{instance.pk}'}
+    tags.update(f'{model.__name__}:{pk}' for pk in pk_set or ())
+    invalidate_tags(tags)
+
+
+def connect_receivers():
+    """Connect the invalidation receivers to the core models; called from CoreConfig.ready()."""
+    for model in apps.get_app_config('core').get_models(include_auto_created=True):
+        name = model.__name__
+        if name in UNTRACKED_MODELS:
+            continue
+        if model._meta.auto_created:
+            m2m_changed.connect(_invalidate_relation, sender=model, dispatch_uid=f'cache_tags_m2m_{name}')
+        post_save.connect(_invalidate_instance, sender=model, dispatch_uid=f'cache_tags_save_{name}')
+        if name not in BULK_MODELS:
+            post_delete.connect(_invalidate_instance, sender=model, dispatch_uid=f'cache_tags_delete_{name}')
+
+
+class _ViewArguments(dict):
+    """Keyword arguments of a view; optional ones left out of the URL format as None."""
+
+    def __missing__(self, key):
+        return None
+
+
+def _check_tags(tags, conditional):
+    for tag in tags:
+        table = tag.partition(':')[0]
+        if table in UNTRACKED_MODELS:
+            raise ValueError(f"{tag} is not a cacheable tag")
+        if conditional and table not in tags:
+            # Row tags are not counted, so the ETag would miss changes to the row
+            raise ValueError(f"{tag} needs its table {table} declared as a tag of a conditional view")
+
+
+def _version_stamp(request, tables):
+    """Strong ETag, Last-Modified timestamp and table versions of a request to a conditional view."""
+    versions, changed_at = table_versions(tables)
+    signature = repr((request.path, sorted(request.GET.lists()), versions))
+    etag = f'"{hashlib.md5(signature.encode()).hexdigest()}"'
+    return etag, int(changed_at.timestamp()) if changed_at else None, versions
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Authenticated data: browsers may keep it but must revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def cached_response(tags, timeout=RESPONSE_CACHE_TIMEOUT, conditional=False):
+    """Cache the successful responses of a GET view until one of its tags changes.
+
+    ``tags`` are formatted with the view's keyword arguments. The decorator
+    goes directly above the view function, below the DRF decorators, so
+    authentication and permissions are checked before the cache is read.
+    Responses are shared between users and vary on the path and query
+    string only.
+
+    With ``conditional``, responses carry an ETag and Last-Modified computed
+    from the change counters of the table-level tags, and requests whose
+    validators still match get a 304 without the view or the cache being
+    read. The table of every row tag must then be declared too.
+    """
+    _check_tags(tags, conditional)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            view_tags = [tag.format_map(_ViewArguments(kwargs)) for tag in tags]
+            versions = None
+            if conditional:
+                etag, last_modified, versions = _version_stamp(request, _tables(view_tags))
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    _set_validators(not_modified, etag, last_modified)
+                    return not_modified
+
+            response = _cached_view_response(view, view_tags, versions, timeout, request, *args, **kwargs)
+            if conditional and response.status_code == 200 and not _is_error(response):
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_content(name, tags, build, timeout=RESPONSE_CACHE_TIMEOUT):
+    """Value returned by ``build()``, cached until one of ``tags`` changes.
+
+    For views caching only part of their response; whole responses are
+    cached with cached_response.
+    """
+    signature = repr(tag_versions(tags))
+    key = f'{RESPONSE_KEY_PREFIX}{name}:{hashlib.md5(signature.encode()).hexdigest()}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+def _is_error(response):
+    # Errors reported with a 200 status
+    return (isinstance(response, Response) and isinstance(response.data, dict)
+            and response.data.get('success') is False)
+
+
+def _cached_view_response(view, tags, stamp, timeout, request, *args, **kwargs):
+    """Response of the view from the cache, or from the view and then cached.
+
+    ``stamp`` holds the table versions the response is stamped with, if
+    any; they are part of the key.
+    """
+    signature = repr((request.path, sorted(request.GET.lists()), tag_versions(tags), stamp))
+    key = f'{RESPONSE_KEY_PREFIX}{view.__name__}:{hashlib.md5(signature.encode()).hexdigest()}'
+    cached = cache.get(key)
+    if cached is not None:
+        kind, body, content_type = cached
+        if kind == 'data':
+            return Response(body)
+        return HttpResponse(body, content_type=content_type)
+
+    response = view(request, *args, **kwargs)
+    if response.status_code != 200 or _is_error(response):
+        return response
+    if isinstance(response, Response):
+        cache.set(key, ('data', response.data, None), timeout)
+    elif not response.streaming:
+        cache.set(key, ('content', response.content, response['Content-Type']), timeout)
+    return response
@@ -0,0 +1,127 @@
+# Benchmark the dashboard endpoint on a large synthetic portfolio
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.models.asset_models import Asset, AssetType
+from core.models.geo_models import Continent, Country
+from core.models.risk_models import BaselineThreatAssessment, RiskType
+from core.risk_engine.baseline import refresh_current_baseline_threats
+from core.views.dashboard_views import get_dashboard_data
+
+
+class QueryCounter:
+    """Count the queries run in a block, without keeping them like CaptureQueriesContext."""
+
+    def __enter__(self):
+        self.count = 0
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Time get_dashboard_data and count its queries, uncached and cached, on a synthetic '
+            'portfolio. All data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--countries', type=int, default=200,
+                            help='Number of synthetic company-operated countries')
+        parser.add_argument('--assets', type=int, default=10000,
+                            help='Number of synthetic assets, spread over the countries')
+        parser.add_argument('--risk-types', type=int, default=8,
+                            help='Number of synthetic risk types, each with two BTAs per country')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of cached requests to average')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also time the former latest-date BTA lookups per country and asset')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options['countries'], options['assets'], options['risk_types'])
+            user = get_user_model().objects.create(username='dashboard-benchmark')
+
+            label = f"{options['countries']} countries, {options['assets']} assets"
+            seconds, queries, size = self.request(user)
+            self.stdout.write(f'{label}: uncached {seconds * 1000:.0f} ms, {queries} queries, {size / 1e6:.1f} MB')
+            timings = [self.request(user) for _ in range(options['repeat'])]
+            self.stdout.write(
+                f"{label}: cached {sum(t[0] for t in timings) / len(timings) * 1000:.0f} ms, "
+                f"{timings[-1][1]} queries"
+            )
+            if options['legacy']:
+                seconds, queries = self.legacy_lookups()
+                self.stdout.write(f'{label}: former BTA lookups alone {seconds * 1000:.0f} ms, {queries} queries')
+
+            transaction.set_rollback(True)
+
+    def populate(self, country_count, asset_count, risk_type_count):
+        continent, _ = Continent.objects.get_or_create(name='Benchmark')
+        # bulk_create skips the receivers, so BTAs are not seeded twice
+        countries = Country.objects.bulk_create([
+            Country(name=f'Benchmark Country {index}', code=f'{index:03d}', continent=continent,
+                    company_operated=True)
+            for index in range(country_count)
+        ])
+        risk_types = RiskType.objects.bulk_create([
+            RiskType(name=f'Benchmark Risk Type {index}') for index in range(risk_type_count)
+        ])
+        asset_type = AssetType.objects.create(name='Benchmark Asset Type')
+        Asset.objects.bulk_create([
+            Asset(name=f'Benchmark Asset {index}', description='', latitude=0, longitude=0,
+                  asset_type=asset_type, country=countries[index % country_count])
+            for index in range(asset_count)
+        ], batch_size=1000)
+        BaselineThreatAssessment.objects.bulk_create([
+            BaselineThreatAssessment(country=country, risk_type=risk_type, baseline_score=(index % 10) + 1,
+                                     date_assessed=date.today() - timedelta(days=30 * age))
+            for index, (country, risk_type) in enumerate(
+                (country, risk_type) for country in countries for risk_type in risk_types
+            )
+            for age in range(2)
+        ], batch_size=1000)
+        refresh_current_baseline_threats(
+            [(country.id, risk_type.id) for country in countries for risk_type in risk_types]
+        )
+
+    def request(self, user):
+        request = APIRequestFactory().get('/api/dashboard/data/')
+        force_authenticate(request, user=user)
+        with QueryCounter() as queries:
+            start = time.perf_counter()
+            response = get_dashboard_data(request)
+            seconds = time.perf_counter() - start
+        return seconds, queries.count, len(response.content)
+
+    def legacy_lookups(self):
+        with QueryCounter() as queries:
+            start = time.perf_counter()
+            for country_id in Country.objects.filter(company_operated=True).values_list('id', flat=True):
+                self.legacy_country_scores(country_id)
+            for asset in Asset.objects.all():
+                self.legacy_country_scores(asset.country.id)
+            seconds = time.perf_counter() - start
+        return seconds, queries.count
+
+    def legacy_country_scores(self, country_id):
+        latest_dates = BaselineThreatAssessment.objects.filter(
+            country_id=country_id
+        ).values('risk_type').annotate(latest_date=Max('date_assessed'))
+        return [
+            BaselineThreatAssessment.objects.get(
+                country_id=country_id, risk_type_id=date_info['risk_type'],
+                date_assessed=date_info['latest_date'],
+            ).baseline_score
+            for date_info in latest_dates
+        ]
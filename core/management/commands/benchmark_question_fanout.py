@@ -0,0 +1,65 @@
+# Benchmark adding a questionnaire question to a large portfolio
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models.asset_models import Asset, AssetType, AssetVulnerabilityAnswer, AssetVulnerabilityQuestion
+from core.models.geo_models import Continent, Country
+from core.models.risk_models import RiskType
+
+
+class Command(BaseCommand):
+    help = ('Time the creation of an asset vulnerability question, including its blank answer '
+            'fan-out, at several portfolio sizes. All data is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='Numbers of synthetic assets to benchmark with')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also time the former one INSERT per asset fan-out')
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            timings = self.benchmark(size, options['legacy'])
+            self.stdout.write(f'{size:>7} assets: ' + ', '.join(
+                f'{label} {seconds:.2f}s' for label, seconds in timings
+            ))
+
+    def benchmark(self, size, legacy):
+        timings = []
+        with transaction.atomic():
+            continent, _ = Continent.objects.get_or_create(name='Benchmark')
+            country = Country.objects.create(name='Benchmark Country', continent=continent)
+            asset_type = AssetType.objects.create(name='Benchmark Asset Type')
+            risk_type = RiskType.objects.create(name='Benchmark Risk Type')
+            # bulk_create skips the asset receivers, so only the question fan-out is measured
+            Asset.objects.bulk_create([
+                Asset(name=f'Benchmark Asset {index}', description='', latitude=0, longitude=0,
+                      asset_type=asset_type, country=country)
+                for index in range(size)
+            ], batch_size=1000)
+
+            start = time.perf_counter()
+            question = self.create_question(risk_type, 'Benchmark question')
+            timings.append(('bulk fan-out', time.perf_counter() - start))
+
+            if legacy:
+                start = time.perf_counter()
+                question = AssetVulnerabilityQuestion.objects.bulk_create([
+                    self.create_question(risk_type, 'Legacy benchmark question', save=False)
+                ])[0]
+                for asset in Asset.objects.all():
+                    AssetVulnerabilityAnswer.objects.create(asset=asset, question=question)
+                timings.append(('per-row fan-out', time.perf_counter() - start))
+
+            transaction.set_rollback(True)
+        return timings
+
+    def create_question(self, risk_type, text, save=True):
+        question = AssetVulnerabilityQuestion(question_text=text, risk_type=risk_type)
+        for index in range(1, 6):
+            setattr(question, f'choice{index}', f'Option {index}')
+            setattr(question, f'score{index}', index * 2)
+        if save:
+            question.save()
+        return question
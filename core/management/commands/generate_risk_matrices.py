@@ -0,0 +1,29 @@
+# Regenerate Final Risk Matrices for the whole portfolio
+from django.core.management.base import BaseCommand
+from core.models.asset_models import Asset
+from core.models.risk_models import FinalRiskMatrix
+
+
+class Command(BaseCommand):
+    help = 'Regenerate Final Risk Matrices for all (or selected) assets using the bulk engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--country', type=int, action='append', dest='countries',
+                            help='Only recompute assets in this country id (repeatable)')
+        parser.add_argument('--asset', type=int, action='append', dest='assets',
+                            help='Only recompute this asset id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of assets loaded and written per batch')
+
+    def handle(self, *args, **options):
+        assets = Asset.objects.all()
+        if options['countries']:
+            assets = assets.filter(country_id__in=options['countries'])
+        if options['assets']:
+            assets = assets.filter(id__in=options['assets'])
+
+        self.stdout.write(f'Regenerating risk matrices for {assets.count()} assets...')
+        stats = FinalRiskMatrix.generate_matrices_bulk(assets, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['created']} and updated {stats['updated']} risk matrices"
+        ))
@@ -11,18 +11,30 @@ from core.models.asset_models import (
 from core.models.risk_models import (
     RiskType, RiskSubtype, Scenario, ScenarioQuestion,
     QuestionChoice, AssetScenarioAnswer, RiskScenarioAssessment,
-    BaselineThreatAssessment, FinalRiskMatrix
+    BaselineThreatAssessment
 )
 from core.models.barrier_models import (
     Barrier, BarrierCategory, BarrierEffectivenessScore,
     BarrierQuestion, BarrierQuestionAnswer, BarrierIssueReport
 )
+from core.risk_engine import mark_assets_dirty, suspended
 
 
 class Command(BaseCommand):
     help = 'Populate complete test system with interconnected data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--defer-recompute', action='store_true',
+                            help='Suspend derived-data receivers and recompute everything once at the end')
+
     def handle(self, *args, **kwargs):
+        if kwargs['defer_recompute']:
+            with suspended():
+                self.populate()
+        else:
+            self.populate()
+
+    def populate(self):
         self.stdout.write('Starting system population...')
         
         # Create test admin user
@@ -566,8 +578,8 @@ class Command(BaseCommand):
                     barrier_effectiveness={str(barrier.id): 0.8 for barrier in scenario.barriers.all()}
                 )
 
-                # Generate risk matrices
-                FinalRiskMatrix.generate_matrices(asset)
+            # Generate risk matrices once all scenarios are assessed
+            mark_assets_dirty([asset.id])
 
         self.stdout.write('Created risk scenario assessments and matrices')
  
\ No newline at end of file
@@ -0,0 +1,20 @@
+# Rebuild the daily, weekly and monthly RiskLog rollups from the raw logs
+from django.core.management.base import BaseCommand
+from core.risk_engine.rollups import rebuild_risk_log_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily, weekly and monthly RiskLog rollups used by trend analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asset', type=int, action='append', dest='assets',
+                            help='Only rebuild the rollups of this asset id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rollups written per query')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding RiskLog rollups...')
+        stats = rebuild_risk_log_rollups(options['assets'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded {stats['logs']} risk logs into {stats['rollups']} rollups"
+        ))
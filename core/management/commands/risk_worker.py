@@ -0,0 +1,92 @@
+# Run queued risk recomputation jobs in a local process pool
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+
+
+def _run_job(job_id, owner):
+    from django.db import connections
+    from core.risk_engine.jobs import execute_job
+    try:
+        return execute_job(job_id, owner)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Claim and run background risk recomputation jobs from the RiskJob table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            help="Number of worker processes (default: RISK_WORKER['PROCESSES'])")
+        parser.add_argument('--lease-seconds', type=int,
+                            help="Lease duration of a claimed job (default: RISK_WORKER['LEASE_SECONDS'])")
+        parser.add_argument('--poll-interval', type=float,
+                            help="Seconds between polls of an idle queue (default: RISK_WORKER['POLL_INTERVAL'])")
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue has no runnable jobs left')
+
+    def handle(self, *args, **options):
+        from core.risk_engine.jobs import claim_jobs, release_leases, renew_leases, worker_setting
+
+        processes = options['processes'] or worker_setting('PROCESSES')
+        lease_seconds = options['lease_seconds'] or worker_setting('LEASE_SECONDS')
+        poll_interval = options['poll_interval'] or worker_setting('POLL_INTERVAL')
+        owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+        self.stdout.write(f'Risk worker {owner} started with {processes} processes')
+        in_flight = {}
+        pool = self._create_pool(processes)
+        try:
+            while True:
+                free = processes - len(in_flight)
+                claimed = claim_jobs(owner, free, lease_seconds) if free else []
+                try:
+                    for job_id in claimed:
+                        in_flight[pool.submit(_run_job, job_id, owner)] = job_id
+
+                    if not in_flight:
+                        if options['once']:
+                            break
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = in_flight[future]
+                        try:
+                            status = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            # The job keeps its lease and is reclaimed once it expires
+                            self.stderr.write(f'Job {job_id} failed in its worker process: {e}')
+                        else:
+                            self.stdout.write(f'Job {job_id} {status.lower()}')
+                        del in_flight[future]
+                except BrokenProcessPool:
+                    # A pool process died and took the whole pool down; hand its
+                    # jobs back to the queue and carry on with a new pool
+                    job_ids = set(in_flight.values()) | set(claimed)
+                    self.stderr.write(f'Worker pool broke, releasing jobs {sorted(job_ids)}')
+                    release_leases(owner, job_ids)
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._create_pool(processes)
+                    continue
+
+                # Keep the leases of long-running jobs alive
+                renew_leases(owner, list(in_flight.values()), lease_seconds)
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'Risk worker {owner} stopped'))
+
+    def _create_pool(self, processes):
+        from core.risk_engine.jobs import create_process_pool
+        return create_process_pool(processes)
@@ -0,0 +1,62 @@
+# Rebuild the Monte Carlo residual risk distributions of the portfolio
+import secrets
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+
+def _run_batch(asset_ids, draws, seed, batch):
+    from django.db import connections
+    from core.risk_engine.montecarlo import store_residual_risk_distribution
+    try:
+        return store_residual_risk_distribution(asset_ids, draws, seed, batch)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Sample Monte Carlo residual risk distributions (p5/p50/p95) for all (or selected) assets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--draws', type=int, default=1000,
+                            help='Number of Monte Carlo draws per asset')
+        parser.add_argument('--seed', type=int,
+                            help='Seed of the random generator (default: random, stored with the results)')
+        parser.add_argument('--asset', type=int, action='append', dest='assets',
+                            help='Only simulate this asset id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of assets sampled together in one process')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes; 1 runs in this process')
+
+    def handle(self, *args, **options):
+        from core.models.asset_models import Asset
+        from core.risk_engine.bulk import chunked
+        from core.risk_engine.jobs import create_process_pool
+
+        assets = Asset.objects.order_by('id')
+        if options['assets']:
+            assets = assets.filter(id__in=options['assets'])
+        seed = options['seed'] if options['seed'] is not None else secrets.randbits(63)
+        batches = list(chunked(assets.values_list('id', flat=True), options['batch_size']))
+        draws = options['draws']
+
+        self.stdout.write(
+            f'Sampling {draws} draws for {sum(len(batch) for batch in batches)} assets '
+            f'in {len(batches)} batches (seed {seed})...'
+        )
+        stored = 0
+        if options['processes'] > 1:
+            with create_process_pool(options['processes']) as pool:
+                futures = [
+                    pool.submit(_run_batch, asset_ids, draws, seed, batch)
+                    for batch, asset_ids in enumerate(batches)
+                ]
+                for future in as_completed(futures):
+                    stored += future.result()
+        else:
+            from core.risk_engine.montecarlo import store_residual_risk_distribution
+            for batch, asset_ids in enumerate(batches):
+                stored += store_residual_risk_distribution(asset_ids, draws, seed, batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} residual risk distributions'))
@@ -0,0 +1,23 @@
+"""
+Core application middleware.
+"""
+
+from .risk_engine.recompute import coalesced
+
+
+class CoalescedRecomputeMiddleware:
+    """Recompute the risk data of assets marked dirty during a request once, at its end.
+
+    Saves made in autocommit mode would otherwise each trigger their own
+    recompute; saves inside atomic blocks are already flushed on commit. The
+    response is built before the flush, so it does not show the recompute,
+    and a failing flush is queued as a job rather than failing a request
+    whose writes were committed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coalesced(fallback_to_job=True):
+            return self.get_response(request)
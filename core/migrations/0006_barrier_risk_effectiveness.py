@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_barrier_risk_effectiveness(apps, schema_editor):
+    """Materialize the effectiveness of every barrier against each risk type"""
+    Barrier = apps.get_model('core', 'Barrier')
+    BarrierEffectivenessScore = apps.get_model('core', 'BarrierEffectivenessScore')
+    BarrierRiskEffectiveness = apps.get_model('core', 'BarrierRiskEffectiveness')
+
+    adjustments = dict(Barrier.objects.values_list('id', 'performance_adjustment'))
+    type_links = set(Barrier.risk_types.through.objects.values_list('barrier_id', 'risktype_id'))
+    subtype_links = set(Barrier.risk_subtypes.through.objects.values_list(
+        'barrier_id', 'risksubtype_id', 'risksubtype__risk_type_id'
+    ))
+
+    best = {}
+    for barrier_id, risk_type_id, subtype_id, score in BarrierEffectivenessScore.objects.values_list(
+        'barrier_id', 'risk_type_id', 'risk_subtype_id', 'overall_effectiveness_score'
+    ):
+        if subtype_id is None:
+            applies = (barrier_id, risk_type_id) in type_links
+        else:
+            applies = (barrier_id, subtype_id, risk_type_id) in subtype_links
+        if applies:
+            key = (barrier_id, risk_type_id)
+            best[key] = max(best.get(key, score), score)
+
+    BarrierRiskEffectiveness.objects.bulk_create([
+        BarrierRiskEffectiveness(
+            barrier_id=barrier_id,
+            risk_type_id=risk_type_id,
+            base_score=base_score,
+            effectiveness_score=round(base_score * adjustments[barrier_id], 2),
+        )
+        for (barrier_id, risk_type_id), base_score in best.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_barrier_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarrierRiskEffectiveness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_score', models.FloatField(default=0, help_text='Highest applicable overall effectiveness score before performance adjustment')),
+                ('effectiveness_score', models.FloatField(default=0, help_text="Base score multiplied by the barrier's performance adjustment")),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('barrier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_effectiveness', to='core.barrier')),
+                ('risk_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='barrier_risk_effectiveness', to='core.risktype')),
+            ],
+            options={
+                'unique_together': {('barrier', 'risk_type')},
+            },
+        ),
+        migrations.RunPython(populate_barrier_risk_effectiveness, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_risk_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResidualRiskDistribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('draws', models.PositiveIntegerField()),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('mean', models.FloatField()),
+                ('p5', models.FloatField()),
+                ('p50', models.FloatField()),
+                ('p95', models.FloatField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_distributions', to='core.asset')),
+                ('risk_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_distributions', to='core.risktype')),
+            ],
+            options={
+                'unique_together': {('asset', 'risk_type')},
+            },
+        ),
+    ]
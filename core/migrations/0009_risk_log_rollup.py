@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_residual_risk_distribution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('DAY', 'Daily'), ('WEEK', 'Weekly'), ('MONTH', 'Monthly')], max_length=10)),
+                ('bucket_start', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField()),
+                ('bta_score_min', models.IntegerField()),
+                ('bta_score_max', models.IntegerField()),
+                ('bta_score_sum', models.IntegerField()),
+                ('bta_score_last', models.IntegerField()),
+                ('vulnerability_score_min', models.IntegerField()),
+                ('vulnerability_score_max', models.IntegerField()),
+                ('vulnerability_score_sum', models.IntegerField()),
+                ('vulnerability_score_last', models.IntegerField()),
+                ('criticality_score_min', models.IntegerField()),
+                ('criticality_score_max', models.IntegerField()),
+                ('criticality_score_sum', models.IntegerField()),
+                ('criticality_score_last', models.IntegerField()),
+                ('residual_risk_score_min', models.IntegerField()),
+                ('residual_risk_score_max', models.IntegerField()),
+                ('residual_risk_score_sum', models.IntegerField()),
+                ('residual_risk_score_last', models.IntegerField()),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_log_rollups', to='core.asset')),
+                ('risk_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_log_rollups', to='core.risktype')),
+            ],
+            options={
+                'unique_together': {('asset', 'risk_type', 'resolution', 'bucket_start')},
+            },
+        ),
+    ]
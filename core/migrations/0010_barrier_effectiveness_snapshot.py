@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+from statistics import mean
+
+
+def record_initial_snapshots(apps, schema_editor):
+    """Start the effectiveness history of every barrier from its current state"""
+    Barrier = apps.get_model('core', 'Barrier')
+    BarrierEffectivenessScore = apps.get_model('core', 'BarrierEffectivenessScore')
+    BarrierRiskEffectiveness = apps.get_model('core', 'BarrierRiskEffectiveness')
+    BarrierEffectivenessSnapshot = apps.get_model('core', 'BarrierEffectivenessSnapshot')
+
+    overall_scores = {}
+    for barrier_id, score in BarrierEffectivenessScore.objects.values_list('barrier_id', 'overall_effectiveness_score'):
+        overall_scores.setdefault(barrier_id, []).append(score)
+    risk_effectiveness = {}
+    for barrier_id, risk_type_id, score in BarrierRiskEffectiveness.objects.values_list(
+        'barrier_id', 'risk_type_id', 'effectiveness_score'
+    ):
+        risk_effectiveness.setdefault(barrier_id, {})[str(risk_type_id)] = score
+
+    now = timezone.now()
+    BarrierEffectivenessSnapshot.objects.bulk_create([
+        BarrierEffectivenessSnapshot(
+            barrier_id=barrier_id,
+            recorded_at=now,
+            overall_effectiveness=(
+                round(mean(overall_scores[barrier_id]) * adjustment, 2) if barrier_id in overall_scores else 0
+            ),
+            performance_adjustment=adjustment,
+            risk_effectiveness=risk_effectiveness.get(barrier_id, {}),
+        )
+        for barrier_id, adjustment in Barrier.objects.values_list('id', 'performance_adjustment')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_risk_log_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarrierEffectivenessSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('overall_effectiveness', models.FloatField(help_text='Barrier.get_overall_effectiveness_score at the time of the snapshot')),
+                ('performance_adjustment', models.FloatField()),
+                ('risk_effectiveness', models.JSONField(blank=True, default=dict, help_text='Effectiveness score per risk type id')),
+                ('barrier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effectiveness_snapshots', to='core.barrier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['barrier', 'recorded_at'], name='core_barrie_barrier_852749_idx')],
+            },
+        ),
+        migrations.RunPython(record_initial_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:49
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_current_baseline_threats(apps, schema_editor):
+    """Project the most recent assessment of every (country, risk type)"""
+    BaselineThreatAssessment = apps.get_model('core', 'BaselineThreatAssessment')
+    CurrentBaselineThreat = apps.get_model('core', 'CurrentBaselineThreat')
+
+    latest = {}
+    for assessment_id, country_id, risk_type_id, baseline_score, date_assessed in (
+        BaselineThreatAssessment.objects.order_by('country_id', 'risk_type_id', '-date_assessed').values_list(
+            'id', 'country_id', 'risk_type_id', 'baseline_score', 'date_assessed'
+        )
+    ):
+        latest.setdefault((country_id, risk_type_id), CurrentBaselineThreat(
+            country_id=country_id, risk_type_id=risk_type_id, assessment_id=assessment_id,
+            baseline_score=baseline_score, date_assessed=date_assessed,
+        ))
+    CurrentBaselineThreat.objects.bulk_create(latest.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_barrier_effectiveness_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentBaselineThreat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('baseline_score', models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)])),
+                ('date_assessed', models.DateField()),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.baselinethreatassessment')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_baseline_threats', to='core.country')),
+                ('risk_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_baseline_threats', to='core.risktype')),
+            ],
+            options={
+                'unique_together': {('country', 'risk_type')},
+            },
+        ),
+        migrations.RunPython(populate_current_baseline_threats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_table_change_counter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['updated_at', 'id'], name='core_asset_updated_050249_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['country', 'updated_at', 'id'], name='core_asset_country_8924bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['asset_type', 'updated_at', 'id'], name='core_asset_asset_t_d1114d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finalriskmatrix',
+            index=models.Index(fields=['risk_level', 'asset'], name='core_finalr_risk_le_d3aea9_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_matrix_updated_at(apps, schema_editor):
+    # Existing matrices were last written when they were generated
+    FinalRiskMatrix = apps.get_model('core', 'FinalRiskMatrix')
+    FinalRiskMatrix.objects.update(updated_at=F('date_generated'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finalriskmatrix',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_matrix_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='finalriskmatrix',
+            index=models.Index(fields=['updated_at', 'id'], name='core_finalr_updated_b7f74b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='risklog',
+            index=models.Index(fields=['timestamp', 'id'], name='core_risklo_timesta_4db6cd_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from .asset_models import Asset, AssetType, AssetLink, AssetVulnerabilityQuestion, AssetCriticalityQuestion, AssetVulnerabilityAnswer, AssetCriticalityAnswer
-from .barrier_models import Barrier, BarrierCategory, BarrierIssueReport
+from .barrier_models import Barrier, BarrierCategory, BarrierEffectivenessSnapshot, BarrierIssueReport
 from .geo_models import Country
-from .risk_models import RiskType, RiskSubtype, Scenario, RiskScenarioAssessment, BaselineThreatAssessment, FinalRiskMatrix
-from .log_models import RiskLog
+from .risk_models import RiskType, RiskSubtype, Scenario, RiskScenarioAssessment, BaselineThreatAssessment, CurrentBaselineThreat, FinalRiskMatrix, ResidualRiskDistribution
+from .log_models import RiskLog, RiskLogRollup
+from .job_models import RiskJob
+from .cache_models import TableChangeCounter
@@ -1,14 +1,22 @@
 from django.db import models
+from django.db.models import Count, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
 from statistics import mean
 from django.db import transaction
+from django.utils import timezone
 
 # Import models referenced in asset_models.py
 from ..models.geo_models import Country
 from ..models.risk_models import Scenario, RiskType, RiskScenarioAssessment, FinalRiskMatrix
 from ..models.barrier_models import Barrier, BarrierIssueReport
+from ..caching import invalidate_model
+from ..risk_engine.assessments import create_missing_assessments, recompute_assessments
+from ..risk_engine.links import propagate_links
+from ..risk_engine.recompute import mark_assets_dirty
+from ..risk_engine.seeding import create_blank_answers
+from ..risk_engine.suspension import defer, is_suspended
 
 
 class AssetType(models.Model):
@@ -33,9 +41,7 @@ class AssetLink(models.Model):
 
     def propagate_changes(self):
         """Propagate changes to all linked assets"""
-        with transaction.atomic():
-            for asset in self.assets.all():
-                asset.update_risk_assessment_based_on_link()
+        return propagate_links(link_ids=[self.pk])
 
 class Asset(models.Model):
     name = models.CharField(max_length=100)
@@ -54,6 +60,14 @@ class Asset(models.Model):
     def __str__(self):
         return f"{self.name} ({self.asset_type.name})"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of asset listings, overall and per filter
+            models.Index(fields=['updated_at', 'id']),
+            models.Index(fields=['country', 'updated_at', 'id']),
+            models.Index(fields=['asset_type', 'updated_at', 'id']),
+        ]
+
     def get_risk_level(self):
         """Calculate overall risk level for the asset"""
         # Get the latest risk matrices for this asset
@@ -103,136 +117,57 @@ class Asset(models.Model):
         self.save()
         self.update_risk_assessment()
 
+    @classmethod
+    def update_scores_bulk(cls, asset_ids, recompute=True):
+        """Update criticality and vulnerability scores of many assets with grouped queries
+
+        With ``recompute`` the assets are marked dirty; callers recomputing
+        their risk themselves pass False.
+        """
+        asset_ids = list(asset_ids)
+        scores = {}
+        for answer_model, field in [
+            (AssetCriticalityAnswer, 'criticality_score'),
+            (AssetVulnerabilityAnswer, 'vulnerability_score'),
+        ]:
+            rows = answer_model.objects.filter(
+                asset_id__in=asset_ids, selected_score__isnull=False
+            ).values('asset_id').annotate(total=Sum('selected_score'), count=Count('id'))
+            for row in rows:
+                # Same rounding as round(mean(scores)) in the calculate_*_score methods
+                scores.setdefault(row['asset_id'], {})[field] = round(row['total'] / row['count'])
+
+        assets = list(cls.objects.filter(id__in=asset_ids))
+        now = timezone.now()
+        for asset in assets:
+            asset_scores = scores.get(asset.id, {})
+            asset.criticality_score = asset_scores.get('criticality_score', 1)
+            asset.vulnerability_score = asset_scores.get('vulnerability_score', 1)
+            asset.updated_at = now
+        cls.objects.bulk_update(assets, ['criticality_score', 'vulnerability_score', 'updated_at'])
+        invalidate_model(cls, Asset=asset_ids)
+        if recompute:
+            mark_assets_dirty(asset_ids)
+
     @transaction.atomic
     def update_risk_assessment_based_on_link(self):
-        """Update risk assessment based on linked assets"""
-        asset_links = self.asset_links.all()
-        for asset_link in asset_links:
-            linked_assets = asset_link.assets.exclude(id=self.id)
-            shared_risks = asset_link.shared_risks.all()
-            shared_barriers = asset_link.shared_barriers.all()
-
-            for linked_asset in linked_assets:
-                # Update risk scores for shared risks
-                for risk in shared_risks:
-                    self.update_risk_score(linked_asset, risk)
-                
-                # Update barrier effectiveness for shared barriers
-                for barrier in shared_barriers:
-                    self.update_barrier_effectiveness(linked_asset, barrier)
-
-        # After updating all scores and effectiveness, recalculate final risk matrix
-        FinalRiskMatrix.generate_matrices(self)
-
-    def update_risk_score(self, linked_asset, risk):
-        """Update risk scores based on linked asset's risk assessment"""
-        # Get risk scenario assessments for both assets
-        linked_assessments = RiskScenarioAssessment.objects.filter(
-            asset=linked_asset,
-            risk_scenario__risk_subtypes__risk_type=risk
-        )
-        our_assessments = RiskScenarioAssessment.objects.filter(
-            asset=self,
-            risk_scenario__risk_subtypes__risk_type=risk
-        )
-
-        if not linked_assessments or not our_assessments:
-            return
-
-        # Calculate average scores from linked asset
-        linked_likelihood = mean([a.likelihood_rating for a in linked_assessments])
-        linked_impact = mean([a.impact_score for a in linked_assessments])
-
-        # Update our assessments based on linked asset's scores
-        # Use weighted average favoring our own assessment (70-30 split)
-        for assessment in our_assessments:
-            assessment.likelihood_rating = round(
-                (assessment.likelihood_rating * 0.7) + (linked_likelihood * 0.3)
-            )
-            assessment.impact_score = round(
-                (assessment.impact_score * 0.7) + (linked_impact * 0.3)
-            )
-            assessment.calculate_barrier_effectiveness()
-            assessment.calculate_residual_risk_score()
-            assessment.save()
-
-    def update_barrier_effectiveness(self, linked_asset, barrier):
-        """Update barrier effectiveness based on linked asset's barrier performance"""
-        # Get barrier effectiveness scores for both assets
-        linked_effectiveness = barrier.get_effectiveness_scores_by_risk()
-        
-        # Get all risk scenario assessments that use this barrier
-        assessments = self.risk_scenario_assessments.filter(
-            risk_scenario__barriers=barrier
-        )
-
-        for assessment in assessments:
-            if str(barrier.id) in assessment.barrier_performance:
-                # Get current performance
-                current_performance = assessment.barrier_performance[str(barrier.id)]
-                
-                # Get linked asset's performance for this barrier
-                linked_performance = linked_asset.risk_scenario_assessments.filter(
-                    risk_scenario__barriers=barrier
-                ).first()
-
-                if linked_performance and str(barrier.id) in linked_performance.barrier_performance:
-                    linked_perf_value = linked_performance.barrier_performance[str(barrier.id)]
-                    
-                    # Update performance using weighted average (70-30 split)
-                    new_performance = (current_performance * 0.7) + (linked_perf_value * 0.3)
-                    assessment.barrier_performance[str(barrier.id)] = round(new_performance, 2)
-                    
-                    # Recalculate effectiveness and risk score
-                    assessment.calculate_barrier_effectiveness()
-                    assessment.calculate_residual_risk_score()
-                    assessment.save()
+        """Blend the risk assessments of this asset and every asset linked to it"""
+        return propagate_links(asset_ids=[self.pk])
 
     def create_default_assessments(self):
-        """Create default risk scenario assessments"""
-        scenarios = self.scenarios.all()
-        for scenario in scenarios:
-            RiskScenarioAssessment.objects.update_or_create(
-                asset=self,
-                risk_scenario=scenario,
-                defaults={
-                    'likelihood_rating': 1,
-                    'impact_score': 1,
-                    'barrier_effectiveness': {},
-                    'barrier_performance': {str(barrier.id): 1.0 for barrier in scenario.barriers.all()},
-                    'residual_risk_score': 1,
-                }
-            )
+        """Create and score an assessment for every assigned scenario that lacks one"""
+        created = create_missing_assessments([self.pk])
+        if created:
+            recompute_assessments(created)
 
     def update_risk_assessment(self):
-        """Update risk assessment based on barrier issues"""
-        with transaction.atomic():
-            # Get all barrier issue reports affecting this asset
-            barrier_issues = BarrierIssueReport.objects.filter(
-                affected_assets=self,
-                status__in=['OPEN', 'IN_PROGRESS']
-            )
-            
-            # Update risk scenario assessments for this asset
-            for assessment in self.risk_scenario_assessments.all():
-                # Reset barrier performance to default (1.0)
-                assessment.barrier_performance = {
-                    str(barrier.id): 1.0 for barrier in assessment.risk_scenario.barriers.all()
-                }
-                
-                # Apply performance adjustments based on barrier issues
-                for issue in barrier_issues:
-                    if issue.barrier in assessment.risk_scenario.barriers.all():
-                        performance_adjustment = self.calculate_performance_adjustment(issue.impact_rating)
-                        assessment.barrier_performance[str(issue.barrier.id)] *= performance_adjustment
-                
-                # Recalculate barrier effectiveness and residual risk score
-                assessment.calculate_barrier_effectiveness()
-                assessment.calculate_residual_risk_score()
-                assessment.save()
-
-            # Update final risk matrix
-            FinalRiskMatrix.generate_matrices(self)
+        """Update risk assessment based on barrier issues
+
+        Barrier issues act through the barrier's performance adjustment, which is
+        part of the materialized barrier effectiveness. The asset is marked dirty
+        and its assessments and matrices are recomputed once, on commit.
+        """
+        mark_assets_dirty([self.pk])
 
     @staticmethod
     def calculate_performance_adjustment(impact_rating):
@@ -274,6 +209,10 @@ class AssetVulnerabilityQuestion(models.Model):
             (self.choice5, self.choice5),
         ]
 
+    def get_choice_scores(self):
+        """Map each choice to its score; the first of duplicate choices wins"""
+        return _choice_scores(self)
+
 class AssetCriticalityQuestion(models.Model):
     question_text = models.TextField()
     choice1 = models.CharField(max_length=255)
@@ -301,6 +240,10 @@ class AssetCriticalityQuestion(models.Model):
             (self.choice5, self.choice5),
         ]
 
+    def get_choice_scores(self):
+        """Map each choice to its score; the first of duplicate choices wins"""
+        return _choice_scores(self)
+
 class AssetVulnerabilityAnswer(models.Model):
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='asset_vulnerability_answers')
     question = models.ForeignKey(AssetVulnerabilityQuestion, on_delete=models.CASCADE, related_name='answers')
@@ -317,18 +260,23 @@ class AssetVulnerabilityAnswer(models.Model):
 
     def save(self, *args, **kwargs):
         if self.selected_choice:
-            if self.selected_choice == self.question.choice1:
-                self.selected_score = self.question.score1
-            elif self.selected_choice == self.question.choice2:
-                self.selected_score = self.question.score2
-            elif self.selected_choice == self.question.choice3:
-                self.selected_score = self.question.score3
-            elif self.selected_choice == self.question.choice4:
-                self.selected_score = self.question.score4
-            elif self.selected_choice == self.question.choice5:
-                self.selected_score = self.question.score5
+            self.selected_score = self.question.get_choice_scores().get(
+                self.selected_choice, self.selected_score
+            )
         super().save(*args, **kwargs)
-        self.asset.update_scores()
+        if is_suspended():
+            defer('asset_scores', [self.asset_id])
+        else:
+            self.asset.update_scores()
+
+    @classmethod
+    def bulk_save_answers(cls, asset, answers, update_scores=True):
+        """Save many answers of an asset and update its scores and risk once.
+
+        ``answers`` maps question id to the selected choice text. Returns the
+        number of answers created and updated.
+        """
+        return _bulk_save_answers(cls, asset, answers, update_scores)
 
 class AssetCriticalityAnswer(models.Model):
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='asset_criticality_answers')
@@ -346,38 +294,109 @@ class AssetCriticalityAnswer(models.Model):
 
     def save(self, *args, **kwargs):
         if self.selected_choice:
-            if self.selected_choice == self.question.choice1:
-                self.selected_score = self.question.score1
-            elif self.selected_choice == self.question.choice2:
-                self.selected_score = self.question.score2
-            elif self.selected_choice == self.question.choice3:
-                self.selected_score = self.question.score3
-            elif self.selected_choice == self.question.choice4:
-                self.selected_score = self.question.score4
-            elif self.selected_choice == self.question.choice5:
-                self.selected_score = self.question.score5
+            self.selected_score = self.question.get_choice_scores().get(
+                self.selected_choice, self.selected_score
+            )
         super().save(*args, **kwargs)
-        self.asset.update_scores()
+        if is_suspended():
+            defer('asset_scores', [self.asset_id])
+        else:
+            self.asset.update_scores()
+
+    @classmethod
+    def bulk_save_answers(cls, asset, answers, update_scores=True):
+        """Save many answers of an asset and update its scores and risk once.
+
+        ``answers`` maps question id to the selected choice text. Returns the
+        number of answers created and updated.
+        """
+        return _bulk_save_answers(cls, asset, answers, update_scores)
+
+def _choice_scores(question):
+    scores = {}
+    for index in range(1, 6):
+        scores.setdefault(getattr(question, f'choice{index}'), getattr(question, f'score{index}'))
+    return scores
+
+@transaction.atomic
+def _bulk_save_answers(answer_model, asset, answers, update_scores):
+    """Upsert questionnaire answers with one lookup per question and bulk writes"""
+    answers = {int(question_id): choice for question_id, choice in dict(answers).items()}
+    question_model = answer_model._meta.get_field('question').related_model
+    questions = question_model.objects.in_bulk(answers.keys())
+
+    missing = set(answers) - set(questions)
+    if missing:
+        raise ValueError(f"Unknown question ids: {sorted(missing)}")
+
+    choice_scores = {}
+    for question_id, choice in answers.items():
+        choice_scores[question_id] = questions[question_id].get_choice_scores()
+        if choice and choice not in choice_scores[question_id]:
+            raise ValueError(f"Invalid choice for question {question_id}: {choice}")
+
+    existing = {
+        answer.question_id: answer
+        for answer in answer_model.objects.filter(asset=asset, question_id__in=answers.keys())
+    }
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for question_id, choice in answers.items():
+        answer = existing.get(question_id)
+        if answer is None:
+            answer = answer_model(asset=asset, question_id=question_id)
+            to_create.append(answer)
+        else:
+            answer.updated_at = now
+            to_update.append(answer)
+        answer.selected_choice = choice
+        if choice:
+            answer.selected_score = choice_scores[question_id][choice]
+
+    answer_model.objects.bulk_create(to_create)
+    answer_model.objects.bulk_update(to_update, ['selected_choice', 'selected_score', 'updated_at'])
+    invalidate_model(answer_model, Asset=[asset.id])
+
+    if update_scores:
+        asset.update_scores()
+    return {'created': len(to_create), 'updated': len(to_update)}
 
 @receiver(post_save, sender=Asset)
 def create_assessments_on_asset_save(sender, instance, created, **kwargs):
-    instance.create_default_assessments()
+    mark_assets_dirty([instance.pk])
+
+@receiver(m2m_changed, sender=Asset.scenarios.through)
+@receiver(m2m_changed, sender=Asset.barriers.through)
+def update_risk_on_asset_assignments(sender, instance, action, reverse, pk_set, **kwargs):
+    """Scenario and barrier assignments decide which assessments and matrix cells an asset has"""
+    if action == 'pre_clear' and reverse:
+        # Remember which assets lose the assignment before the rows are gone
+        instance._cleared_asset_ids = list(sender.objects.filter(
+            **{f'{instance._meta.model_name}_id': instance.pk}
+        ).values_list('asset_id', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        if not reverse:
+            mark_assets_dirty([instance.pk])
+        elif action == 'post_clear':
+            mark_assets_dirty(getattr(instance, '_cleared_asset_ids', []))
+        else:
+            mark_assets_dirty(pk_set or [])
 
 @receiver(post_save, sender=AssetVulnerabilityQuestion)
 def create_blank_vulnerability_answers(sender, instance, created, **kwargs):
-    if created:
-        assets = Asset.objects.all()
-        for asset in assets:
-            AssetVulnerabilityAnswer.objects.create(asset=asset, question=instance)
+    if created and is_suspended():
+        defer('blank_answers', [('AssetVulnerabilityAnswer', instance.pk)])
+    elif created:
+        create_blank_answers(AssetVulnerabilityAnswer, [instance.pk])
 
 @receiver(post_save, sender=AssetCriticalityQuestion)
 def create_blank_criticality_answers(sender, instance, created, **kwargs):
-    if created:
-        assets = Asset.objects.all()
-        for asset in assets:
-            AssetCriticalityAnswer.objects.create(asset=asset, question=instance)
+    if created and is_suspended():
+        defer('blank_answers', [('AssetCriticalityAnswer', instance.pk)])
+    elif created:
+        create_blank_answers(AssetCriticalityAnswer, [instance.pk])
 
 @receiver(post_save, sender=BarrierIssueReport)
 def update_asset_risk_assessments(sender, instance, **kwargs):
-    for asset in instance.affected_assets.all():
-        asset.update_risk_assessment()
\ No newline at end of file
+    mark_assets_dirty(instance.affected_assets.values_list('id', flat=True))
\ No newline at end of file
@@ -3,7 +3,11 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
 from statistics import mean
 from django.db import transaction
+from django.utils import timezone
 from .model_imports import get_risk_type_model, get_asset_model
+from ..risk_engine.links import propagate_links
+from ..risk_engine.recompute import mark_assets_dirty
+from ..risk_engine.suspension import defer, is_suspended
 
 class BarrierCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -43,39 +47,38 @@ class Barrier(models.Model):
         return round(base_score * self.performance_adjustment, 2)
 
     def get_risk_category_effectiveness_score(self, risk_type):
-        """Get effectiveness score for a specific risk type, considering both direct and subtype associations"""
-        scores = []
-        
-        # Get scores for this risk type
-        if risk_type in self.risk_types.all():
-            type_scores = self.effectiveness_scores.filter(risk_type=risk_type, risk_subtype=None)
-            scores.extend([score.overall_effectiveness_score for score in type_scores])
-        
-        # Get scores for subtypes of this risk type
-        subtype_scores = self.effectiveness_scores.filter(
-            risk_type=risk_type,
-            risk_subtype__in=self.risk_subtypes.filter(risk_type=risk_type)
-        )
-        scores.extend([score.overall_effectiveness_score for score in subtype_scores])
-        
-        if not scores:
-            return 0
-            
-        # Return the maximum effectiveness score among all applicable scores
-        # This ensures we use the most effective barrier configuration for this risk
-        return round(max(scores) * self.performance_adjustment, 2)
+        """Get effectiveness score for a specific risk type, considering both direct and subtype associations
+
+        Reads the materialized BarrierRiskEffectiveness rows, which hold the maximum
+        applicable effectiveness score multiplied by the performance adjustment.
+        Accepts a RiskType instance or id.
+        """
+        risk_type_id = getattr(risk_type, 'pk', risk_type)
+        return self.get_risk_effectiveness_scores().get(risk_type_id, 0)
+
+    def get_risk_effectiveness_scores(self):
+        """Map risk type id to this barrier's effectiveness score.
+
+        Uses prefetched risk_effectiveness rows when available, so callers looping
+        over many barriers should prefetch_related('risk_effectiveness').
+        """
+        return {
+            row.risk_type_id: row.effectiveness_score
+            for row in self.risk_effectiveness.all()
+        }
 
     def get_effectiveness_scores_by_risk(self):
         """Get effectiveness scores broken down by risk type and subtype"""
         scores = {}
+        effectiveness = self.get_risk_effectiveness_scores()
         
         # Get scores for all affected risk types
         for risk_type in self.risk_types.all():
-            scores[risk_type.name] = self.get_risk_category_effectiveness_score(risk_type)
+            scores[risk_type.name] = effectiveness.get(risk_type.id, 0)
         
         # Get scores for all affected subtypes
-        for subtype in self.risk_subtypes.all():
-            scores[f"{subtype.risk_type.name} - {subtype.name}"] = self.get_risk_category_effectiveness_score(subtype.risk_type)
+        for subtype in self.risk_subtypes.select_related('risk_type'):
+            scores[f"{subtype.risk_type.name} - {subtype.name}"] = effectiveness.get(subtype.risk_type_id, 0)
         
         return scores
 
@@ -100,9 +103,7 @@ class Barrier(models.Model):
 
     def propagate_effectiveness(self):
         """Propagate effectiveness changes to linked assets"""
-        for asset_link in self.asset_links.all():
-            for asset in asset_link.assets.all():
-                asset.update_risk_assessment_based_on_link()
+        return propagate_links(link_ids=self.asset_links.values_list('id', flat=True))
 
 class BarrierScenarioEffectiveness(models.Model):
     """Effectiveness of a barrier in specific scenarios"""
@@ -171,6 +172,48 @@ class BarrierEffectivenessScore(models.Model):
     class Meta:
         unique_together = ('barrier', 'risk_type', 'risk_subtype')
 
+class BarrierRiskEffectiveness(models.Model):
+    """
+    Materialized effectiveness of a barrier against a risk type.
+    Holds the result of Barrier.get_risk_category_effectiveness_score and is rebuilt
+    by core.risk_engine.effectiveness whenever its inputs change.
+    """
+    barrier = models.ForeignKey(Barrier, on_delete=models.CASCADE, related_name='risk_effectiveness')
+    risk_type = models.ForeignKey('RiskType', on_delete=models.CASCADE, related_name='barrier_risk_effectiveness')
+    base_score = models.FloatField(default=0,
+        help_text="Highest applicable overall effectiveness score before performance adjustment")
+    effectiveness_score = models.FloatField(default=0,
+        help_text="Base score multiplied by the barrier's performance adjustment")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.barrier.name} against {self.risk_type.name}: {self.effectiveness_score}"
+
+    class Meta:
+        unique_together = ('barrier', 'risk_type')
+
+class BarrierEffectivenessSnapshot(models.Model):
+    """
+    Barrier effectiveness and performance adjustment as of a point in time.
+    Recorded by core.risk_engine.effectiveness each time the materialized effectiveness
+    of the barrier is rebuilt with a different result; the series is a step function.
+    """
+    barrier = models.ForeignKey(Barrier, on_delete=models.CASCADE, related_name='effectiveness_snapshots')
+    recorded_at = models.DateTimeField(default=timezone.now)
+    overall_effectiveness = models.FloatField(
+        help_text="Barrier.get_overall_effectiveness_score at the time of the snapshot")
+    performance_adjustment = models.FloatField()
+    risk_effectiveness = models.JSONField(default=dict, blank=True,
+        help_text="Effectiveness score per risk type id")
+
+    def __str__(self):
+        return f"{self.barrier.name} effectiveness {self.overall_effectiveness} at {self.recorded_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barrier', 'recorded_at']),
+        ]
+
 class BarrierQuestion(models.Model):
     barrier = models.ForeignKey(Barrier, on_delete=models.CASCADE, related_name='questions')
     question_text = models.TextField()
@@ -237,14 +280,52 @@ class BarrierIssueReport(models.Model):
     def __str__(self):
         return f"Issue for {self.barrier.name} - {self.get_status_display()}"
 
-    @transaction.atomic
     def update_risk_matrix(self):
-        """Update risk matrices for affected assets"""
-        for asset in self.affected_assets.all():
-            asset.update_risk_assessment()
+        """Update risk matrices for affected assets once the change is committed"""
+        mark_assets_dirty(self.affected_assets.values_list('id', flat=True))
 
 def update_risk_assessment(sender, instance, action, **kwargs):
     if action in ['post_add', 'post_remove', 'post_clear']:
         instance.update_risk_matrix()
 
 models.signals.m2m_changed.connect(update_risk_assessment, sender=BarrierIssueReport.affected_assets.through)
+
+
+def refresh_or_defer_barrier_effectiveness(barrier_ids):
+    """Rebuild materialized effectiveness now, or once at the end of a suspended block"""
+    from ..risk_engine.effectiveness import refresh_barrier_effectiveness
+    if is_suspended():
+        defer('barrier_effectiveness', barrier_ids)
+    else:
+        refresh_barrier_effectiveness(barrier_ids)
+
+def update_barrier_risk_effectiveness(sender, instance, **kwargs):
+    """Rebuild materialized effectiveness after a barrier or one of its scores changes"""
+    barrier_id = instance.pk if isinstance(instance, Barrier) else instance.barrier_id
+    refresh_or_defer_barrier_effectiveness([barrier_id])
+
+def update_barrier_risk_effectiveness_on_association(sender, instance, action, reverse, pk_set, **kwargs):
+    """Rebuild materialized effectiveness when barrier risk type/subtype associations change"""
+    if action == 'pre_clear' and reverse:
+        # Remember which barriers lose the association before the rows are gone
+        instance._cleared_barrier_ids = list(instance.barriers.values_list('id', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        if not reverse:
+            barrier_ids = [instance.pk]
+        elif action == 'post_clear':
+            barrier_ids = getattr(instance, '_cleared_barrier_ids', [])
+        else:
+            barrier_ids = pk_set or []
+        refresh_or_defer_barrier_effectiveness(barrier_ids)
+
+def update_barrier_risk_effectiveness_on_subtype(sender, instance, created, **kwargs):
+    """A subtype moving to another risk type changes which scores apply"""
+    if not created:
+        refresh_or_defer_barrier_effectiveness(instance.barriers.values_list('id', flat=True))
+
+models.signals.post_save.connect(update_barrier_risk_effectiveness, sender=Barrier)
+models.signals.post_save.connect(update_barrier_risk_effectiveness, sender=BarrierEffectivenessScore)
+models.signals.post_delete.connect(update_barrier_risk_effectiveness, sender=BarrierEffectivenessScore)
+models.signals.m2m_changed.connect(update_barrier_risk_effectiveness_on_association, sender=Barrier.risk_types.through)
+models.signals.m2m_changed.connect(update_barrier_risk_effectiveness_on_association, sender=Barrier.risk_subtypes.through)
+models.signals.post_save.connect(update_barrier_risk_effectiveness_on_subtype, sender='core.RiskSubtype')
\ No newline at end of file
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class TableChangeCounter(models.Model):
+    """
+    Number of committed changes to a core table (or m2m through table), named by
+    its model, and the time of the last one.
+    Counters are bumped once per transaction by core.caching and give the
+    reference-data endpoints a version stamp that every process agrees on.
+    """
+    table = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
@@ -25,16 +25,9 @@ class Country(models.Model):
 
 @receiver(post_save, sender=Country)
 def create_bta_for_country(sender, instance, created, **kwargs):
-    if instance.company_operated:
-        from .risk_models import RiskType, BaselineThreatAssessment
-        risk_types = RiskType.objects.all()
-        for risk_type in risk_types:
-            BaselineThreatAssessment.objects.get_or_create(
-                risk_type=risk_type,
-                country=instance,
-                defaults={
-                    'baseline_score': 5,
-                    'impact_on_assets': True,
-                    'notes': 'Automatically created for new company-operated country.',
-                }
-            )
+    from ..risk_engine.seeding import seed_baseline_threats
+    from ..risk_engine.suspension import defer, is_suspended
+    if instance.company_operated and is_suspended():
+        defer('baseline_threats', [instance.pk])
+    elif instance.company_operated:
+        seed_baseline_threats([instance.pk])
@@ -0,0 +1,41 @@
+from django.db import models
+from django.utils import timezone
+
+
+class RiskJob(models.Model):
+    """
+    A unit of background risk recomputation.
+    Jobs are enqueued by views and executed by the risk_worker management command,
+    which claims them with time-limited leases so that a crashed worker's jobs are
+    picked up again once the lease expires.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now,
+        help_text="The job is not claimed before this time (used to back off retries)")
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} - {self.get_status_display()}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 
 from ..models.asset_models import Asset
 from ..models.risk_models import RiskType
+from ..risk_engine.rollups import rollup_risk_logs
 
 
 class RiskLog(models.Model):
@@ -15,4 +18,62 @@ class RiskLog(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Risk Log for {self.asset.name} - {self.risk_type.name} at {self.timestamp}"
\ No newline at end of file
+        return f"Risk Log for {self.asset.name} - {self.risk_type.name} at {self.timestamp}"
+
+    class Meta:
+        indexes = [
+            # Incremental exports
+            models.Index(fields=['timestamp', 'id']),
+        ]
+
+
+class RiskLogRollup(models.Model):
+    """
+    Daily, weekly or monthly summary of the RiskLog rows of an asset and risk type.
+    Maintained incrementally as logs are written (see core.risk_engine.rollups) and
+    rebuilt from scratch by the rebuild_risk_log_rollups command. Weeks start on Monday.
+    """
+    RESOLUTION_CHOICES = [
+        ('DAY', 'Daily'),
+        ('WEEK', 'Weekly'),
+        ('MONTH', 'Monthly'),
+    ]
+
+    asset = models.ForeignKey('core.Asset', on_delete=models.CASCADE, related_name='risk_log_rollups')
+    risk_type = models.ForeignKey('core.RiskType', on_delete=models.CASCADE, related_name='risk_log_rollups')
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    last_timestamp = models.DateTimeField()
+    bta_score_min = models.IntegerField()
+    bta_score_max = models.IntegerField()
+    bta_score_sum = models.IntegerField()
+    bta_score_last = models.IntegerField()
+    vulnerability_score_min = models.IntegerField()
+    vulnerability_score_max = models.IntegerField()
+    vulnerability_score_sum = models.IntegerField()
+    vulnerability_score_last = models.IntegerField()
+    criticality_score_min = models.IntegerField()
+    criticality_score_max = models.IntegerField()
+    criticality_score_sum = models.IntegerField()
+    criticality_score_last = models.IntegerField()
+    residual_risk_score_min = models.IntegerField()
+    residual_risk_score_max = models.IntegerField()
+    residual_risk_score_sum = models.IntegerField()
+    residual_risk_score_last = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.get_resolution_display()} rollup for {self.asset.name} - {self.risk_type.name} from {self.bucket_start}"
+
+    def average(self, metric):
+        """Average of a RiskLog score field over the bucket"""
+        return getattr(self, f'{metric}_sum') / self.count if self.count else None
+
+    class Meta:
+        unique_together = ('asset', 'risk_type', 'resolution', 'bucket_start')
+
+
+@receiver(post_save, sender=RiskLog)
+def update_risk_log_rollups(sender, instance, created, **kwargs):
+    if created:
+        rollup_risk_logs([instance])
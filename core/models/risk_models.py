@@ -1,8 +1,13 @@
 from django.db import models
+from django.db.models import F, FloatField, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from statistics import mean
 from .model_imports import get_country_model, get_asset_model, get_barrier_model
+from ..risk_engine.bulk import load_latest_bta_scores
+from ..risk_engine.catalog import get_catalog
+from ..risk_engine.effectiveness import load_barrier_effectiveness
+from ..risk_engine.scoring import residual_risk_scores
 
 class RiskType(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -50,15 +55,7 @@ class Scenario(models.Model):
 
     def get_applicable_barriers(self):
         """Get all barriers that apply to this scenario's risk types and subtypes"""
-        risk_types = RiskType.objects.filter(subtypes__in=self.risk_subtypes.all()).distinct()
-        
-        # Get barriers that directly affect the risk types
-        type_barriers = self.barriers.filter(risk_types__in=risk_types)
-        
-        # Get barriers that affect specific subtypes
-        subtype_barriers = self.barriers.filter(risk_subtypes__in=self.risk_subtypes.all())
-        
-        return (type_barriers | subtype_barriers).distinct()
+        return get_barrier_model().objects.filter(id__in=get_catalog().applicable_barriers(self.id))
 
 class ScenarioQuestion(models.Model):
     """
@@ -139,71 +136,112 @@ class RiskScenarioAssessment(models.Model):
     def __str__(self):
         return f"{self.asset.name} - {self.scenario.name}"
 
+    # Score field set from the weighted answers of each question type
+    WEIGHTED_SCORE_FIELDS = {
+        'LIKELIHOOD': 'likelihood_score',
+        'IMPACT': 'impact_score',
+        'VULNERABILITY': 'vulnerability_score',
+    }
+
     class Meta:
         unique_together = ('asset', 'scenario', 'assessment_date')
 
     def calculate_scores(self):
         """Calculate likelihood, impact, and vulnerability scores from answers."""
-        answers = AssetScenarioAnswer.objects.filter(asset=self.asset, scenario=self.scenario)
-        
-        likelihood_answers = answers.filter(question__question_type='LIKELIHOOD')
-        impact_answers = answers.filter(question__question_type='IMPACT')
-        vulnerability_answers = answers.filter(question__question_type='VULNERABILITY')
-        
-        self.likelihood_score = self._calculate_weighted_score(likelihood_answers)
-        self.impact_score = self._calculate_weighted_score(impact_answers)
-        self.vulnerability_score = self._calculate_weighted_score(vulnerability_answers)
-        
+        self._calculate_component_scores()
+
         # Calculate residual risk score considering barrier effectiveness
-        base_risk = (self.likelihood_score * self.impact_score * self.vulnerability_score) ** (1/3)
-        
-        # Get all applicable barriers and their effectiveness
-        self.barrier_effectiveness = self._calculate_barrier_effectiveness()
-        
-        if self.barrier_effectiveness:
-            avg_barrier_effectiveness = mean(self.barrier_effectiveness.values())
-            self.residual_risk_score = base_risk / (1 + avg_barrier_effectiveness)
-        else:
-            self.residual_risk_score = base_risk
+        self.residual_risk_score = float(residual_risk_scores(
+            [self.likelihood_score],
+            [self.impact_score],
+            [self.vulnerability_score],
+            [self.barrier_effectiveness],
+        )[0])
 
-    def _calculate_weighted_score(self, answers):
-        """Calculate weighted average score for a set of answers."""
-        if not answers.exists():
-            return 5  # Default middle score
-            
-        total_weight = sum(answer.question.weight for answer in answers)
-        weighted_sum = sum(
-            answer.selected_choice.score * answer.question.weight 
-            for answer in answers
+    @classmethod
+    def calculate_scores_bulk(cls, assessments):
+        """Calculate scores for many assessments in one vectorized pass.
+
+        Sets the same fields as calculate_scores on every assessment, without
+        saving, and returns the assessments as a list.
+        """
+        assessments = list(assessments)
+        weighted_scores = cls.weighted_scores_bulk(
+            (assessment.asset_id, assessment.scenario_id) for assessment in assessments
         )
-        return round(weighted_sum / total_weight, 2)
+        catalog = get_catalog()
+        barrier_scores = load_barrier_effectiveness({
+            barrier_id
+            for scenario_id in {assessment.scenario_id for assessment in assessments}
+            for barrier_id in catalog.applicable_barriers(scenario_id)
+        })
+        for assessment in assessments:
+            assessment._calculate_component_scores(weighted_scores, catalog, barrier_scores)
+
+        residual_scores = residual_risk_scores(
+            [a.likelihood_score for a in assessments],
+            [a.impact_score for a in assessments],
+            [a.vulnerability_score for a in assessments],
+            [a.barrier_effectiveness for a in assessments],
+        )
+        for assessment, residual_score in zip(assessments, residual_scores):
+            assessment.residual_risk_score = float(residual_score)
+        return assessments
 
-    def _calculate_barrier_effectiveness(self):
+    @classmethod
+    def weighted_scores_bulk(cls, pairs):
+        """Weighted likelihood, impact and vulnerability scores for many (asset, scenario) pairs.
+
+        The weighted averages of the answer scores are aggregated per pair and
+        question type in a single query. Returns a dict mapping each pair to
+        its score fields; question types without answers get the default
+        middle score of 5.
+        """
+        pairs = set(pairs)
+        scores = {
+            pair: {field: 5 for field in cls.WEIGHTED_SCORE_FIELDS.values()}
+            for pair in pairs
+        }
+        if not pairs:
+            return scores
+
+        rows = AssetScenarioAnswer.objects.filter(
+            asset_id__in={asset_id for asset_id, _ in pairs},
+            scenario_id__in={scenario_id for _, scenario_id in pairs},
+            question__question_type__in=cls.WEIGHTED_SCORE_FIELDS,
+        ).values('asset_id', 'scenario_id', 'question__question_type').annotate(
+            weighted_sum=Sum(F('selected_choice__score') * F('question__weight'), output_field=FloatField()),
+            total_weight=Sum('question__weight'),
+        ).order_by()
+        for row in rows:
+            pair = (row['asset_id'], row['scenario_id'])
+            if pair in scores:
+                field = cls.WEIGHTED_SCORE_FIELDS[row['question__question_type']]
+                scores[pair][field] = round(row['weighted_sum'] / row['total_weight'], 2)
+        return scores
+
+    def _calculate_component_scores(self, weighted_scores=None, catalog=None, barrier_scores=None):
+        """Calculate the weighted answer scores and barrier effectiveness.
+
+        The optional arguments are loaded once by calculate_scores_bulk for a
+        whole batch of assessments; they are queried when not given.
+        """
+        pair = (self.asset_id, self.scenario_id)
+        if weighted_scores is None:
+            weighted_scores = self.weighted_scores_bulk([pair])
+        for field, score in weighted_scores[pair].items():
+            setattr(self, field, score)
+
+        # Get all applicable barriers and their effectiveness
+        self.barrier_effectiveness = self._calculate_barrier_effectiveness(catalog, barrier_scores)
+
+    def _calculate_barrier_effectiveness(self, catalog=None, barrier_scores=None):
         """Calculate barrier effectiveness considering both risk type and subtype levels"""
-        effectiveness = {}
-        
-        # Get all applicable barriers
-        applicable_barriers = self.scenario.get_applicable_barriers()
-        
-        for barrier in applicable_barriers:
-            barrier_score = 0
-            
-            # Check risk type level effectiveness
-            for risk_type in self.scenario.risk_subtypes.values_list('risk_type', flat=True).distinct():
-                if barrier.risk_types.filter(id=risk_type).exists():
-                    type_score = barrier.get_risk_category_effectiveness_score(risk_type)
-                    barrier_score = max(barrier_score, type_score)
-            
-            # Check risk subtype level effectiveness
-            for subtype in self.scenario.risk_subtypes.all():
-                if barrier.risk_subtypes.filter(id=subtype.id).exists():
-                    subtype_score = barrier.get_risk_category_effectiveness_score(subtype.risk_type)
-                    barrier_score = max(barrier_score, subtype_score)
-            
-            if barrier_score > 0:
-                effectiveness[str(barrier.id)] = barrier_score
-        
-        return effectiveness
+        if catalog is None:
+            catalog = get_catalog()
+        if barrier_scores is None:
+            barrier_scores = load_barrier_effectiveness(catalog.applicable_barriers(self.scenario_id))
+        return catalog.barrier_effectiveness(self.scenario_id, barrier_scores)
 
     def save(self, *args, **kwargs):
         self.calculate_scores()
@@ -225,6 +263,24 @@ class BaselineThreatAssessment(models.Model):
     class Meta:
         unique_together = ('risk_type', 'country', 'date_assessed')
 
+class CurrentBaselineThreat(models.Model):
+    """
+    Most recent baseline threat assessment of a country for a risk type.
+    A projection of BaselineThreatAssessment maintained by core.risk_engine.baseline;
+    read it instead of looking up the latest date_assessed per pair.
+    """
+    country = models.ForeignKey('Country', on_delete=models.CASCADE, related_name='current_baseline_threats')
+    risk_type = models.ForeignKey(RiskType, on_delete=models.CASCADE, related_name='current_baseline_threats')
+    assessment = models.ForeignKey(BaselineThreatAssessment, on_delete=models.CASCADE, related_name='+')
+    baseline_score = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
+    date_assessed = models.DateField()
+
+    def __str__(self):
+        return f"{self.country.name} - {self.risk_type.name} - {self.baseline_score} (current)"
+
+    class Meta:
+        unique_together = ('country', 'risk_type')
+
 class FinalRiskMatrix(models.Model):
     RISK_LEVELS = [
         ('LOW', 'Low'),
@@ -240,40 +296,46 @@ class FinalRiskMatrix(models.Model):
     sub_risk_details = models.JSONField(null=True, blank=True)
     barrier_details = models.JSONField(null=True, blank=True)
     date_generated = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.asset.name} - {self.risk_type.name} - {self.risk_level}"
 
     class Meta:
         unique_together = ('asset', 'risk_type', 'date_generated')
+        indexes = [
+            # Risk level filter of asset listings
+            models.Index(fields=['risk_level', 'asset']),
+            # Incremental exports
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     @classmethod
     def generate_matrices(cls, asset):
         """Generate risk matrices for an asset based on scenario assessments."""
-        risk_types = RiskType.objects.filter(
-            subtypes__scenarios__assessments__asset=asset
-        ).distinct()
-        
-        for risk_type in risk_types:
-            # Get all scenario assessments for this risk type
-            assessments = RiskScenarioAssessment.objects.filter(
-                asset=asset,
-                scenario__risk_subtypes__risk_type=risk_type
-            )
-            
-            if assessments.exists():
+        barriers = list(asset.barriers.prefetch_related('risk_effectiveness'))
+
+        # Group the asset's scenario assessments per risk type
+        scenario_risk_types = get_catalog().scenario_risk_types
+        risk_type_assessments = {}
+        for assessment in asset.risk_scenario_assessments.select_related('scenario').order_by('id'):
+            for risk_type_id in scenario_risk_types.get(assessment.scenario_id, []):
+                risk_type_assessments.setdefault(risk_type_id, []).append(assessment)
+        risk_types = RiskType.objects.in_bulk(risk_type_assessments)
+        bta_scores = load_latest_bta_scores([asset.country_id])
+
+        for risk_type_id, assessments in risk_type_assessments.items():
+            risk_type = risk_types[risk_type_id]
+            if assessments:
                 # Calculate average residual risk score
                 avg_residual_risk = mean([a.residual_risk_score for a in assessments])
                 
                 # Get BTA score if available
-                bta = BaselineThreatAssessment.objects.filter(
-                    risk_type=risk_type,
-                    country=asset.country
-                ).order_by('-date_assessed').first()
+                bta_score = bta_scores.get((asset.country_id, risk_type_id))
                 
-                if bta:
+                if bta_score is not None:
                     # Combine scenario-based risk with BTA
-                    final_score = (avg_residual_risk + bta.baseline_score) / 2
+                    final_score = (avg_residual_risk + bta_score) / 2
                 else:
                     final_score = avg_residual_risk
                 
@@ -294,15 +356,26 @@ class FinalRiskMatrix(models.Model):
                                     'residual_risk': a.residual_risk_score,
                                 } for a in assessments
                             ],
-                            'bta_score': bta.baseline_score if bta else None
+                            'bta_score': bta_score
                         },
                         'barrier_details': {
                             barrier.name: barrier.get_risk_category_effectiveness_score(risk_type)
-                            for barrier in asset.barriers.all()
+                            for barrier in barriers
                         }
                     }
                 )
 
+    @classmethod
+    def generate_matrices_bulk(cls, assets, batch_size=500):
+        """Generate risk matrices for many assets with set-based queries.
+
+        Produces the same cells as generate_matrices but loads assessments,
+        latest BTAs and barrier scores once per batch of assets and writes the
+        results with bulk updates and inserts.
+        """
+        from ..risk_engine.bulk import generate_matrices_bulk
+        return generate_matrices_bulk(assets, batch_size=batch_size)
+
     @staticmethod
     def calculate_risk_level(score):
         if score <= 3:
@@ -313,3 +386,54 @@ class FinalRiskMatrix(models.Model):
             return 'HIGH'
         else:
             return 'CRITICAL'
+
+class ResidualRiskDistribution(models.Model):
+    """
+    Monte Carlo distribution of the final residual risk of an asset for a risk type.
+    Complements the point estimate of FinalRiskMatrix; rebuilt by the
+    simulate_risk_distributions command.
+    """
+    asset = models.ForeignKey('Asset', on_delete=models.CASCADE, related_name='risk_distributions')
+    risk_type = models.ForeignKey(RiskType, on_delete=models.CASCADE, related_name='risk_distributions')
+    draws = models.PositiveIntegerField()
+    seed = models.BigIntegerField(null=True, blank=True)
+    mean = models.FloatField()
+    p5 = models.FloatField()
+    p50 = models.FloatField()
+    p95 = models.FloatField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.asset.name} - {self.risk_type.name} - p50 {self.p50:.2f}"
+
+    class Meta:
+        unique_together = ('asset', 'risk_type')
+
+
+def recompute_scenario_answer_dependents(sender, instance, **kwargs):
+    """Recompute the assessment and matrix cells fed by a changed scenario answer"""
+    from ..risk_engine.dependencies import invalidate_scenario_answers
+    from ..risk_engine.recompute import schedule_invalidation
+    from ..risk_engine.suspension import defer, is_suspended
+    pair = (instance.asset_id, instance.scenario_id)
+    if is_suspended():
+        defer('scenario_answers', [pair])
+    else:
+        schedule_invalidation(invalidate_scenario_answers([pair]))
+
+def recompute_deleted_scenario_answer_dependents(sender, instance, origin=None, **kwargs):
+    """Same as above, unless the answer goes away with its asset, scenario or question"""
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is AssetScenarioAnswer:
+        recompute_scenario_answer_dependents(sender, instance, **kwargs)
+
+models.signals.post_save.connect(recompute_scenario_answer_dependents, sender=AssetScenarioAnswer)
+models.signals.post_delete.connect(recompute_deleted_scenario_answer_dependents, sender=AssetScenarioAnswer)
+
+def refresh_current_baseline_threat(sender, instance, **kwargs):
+    """Keep the current BTA of the assessment's country and risk type up to date"""
+    from ..risk_engine.baseline import refresh_current_baseline_threats
+    refresh_current_baseline_threats([(instance.country_id, instance.risk_type_id)])
+
+models.signals.post_save.connect(refresh_current_baseline_threat, sender=BaselineThreatAssessment)
+models.signals.post_delete.connect(refresh_current_baseline_threat, sender=BaselineThreatAssessment)
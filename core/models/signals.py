@@ -10,27 +10,26 @@ from .model_imports import (
     get_barrier_issue_report_model,
     get_asset_model
 )
+from ..risk_engine.recompute import mark_assets_dirty, mark_matrices_dirty
+from ..risk_engine.seeding import seed_baseline_threats
+from ..risk_engine.suspension import defer, is_suspended
 
 @receiver(post_save, sender=get_risk_type_model())
 def create_bta_for_risk_type(sender, instance, created, **kwargs):
-    if created:
-        Country = get_country_model()
-        BaselineThreatAssessment = get_baseline_threat_assessment_model()
-        countries = Country.objects.filter(company_operated=True)
-        for country in countries:
-            BaselineThreatAssessment.objects.get_or_create(
-                risk_type=instance,
-                country=country,
-                defaults={
-                    'baseline_score': 5,
-                    'impact_on_assets': True,
-                    'notes': 'Automatically created for new risk type.',
-                }
-            )
+    if created and is_suspended():
+        defer('baseline_threats', get_country_model().objects.filter(
+            company_operated=True
+        ).values_list('id', flat=True))
+    elif created:
+        seed_baseline_threats(
+            get_country_model().objects.filter(company_operated=True).values_list('id', flat=True),
+            risk_type_ids=[instance.pk],
+            notes='Automatically created for new risk type.',
+        )
 
 @receiver(post_save, sender=get_final_risk_matrix_model())
 def create_risk_log(sender, instance, created, **kwargs):
-    if created:
+    if created and not is_suspended():
         RiskLog = get_risk_log_model()
         BaselineThreatAssessment = get_baseline_threat_assessment_model()
         RiskLog.objects.create(
@@ -44,23 +43,17 @@ def create_risk_log(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=get_asset_model())
 def update_risk_matrices_for_asset(sender, instance, created, **kwargs):
-    FinalRiskMatrix = get_final_risk_matrix_model()
-    FinalRiskMatrix.generate_matrices(instance)
+    mark_assets_dirty([instance.pk])
 
 @receiver(post_save, sender=get_risk_scenario_assessment_model())
 def update_risk_matrices_for_scenario(sender, instance, created, **kwargs):
-    FinalRiskMatrix = get_final_risk_matrix_model()
-    FinalRiskMatrix.generate_matrices(instance.asset)
+    mark_matrices_dirty([instance.asset_id])
 
 @receiver(post_save, sender=get_barrier_issue_report_model())
 def update_barrier_effectiveness(sender, instance, **kwargs):
     instance.barrier.adjust_performance(instance.impact_rating)
     
     if instance.status == 'RESOLVED':
-        instance.barrier.update_overall_effectiveness()
-        instance.barrier.propagate_effectiveness()
-        
-        # Update linked assets
-        for asset_link in instance.barrier.asset_links.all():
-            for asset in asset_link.assets.all():
-                asset.update_risk_assessment_based_on_link()
\ No newline at end of file
+        # The assets linked through this barrier are updated by the recompute job
+        # queued for the resolution, after the assessments depending on it
+        instance.barrier.update_overall_effectiveness()
\ No newline at end of file
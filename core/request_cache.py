@@ -0,0 +1,41 @@
+"""
+Request-scoped ORM cache.
+
+Views look up the rows named in their URL with get_cached_object(). Inside a
+request_scope() block, such as the one /api/batch/ runs its sub-requests in,
+the row is fetched once and shared by every lookup of the block, so the
+sub-requests of an asset page read the asset once instead of once each.
+Outside a scope it is plain get_object_or_404.
+
+Scopes are for read-only work: rows saved inside one are not refreshed, and
+lookups that raised Http404 are not cached.
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+from django.shortcuts import get_object_or_404
+
+_scope = contextvars.ContextVar('request_cache', default=None)
+
+
+@contextmanager
+def request_scope():
+    """Share single-row lookups between the views called in the block."""
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def get_cached_object(model, **lookup):
+    """get_object_or_404, memoized for the current request scope."""
+    cache = _scope.get()
+    if cache is None:
+        return get_object_or_404(model, **lookup)
+    # URL arguments are ints, query parameters strings; both name the same row
+    key = (model, tuple(sorted((name, str(value)) for name, value in lookup.items())))
+    if key not in cache:
+        cache[key] = get_object_or_404(model, **lookup)
+    return cache[key]
@@ -0,0 +1,22 @@
+"""
+Set-based risk computation engine.
+
+The helpers in this package load risk inputs for many assets in a fixed number
+of queries and compute derived data in memory. They complement the per-instance
+methods on the models, which remain the reference implementation.
+"""
+
+from .bulk import generate_matrices_bulk
+from .assessments import recompute_assessments
+from .scoring import residual_risk_scores
+from .recompute import coalesced, mark_assets_dirty
+from .suspension import suspended
+
+__all__ = [
+    'coalesced',
+    'generate_matrices_bulk',
+    'mark_assets_dirty',
+    'recompute_assessments',
+    'residual_risk_scores',
+    'suspended',
+]
@@ -0,0 +1,75 @@
+"""
+Bulk recomputation of Risk Scenario Assessments.
+
+Recalculates scores for many assessments with the vectorized residual-risk
+kernel and writes them back with bulk_update, bypassing the per-row save().
+Missing assessments for the scenarios assigned to assets are created with
+bulk_create.
+"""
+
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .bulk import DEFAULT_BATCH_SIZE, chunked
+
+SCORE_FIELDS = [
+    'likelihood_score', 'impact_score', 'vulnerability_score',
+    'barrier_effectiveness', 'residual_risk_score', 'updated_at',
+]
+
+
+def recompute_assessments(assessments, batch_size=DEFAULT_BATCH_SIZE):
+    """Recalculate and store the scores of the given assessments.
+
+    ``assessments`` may be a queryset or a list of assessments. Returns the
+    number of assessments updated.
+    """
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    if isinstance(assessments, QuerySet):
+        assessments = assessments.select_related('asset', 'scenario').order_by('id')
+
+    updated = 0
+    for batch in chunked(assessments, batch_size):
+        RiskScenarioAssessment.calculate_scores_bulk(batch)
+        now = timezone.now()
+        for assessment in batch:
+            assessment.updated_at = now
+        with transaction.atomic():
+            RiskScenarioAssessment.objects.bulk_update(batch, SCORE_FIELDS)
+            invalidate_model(RiskScenarioAssessment, Asset={assessment.asset_id for assessment in batch})
+        updated += len(batch)
+    return updated
+
+
+def create_missing_assessments(asset_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Create an assessment for every scenario assigned to the assets that lacks one.
+
+    The new assessments hold placeholder scores; pass them to
+    recompute_assessments to score them. Returns the created assessments.
+    """
+    Asset = get_model('core', 'Asset')
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    asset_ids = list(asset_ids)
+
+    assigned = Asset.scenarios.through.objects.filter(
+        asset_id__in=asset_ids
+    ).order_by('id').values_list('asset_id', 'scenario_id')
+    existing = set(
+        RiskScenarioAssessment.objects.filter(
+            asset_id__in=asset_ids
+        ).values_list('asset_id', 'scenario_id')
+    )
+    missing = [
+        RiskScenarioAssessment(
+            asset_id=asset_id, scenario_id=scenario_id, barrier_effectiveness={},
+            likelihood_score=1, impact_score=1, vulnerability_score=1, residual_risk_score=1,
+        )
+        for asset_id, scenario_id in assigned
+        if (asset_id, scenario_id) not in existing
+    ]
+    created = RiskScenarioAssessment.objects.bulk_create(missing, batch_size=batch_size)
+    invalidate_model(RiskScenarioAssessment, Asset={assessment.asset_id for assessment in missing})
+    return created
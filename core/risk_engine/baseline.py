@@ -0,0 +1,61 @@
+"""
+Current baseline threat projection.
+
+CurrentBaselineThreat holds one row per (country, risk type): the score and
+date of its most recent BaselineThreatAssessment. It replaces the
+latest-date subqueries consumers used to run per pair, so all current scores
+of a set of countries come from one query on the (country, risk type) index.
+
+The projection is refreshed for the affected pairs whenever an assessment is
+saved or deleted (see the receivers in risk_models) and after bulk seeding.
+Lookups as of an earlier date read the assessments themselves.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .bulk import DEFAULT_BATCH_SIZE
+
+
+def refresh_current_baseline_threats(pairs, batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute the current BTA of the given (country id, risk type id) pairs.
+
+    Returns the number of pairs with a current assessment.
+    """
+    BaselineThreatAssessment = get_model('core', 'BaselineThreatAssessment')
+    CurrentBaselineThreat = get_model('core', 'CurrentBaselineThreat')
+    pairs = set(pairs)
+    if not pairs:
+        return 0
+
+    latest = {}
+    for assessment_id, country_id, risk_type_id, baseline_score, date_assessed in (
+        BaselineThreatAssessment.objects.filter(
+            country_id__in={country_id for country_id, _ in pairs},
+            risk_type_id__in={risk_type_id for _, risk_type_id in pairs},
+        ).order_by('country_id', 'risk_type_id', '-date_assessed').values_list(
+            'id', 'country_id', 'risk_type_id', 'baseline_score', 'date_assessed'
+        )
+    ):
+        if (country_id, risk_type_id) in pairs:
+            latest.setdefault((country_id, risk_type_id), CurrentBaselineThreat(
+                country_id=country_id, risk_type_id=risk_type_id, assessment_id=assessment_id,
+                baseline_score=baseline_score, date_assessed=date_assessed,
+            ))
+
+    with transaction.atomic():
+        stale = pairs - set(latest)
+        if stale:
+            condition = Q()
+            for country_id, risk_type_id in stale:
+                condition |= Q(country_id=country_id, risk_type_id=risk_type_id)
+            CurrentBaselineThreat.objects.filter(condition).delete()
+        CurrentBaselineThreat.objects.bulk_create(
+            latest.values(), batch_size=batch_size, update_conflicts=True,
+            unique_fields=['country', 'risk_type'],
+            update_fields=['assessment', 'baseline_score', 'date_assessed'],
+        )
+        invalidate_model(CurrentBaselineThreat, Country={country_id for country_id, _ in pairs})
+    return len(latest)
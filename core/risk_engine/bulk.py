@@ -0,0 +1,194 @@
+"""
+Bulk Final Risk Matrix generation.
+
+Computes every (asset, risk type) cell for a set of assets from a fixed number
+of queries per batch and writes the results with bulk updates and inserts.
+The cells are identical to the ones produced by FinalRiskMatrix.generate_matrices.
+"""
+
+from collections import defaultdict
+from statistics import mean
+
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .catalog import get_catalog
+from .effectiveness import load_barrier_effectiveness
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def chunked(items, size):
+    """Yield successive lists of at most ``size`` items."""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _asset_ids(assets):
+    if isinstance(assets, QuerySet):
+        return list(assets.order_by('id').values_list('id', flat=True))
+    return [getattr(asset, 'pk', asset) for asset in assets]
+
+
+def load_scenario_risk_types(scenario_ids):
+    """Map scenario id to the risk type id of each of its subtypes.
+
+    A risk type appears once per subtype, matching the row multiplicity of the
+    ``scenario__risk_subtypes__risk_type`` join used by generate_matrices.
+    """
+    scenario_risk_types = get_catalog().scenario_risk_types
+    return {
+        scenario_id: scenario_risk_types[scenario_id]
+        for scenario_id in scenario_ids
+        if scenario_id in scenario_risk_types
+    }
+
+
+def load_latest_bta_scores(country_ids, as_of=None):
+    """Map (country id, risk type id) to the most recent baseline score.
+
+    Reads the CurrentBaselineThreat projection. With ``as_of``, returns the
+    most recent score assessed on or before that date instead.
+    """
+    if as_of is None:
+        CurrentBaselineThreat = get_model('core', 'CurrentBaselineThreat')
+        return {
+            (country_id, risk_type_id): baseline_score
+            for country_id, risk_type_id, baseline_score in CurrentBaselineThreat.objects.filter(
+                country_id__in=country_ids
+            ).values_list('country_id', 'risk_type_id', 'baseline_score')
+        }
+
+    BaselineThreatAssessment = get_model('core', 'BaselineThreatAssessment')
+    scores = {}
+    rows = BaselineThreatAssessment.objects.filter(
+        country_id__in=country_ids, date_assessed__lte=as_of
+    ).order_by('country_id', 'risk_type_id', '-date_assessed').values_list(
+        'country_id', 'risk_type_id', 'baseline_score'
+    )
+    for country_id, risk_type_id, baseline_score in rows:
+        scores.setdefault((country_id, risk_type_id), baseline_score)
+    return scores
+
+
+def generate_matrices_bulk(assets, batch_size=DEFAULT_BATCH_SIZE, cells=None):
+    """Generate Final Risk Matrices for many assets.
+
+    ``assets`` may be a queryset, a list of assets or a list of asset ids.
+    ``cells`` optionally restricts the write to a set of (asset id, risk type
+    id) pairs; other cells of the same assets are left untouched.
+    Returns a dict with the number of matrices created and updated.
+    """
+    stats = {'created': 0, 'updated': 0}
+    for asset_ids in chunked(_asset_ids(assets), batch_size):
+        created, updated = _generate_batch(asset_ids, cells)
+        stats['created'] += created
+        stats['updated'] += updated
+    return stats
+
+
+def _generate_batch(asset_ids, only_cells=None):
+    Asset = get_model('core', 'Asset')
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    FinalRiskMatrix = get_model('core', 'FinalRiskMatrix')
+
+    asset_countries = dict(
+        Asset.objects.filter(id__in=asset_ids).values_list('id', 'country_id')
+    )
+    assessments = list(
+        RiskScenarioAssessment.objects.filter(asset_id__in=asset_ids).order_by('id').values(
+            'asset_id', 'scenario_id', 'scenario__name', 'likelihood_score',
+            'impact_score', 'vulnerability_score', 'residual_risk_score',
+        )
+    )
+    scenario_risk_types = load_scenario_risk_types(
+        {a['scenario_id'] for a in assessments}
+    )
+    bta_scores = load_latest_bta_scores(set(asset_countries.values()))
+
+    asset_barriers = defaultdict(list)
+    rows = Asset.barriers.through.objects.filter(
+        asset_id__in=asset_ids
+    ).order_by('id').values_list('asset_id', 'barrier_id', 'barrier__name')
+    for asset_id, barrier_id, barrier_name in rows:
+        asset_barriers[asset_id].append((barrier_id, barrier_name))
+    barrier_scores = load_barrier_effectiveness(
+        {barrier_id for barriers in asset_barriers.values() for barrier_id, _ in barriers}
+    )
+
+    existing = defaultdict(list)
+    rows = FinalRiskMatrix.objects.filter(asset_id__in=asset_ids).values_list(
+        'id', 'asset_id', 'risk_type_id'
+    )
+    for matrix_id, asset_id, risk_type_id in rows:
+        existing[(asset_id, risk_type_id)].append(matrix_id)
+
+    # Group assessments per (asset, risk type) cell
+    cells = defaultdict(list)
+    for assessment in assessments:
+        for risk_type_id in scenario_risk_types.get(assessment['scenario_id'], []):
+            cells[(assessment['asset_id'], risk_type_id)].append(assessment)
+
+    to_create = []
+    to_update = []
+    # bulk_update does not apply auto_now
+    now = timezone.now()
+    for (asset_id, risk_type_id), cell_assessments in cells.items():
+        if only_cells is not None and (asset_id, risk_type_id) not in only_cells:
+            continue
+        avg_residual_risk = mean([a['residual_risk_score'] for a in cell_assessments])
+        bta_score = bta_scores.get((asset_countries[asset_id], risk_type_id))
+        if bta_score is not None:
+            final_score = (avg_residual_risk + bta_score) / 2
+        else:
+            final_score = avg_residual_risk
+
+        values = {
+            'updated_at': now,
+            'residual_risk_score': final_score,
+            'risk_level': FinalRiskMatrix.calculate_risk_level(final_score),
+            'sub_risk_details': {
+                'scenario_assessments': [
+                    {
+                        'scenario': a['scenario__name'],
+                        'likelihood': a['likelihood_score'],
+                        'impact': a['impact_score'],
+                        'vulnerability': a['vulnerability_score'],
+                        'residual_risk': a['residual_risk_score'],
+                    } for a in cell_assessments
+                ],
+                'bta_score': bta_score,
+            },
+            'barrier_details': {
+                barrier_name: barrier_scores.get((barrier_id, risk_type_id), 0)
+                for barrier_id, barrier_name in asset_barriers[asset_id]
+            },
+        }
+
+        matrix_ids = existing.get((asset_id, risk_type_id))
+        if matrix_ids:
+            to_update.extend(
+                FinalRiskMatrix(id=matrix_id, asset_id=asset_id, risk_type_id=risk_type_id, **values)
+                for matrix_id in matrix_ids
+            )
+        else:
+            to_create.append(
+                FinalRiskMatrix(asset_id=asset_id, risk_type_id=risk_type_id, **values)
+            )
+
+    with transaction.atomic():
+        if to_update:
+            FinalRiskMatrix.objects.bulk_update(
+                to_update,
+                ['residual_risk_score', 'risk_level', 'sub_risk_details', 'barrier_details', 'updated_at'],
+                batch_size=DEFAULT_BATCH_SIZE,
+            )
+        if to_create:
+            FinalRiskMatrix.objects.bulk_create(to_create, batch_size=DEFAULT_BATCH_SIZE)
+        invalidate_model(FinalRiskMatrix, Asset={matrix.asset_id for matrix in to_create + to_update})
+
+    return len(to_create), len(to_update)
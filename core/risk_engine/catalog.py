@@ -0,0 +1,179 @@
+"""
+In-memory index of the scenario and barrier taxonomy.
+
+Scoring needs, for every scenario, its subtypes, the risk types of those
+subtypes and the barriers that apply to it. Deriving them with joins on every
+assessment and matrix cell dominated recompute profiles, so they are loaded
+once into a ScenarioCatalog and reused until the taxonomy changes.
+
+Within a process, the m2m_changed, post_save and post_delete receivers at
+the bottom of this module drop the catalog right away. Changes made by other
+processes, such as the web server and the risk_worker pool, are caught by a
+fingerprint of the tables the catalog is built from (row count and highest
+id of the m2m tables, count and last update of risk subtypes), re-read at
+most every CATALOG_RECHECK_SECONDS, so lookups do not query the database.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from ..models.model_imports import get_model
+
+# Seconds a catalog is used before its fingerprint is checked again
+CATALOG_RECHECK_SECONDS = 5
+
+_lock = threading.Lock()
+_catalog = None
+
+
+class ScenarioCatalog:
+    """Scenario to subtype, risk type and barrier lookups for one taxonomy version."""
+
+    def __init__(self, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+        # Ordered by link id, like the scenario__risk_subtypes joins they replace
+        self.scenario_subtypes = defaultdict(list)
+        self.scenario_risk_types = defaultdict(list)
+        self.scenario_barriers = defaultdict(list)
+        self.barrier_risk_types = defaultdict(set)
+        self.barrier_subtypes = defaultdict(set)
+        self.subtype_risk_types = {}
+        self._applicable = {}
+
+    @classmethod
+    def load(cls, version):
+        Scenario = get_model('core', 'Scenario')
+        Barrier = get_model('core', 'Barrier')
+        RiskSubtype = get_model('core', 'RiskSubtype')
+
+        catalog = cls(version)
+        catalog.subtype_risk_types = dict(RiskSubtype.objects.values_list('id', 'risk_type_id'))
+        rows = Scenario.risk_subtypes.through.objects.order_by('id').values_list(
+            'scenario_id', 'risksubtype_id'
+        )
+        for scenario_id, subtype_id in rows:
+            catalog.scenario_subtypes[scenario_id].append(subtype_id)
+            catalog.scenario_risk_types[scenario_id].append(catalog.subtype_risk_types[subtype_id])
+        rows = Scenario.barriers.through.objects.order_by('id').values_list('scenario_id', 'barrier_id')
+        for scenario_id, barrier_id in rows:
+            catalog.scenario_barriers[scenario_id].append(barrier_id)
+        for barrier_id, risk_type_id in Barrier.risk_types.through.objects.values_list(
+            'barrier_id', 'risktype_id'
+        ):
+            catalog.barrier_risk_types[barrier_id].add(risk_type_id)
+        for barrier_id, subtype_id in Barrier.risk_subtypes.through.objects.values_list(
+            'barrier_id', 'risksubtype_id'
+        ):
+            catalog.barrier_subtypes[barrier_id].add(subtype_id)
+        return catalog
+
+    def applicable_barriers(self, scenario_id):
+        """Ids of the scenario's barriers that cover one of its risk types or subtypes.
+
+        Same result as Scenario.get_applicable_barriers, in link order.
+        """
+        if scenario_id not in self._applicable:
+            subtype_ids = set(self.scenario_subtypes.get(scenario_id, ()))
+            risk_type_ids = set(self.scenario_risk_types.get(scenario_id, ()))
+            self._applicable[scenario_id] = [
+                barrier_id
+                for barrier_id in dict.fromkeys(self.scenario_barriers.get(scenario_id, ()))
+                if self.barrier_risk_types[barrier_id] & risk_type_ids
+                or self.barrier_subtypes[barrier_id] & subtype_ids
+            ]
+        return self._applicable[scenario_id]
+
+    def barrier_coverage(self, scenario_id):
+        """(barrier id, risk type ids) of each applicable barrier of the scenario.
+
+        A barrier counts through the scenario risk types it covers directly and
+        through the risk types of the scenario subtypes it covers.
+        """
+        subtype_ids = set(self.scenario_subtypes.get(scenario_id, ()))
+        risk_type_ids = set(self.scenario_risk_types.get(scenario_id, ()))
+        coverage = []
+        for barrier_id in self.applicable_barriers(scenario_id):
+            covered = self.barrier_risk_types[barrier_id] & risk_type_ids
+            covered |= {
+                self.subtype_risk_types[subtype_id]
+                for subtype_id in self.barrier_subtypes[barrier_id] & subtype_ids
+            }
+            coverage.append((barrier_id, covered))
+        return coverage
+
+    def barrier_effectiveness(self, scenario_id, barrier_scores):
+        """Effectiveness of each applicable barrier for the scenario's risk types.
+
+        ``barrier_scores`` maps (barrier id, risk type id) to the materialized
+        effectiveness score, as returned by load_barrier_effectiveness. Returns
+        the dict stored on RiskScenarioAssessment.barrier_effectiveness.
+        """
+        effectiveness = {}
+        for barrier_id, covered in self.barrier_coverage(scenario_id):
+            barrier_score = max(
+                (barrier_scores.get((barrier_id, risk_type_id), 0) for risk_type_id in covered),
+                default=0,
+            )
+            if barrier_score > 0:
+                effectiveness[str(barrier_id)] = barrier_score
+        return effectiveness
+
+
+def _fingerprint():
+    Scenario = get_model('core', 'Scenario')
+    Barrier = get_model('core', 'Barrier')
+    RiskSubtype = get_model('core', 'RiskSubtype')
+
+    quote = connection.ops.quote_name
+    columns = []
+    for model in [
+        Scenario.risk_subtypes.through, Scenario.barriers.through,
+        Barrier.risk_types.through, Barrier.risk_subtypes.through,
+    ]:
+        table = quote(model._meta.db_table)
+        columns += [f'(SELECT COUNT(*) FROM {table})', f'(SELECT MAX(id) FROM {table})']
+    table = quote(RiskSubtype._meta.db_table)
+    columns += [f'(SELECT COUNT(*) FROM {table})', f'(SELECT MAX(updated_at) FROM {table})']
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)}")
+        return tuple(cursor.fetchone())
+
+
+def get_catalog():
+    """Return the catalog for the current taxonomy, rebuilding it if it changed."""
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - catalog.checked_at < CATALOG_RECHECK_SECONDS:
+        return catalog
+
+    version = _fingerprint()
+    if catalog is not None and catalog.version == version:
+        catalog.checked_at = time.monotonic()
+        return catalog
+    catalog = ScenarioCatalog.load(version)
+    with _lock:
+        _catalog = catalog
+    return catalog
+
+
+def invalidate_catalog(**kwargs):
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+# Senders are lazy model labels since the models are still loading when this
+# module is imported
+for sender in [
+    'core.Scenario_risk_subtypes', 'core.Scenario_barriers',
+    'core.Barrier_risk_types', 'core.Barrier_risk_subtypes',
+]:
+    m2m_changed.connect(invalidate_catalog, sender=sender)
+post_save.connect(invalidate_catalog, sender='core.RiskSubtype')
+for sender in ['core.Scenario', 'core.Barrier', 'core.RiskSubtype', 'core.RiskType']:
+    post_delete.connect(invalidate_catalog, sender=sender)
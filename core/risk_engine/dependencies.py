@@ -0,0 +1,183 @@
+"""
+Dependency tracking for incremental risk recomputation.
+
+Maps each changed input to the Risk Scenario Assessments and Final Risk Matrix
+cells, i.e. (asset id, risk type id) pairs, that are derived from it:
+
+- Baseline threat (country, risk type): the matrix cells of that risk type for
+  every asset in the country. No assessment depends on a BTA.
+- Barrier effectiveness or performance: the assessments of every scenario the
+  barrier is attached to, the cells those assessments feed, and the cells of
+  every asset holding the barrier (their barrier_details).
+- Scenario answer (asset, scenario): the assessment of that pair and the cells
+  of the scenario's risk types for that asset.
+
+Only the returned assessments and cells need to be recomputed. Counters of how
+much each kind of change invalidated are kept per process and exposed through
+get_invalidation_stats.
+"""
+
+import threading
+from collections import defaultdict
+
+from ..models.model_imports import get_model
+from .assessments import recompute_assessments
+from .bulk import generate_matrices_bulk, load_scenario_risk_types
+
+BASELINE_THREAT = 'baseline_threat'
+BARRIER_EFFECTIVENESS = 'barrier_effectiveness'
+BARRIER_PERFORMANCE = 'barrier_performance'
+SCENARIO_ANSWER = 'scenario_answer'
+
+CHANGE_KINDS = [BASELINE_THREAT, BARRIER_EFFECTIVENESS, BARRIER_PERFORMANCE, SCENARIO_ANSWER]
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+class Invalidation:
+    """The assessments and matrix cells invalidated by one or more changes."""
+
+    def __init__(self, kind, assessment_ids=(), cells=()):
+        self.kind = kind
+        self.assessment_ids = set(assessment_ids)
+        self.cells = set(cells)
+
+    def __repr__(self):
+        return (f"<Invalidation {self.kind}: {len(self.assessment_ids)} assessments, "
+                f"{len(self.cells)} cells>")
+
+    def merge(self, other):
+        """Add the assessments and cells of another invalidation to this one."""
+        self.assessment_ids |= other.assessment_ids
+        self.cells |= other.cells
+        return self
+
+    @property
+    def asset_ids(self):
+        return {asset_id for asset_id, _ in self.cells}
+
+
+def _asset_cells(asset_filter, risk_type_ids=None):
+    """Return the existing matrix cells of the assets matching ``asset_filter``.
+
+    A cell exists for every risk type reached through the subtypes of a
+    scenario the asset has an assessment for.
+    """
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    rows = RiskScenarioAssessment.objects.filter(**asset_filter)
+    if risk_type_ids is not None:
+        rows = rows.filter(scenario__risk_subtypes__risk_type_id__in=risk_type_ids)
+    return set(rows.values_list('asset_id', 'scenario__risk_subtypes__risk_type_id').distinct())
+
+
+def _assessment_cells(rows):
+    """Return the assessment ids and fed cells of (id, asset id, scenario id) rows."""
+    rows = list(rows)
+    scenario_risk_types = load_scenario_risk_types({scenario_id for _, _, scenario_id in rows})
+    cells = {
+        (asset_id, risk_type_id)
+        for _, asset_id, scenario_id in rows
+        for risk_type_id in scenario_risk_types.get(scenario_id, [])
+    }
+    return {assessment_id for assessment_id, _, _ in rows}, cells
+
+
+def invalidate_baseline_threat(country_id, risk_type_ids):
+    """Cells affected by new baseline threat scores for a country."""
+    cells = _asset_cells({'asset__country_id': country_id}, risk_type_ids)
+    return _record(Invalidation(BASELINE_THREAT, cells=cells))
+
+
+def invalidate_barriers(barrier_ids, kind=BARRIER_EFFECTIVENESS, risk_type_ids=None):
+    """Assessments and cells affected by changed barrier effectiveness.
+
+    ``risk_type_ids`` restricts the change to scores of those risk types; a
+    performance adjustment affects every risk type and leaves it as None.
+    """
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    Asset = get_model('core', 'Asset')
+    barrier_ids = list(barrier_ids)
+
+    assessments = RiskScenarioAssessment.objects.filter(scenario__barriers__in=barrier_ids)
+    if risk_type_ids is not None:
+        assessments = assessments.filter(scenario__risk_subtypes__risk_type_id__in=risk_type_ids)
+    assessment_ids, cells = _assessment_cells(
+        assessments.values_list('id', 'asset_id', 'scenario_id').distinct()
+    )
+
+    holder_ids = set(
+        Asset.barriers.through.objects.filter(
+            barrier_id__in=barrier_ids
+        ).values_list('asset_id', flat=True)
+    )
+    if holder_ids:
+        cells |= _asset_cells({'asset_id__in': holder_ids}, risk_type_ids)
+
+    return _record(Invalidation(kind, assessment_ids, cells))
+
+
+def invalidate_scenario_answers(pairs):
+    """Assessments and cells affected by answers for (asset id, scenario id) pairs."""
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    pairs = set(pairs)
+    rows = RiskScenarioAssessment.objects.filter(
+        asset_id__in={asset_id for asset_id, _ in pairs},
+        scenario_id__in={scenario_id for _, scenario_id in pairs},
+    ).values_list('id', 'asset_id', 'scenario_id')
+    assessment_ids, cells = _assessment_cells(
+        row for row in rows if (row[1], row[2]) in pairs
+    )
+    return _record(Invalidation(SCENARIO_ANSWER, assessment_ids, cells))
+
+
+def invalidate_change(kind, **change):
+    """Invalidation of one change, given its kind and the keys of the changed input.
+
+    The keys are the arguments of the matching invalidate_* function:
+    ``country_id`` and ``risk_type_ids`` for a baseline threat, ``barrier_ids``
+    and optionally ``risk_type_ids`` for barrier effectiveness or performance,
+    ``pairs`` for scenario answers.
+    """
+    if kind == BASELINE_THREAT:
+        return invalidate_baseline_threat(change['country_id'], change['risk_type_ids'])
+    if kind in (BARRIER_EFFECTIVENESS, BARRIER_PERFORMANCE):
+        return invalidate_barriers(change['barrier_ids'], kind=kind, risk_type_ids=change.get('risk_type_ids'))
+    if kind == SCENARIO_ANSWER:
+        return invalidate_scenario_answers(tuple(pair) for pair in change['pairs'])
+    raise ValueError(f"Unknown change kind: {kind}")
+
+
+def recompute_invalidated(invalidation):
+    """Recompute the invalidated assessments, then the invalidated matrix cells."""
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+    if invalidation.assessment_ids:
+        recompute_assessments(
+            RiskScenarioAssessment.objects.filter(id__in=invalidation.assessment_ids)
+        )
+    if invalidation.cells:
+        generate_matrices_bulk(sorted(invalidation.asset_ids), cells=invalidation.cells)
+    return invalidation
+
+
+def _record(invalidation):
+    with _stats_lock:
+        stats = _stats.setdefault(invalidation.kind, defaultdict(int))
+        stats['changes'] += 1
+        stats['assessments'] += len(invalidation.assessment_ids)
+        stats['cells'] += len(invalidation.cells)
+        stats['last_assessments'] = len(invalidation.assessment_ids)
+        stats['last_cells'] = len(invalidation.cells)
+    return invalidation
+
+
+def get_invalidation_stats():
+    """Return per change kind counters of invalidated assessments and cells."""
+    empty = {'changes': 0, 'assessments': 0, 'cells': 0, 'last_assessments': 0, 'last_cells': 0}
+    with _stats_lock:
+        return {kind: {**empty, **_stats.get(kind, {})} for kind in CHANGE_KINDS}
+
+
+def reset_invalidation_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,165 @@
+"""
+Materialized barrier effectiveness per risk type.
+
+BarrierRiskEffectiveness holds, for every (barrier, risk type) pair with an
+applicable score, the value returned by
+Barrier.get_risk_category_effectiveness_score:
+
+    round(max(applicable overall_effectiveness_score) * performance_adjustment, 2)
+
+Rows are rebuilt per barrier whenever its effectiveness scores, risk type or
+subtype associations, or performance adjustment change (see the receivers in
+barrier_models). Pairs without a row have an effectiveness of 0.
+
+Every rebuild that changes a barrier's overall effectiveness, performance
+adjustment or per-risk-type effectiveness also appends a
+BarrierEffectivenessSnapshot, giving the barrier's real history.
+"""
+
+from statistics import mean
+
+from django.db import transaction
+from django.db.models import Max, Q, Subquery
+from django.utils import timezone
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+
+
+def compute_barrier_effectiveness(barrier_ids):
+    """Compute (base score, effectiveness score) per (barrier id, risk type id).
+
+    A type-level score applies when the barrier is associated with the risk
+    type; a subtype-level score applies when the barrier is associated with
+    that subtype of the risk type. The base score is the highest applicable
+    overall effectiveness score before the performance adjustment.
+    """
+    Barrier = get_model('core', 'Barrier')
+    BarrierEffectivenessScore = get_model('core', 'BarrierEffectivenessScore')
+
+    adjustments = dict(
+        Barrier.objects.filter(id__in=barrier_ids).values_list('id', 'performance_adjustment')
+    )
+    type_links = set(
+        Barrier.risk_types.through.objects.filter(
+            barrier_id__in=barrier_ids
+        ).values_list('barrier_id', 'risktype_id')
+    )
+    subtype_links = set(
+        Barrier.risk_subtypes.through.objects.filter(
+            barrier_id__in=barrier_ids
+        ).values_list('barrier_id', 'risksubtype_id', 'risksubtype__risk_type_id')
+    )
+
+    best = {}
+    rows = BarrierEffectivenessScore.objects.filter(barrier_id__in=barrier_ids).values_list(
+        'barrier_id', 'risk_type_id', 'risk_subtype_id', 'overall_effectiveness_score'
+    )
+    for barrier_id, risk_type_id, subtype_id, score in rows:
+        if subtype_id is None:
+            applies = (barrier_id, risk_type_id) in type_links
+        else:
+            applies = (barrier_id, subtype_id, risk_type_id) in subtype_links
+        if applies:
+            key = (barrier_id, risk_type_id)
+            best[key] = max(best.get(key, score), score)
+
+    return {
+        key: (base_score, round(base_score * adjustments[key[0]], 2))
+        for key, base_score in best.items()
+    }
+
+
+def refresh_barrier_effectiveness(barrier_ids):
+    """Rebuild the materialized effectiveness rows of the given barriers."""
+    BarrierRiskEffectiveness = get_model('core', 'BarrierRiskEffectiveness')
+    barrier_ids = list(barrier_ids)
+    if not barrier_ids:
+        return 0
+
+    scores = compute_barrier_effectiveness(barrier_ids)
+    with transaction.atomic():
+        BarrierRiskEffectiveness.objects.filter(barrier_id__in=barrier_ids).delete()
+        BarrierRiskEffectiveness.objects.bulk_create([
+            BarrierRiskEffectiveness(
+                barrier_id=barrier_id,
+                risk_type_id=risk_type_id,
+                base_score=base_score,
+                effectiveness_score=effectiveness_score,
+            )
+            for (barrier_id, risk_type_id), (base_score, effectiveness_score) in scores.items()
+        ])
+        record_effectiveness_snapshots(barrier_ids, scores)
+        invalidate_model(BarrierRiskEffectiveness, Barrier=barrier_ids)
+    return len(scores)
+
+
+def record_effectiveness_snapshots(barrier_ids, scores):
+    """Append a snapshot for each barrier whose effectiveness changed.
+
+    ``scores`` is the result of compute_barrier_effectiveness for the
+    barriers. Returns the number of snapshots recorded.
+    """
+    Barrier = get_model('core', 'Barrier')
+    BarrierEffectivenessScore = get_model('core', 'BarrierEffectivenessScore')
+    BarrierEffectivenessSnapshot = get_model('core', 'BarrierEffectivenessSnapshot')
+
+    adjustments = dict(
+        Barrier.objects.filter(id__in=barrier_ids).values_list('id', 'performance_adjustment')
+    )
+    overall_scores = {}
+    for barrier_id, score in BarrierEffectivenessScore.objects.filter(
+        barrier_id__in=adjustments
+    ).values_list('barrier_id', 'overall_effectiveness_score'):
+        overall_scores.setdefault(barrier_id, []).append(score)
+    risk_effectiveness = {barrier_id: {} for barrier_id in adjustments}
+    for (barrier_id, risk_type_id), (_, effectiveness_score) in scores.items():
+        risk_effectiveness[barrier_id][str(risk_type_id)] = effectiveness_score
+
+    latest = {
+        snapshot.barrier_id: snapshot
+        for snapshot in BarrierEffectivenessSnapshot.objects.filter(id__in=Subquery(
+            BarrierEffectivenessSnapshot.objects.filter(barrier_id__in=adjustments).values(
+                'barrier_id'
+            ).annotate(latest_id=Max('id')).values('latest_id')
+        ))
+    }
+    now = timezone.now()
+    snapshots = []
+    for barrier_id, adjustment in adjustments.items():
+        # Same value as Barrier.get_overall_effectiveness_score
+        overall = round(mean(overall_scores[barrier_id]) * adjustment, 2) if barrier_id in overall_scores else 0
+        previous = latest.get(barrier_id)
+        if previous is not None and (
+            previous.overall_effectiveness, previous.performance_adjustment, previous.risk_effectiveness
+        ) == (overall, adjustment, risk_effectiveness[barrier_id]):
+            continue
+        snapshots.append(BarrierEffectivenessSnapshot(
+            barrier_id=barrier_id, recorded_at=now, overall_effectiveness=overall,
+            performance_adjustment=adjustment, risk_effectiveness=risk_effectiveness[barrier_id],
+        ))
+    BarrierEffectivenessSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def load_effectiveness_history(barrier_id, start, end):
+    """Snapshots of a barrier over a window, oldest first, in one query.
+
+    Includes the last snapshot before ``start``, which gives the state at
+    the start of the window.
+    """
+    BarrierEffectivenessSnapshot = get_model('core', 'BarrierEffectivenessSnapshot')
+    snapshots = BarrierEffectivenessSnapshot.objects.filter(barrier_id=barrier_id)
+    before_start = snapshots.filter(recorded_at__lt=start).order_by('-recorded_at', '-id').values('id')[:1]
+    return list(snapshots.filter(
+        Q(recorded_at__range=(start, end)) | Q(id__in=Subquery(before_start))
+    ).order_by('recorded_at', 'id'))
+
+
+def load_barrier_effectiveness(barrier_ids):
+    """Map (barrier id, risk type id) to the materialized effectiveness score."""
+    BarrierRiskEffectiveness = get_model('core', 'BarrierRiskEffectiveness')
+    rows = BarrierRiskEffectiveness.objects.filter(barrier_id__in=barrier_ids).values_list(
+        'barrier_id', 'risk_type_id', 'effectiveness_score'
+    )
+    return {(barrier_id, risk_type_id): score for barrier_id, risk_type_id, score in rows}
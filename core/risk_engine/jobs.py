@@ -0,0 +1,256 @@
+"""
+Database-backed background jobs for risk recomputation.
+
+Views enqueue RiskJob rows instead of recomputing inline; the risk_worker
+management command claims them and runs them in a process pool. Only the
+default database is needed, no external broker.
+
+Claiming is a compare-and-set UPDATE on the job row, so several workers can
+poll the same table safely. A claimed job holds a lease that the worker keeps
+renewing while it runs; when a worker dies, its lease expires and another
+worker reclaims the job. Failed jobs are retried with exponential backoff
+until they reach max_attempts.
+
+Settings (all optional), e.g.::
+
+    RISK_WORKER = {
+        'PROCESSES': 2,        # size of the worker process pool
+        'LEASE_SECONDS': 300,  # how long a claim is valid without renewal
+        'POLL_INTERVAL': 2,    # seconds between polls of an idle queue
+        'MAX_ATTEMPTS': 3,     # attempts before a job is marked FAILED
+        'RETRY_DELAY': 30,     # seconds before the first retry, doubled each time
+    }
+"""
+
+import logging
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models.model_imports import get_model
+
+logger = logging.getLogger(__name__)
+
+RECOMPUTE_ASSETS = 'recompute_assets'
+RECOMPUTE_INVALIDATION = 'recompute_invalidation'
+UPDATE_LINKED_ASSETS = 'update_linked_assets'
+RECOMPUTE_SUBMISSIONS = 'recompute_submissions'
+
+WORKER_DEFAULTS = {
+    'PROCESSES': 2,
+    'LEASE_SECONDS': 300,
+    'POLL_INTERVAL': 2,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,
+}
+
+JOB_HANDLERS = {}
+
+
+def worker_setting(name):
+    return getattr(settings, 'RISK_WORKER', {}).get(name, WORKER_DEFAULTS[name])
+
+
+def create_process_pool(processes):
+    """Process pool for running risk computations outside the calling process.
+
+    Pool processes are spawned, not forked, so they never share the parent's
+    database connections and need their own Django setup. Functions submitted
+    to the pool should close their connections when done.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def job_handler(kind):
+    """Register the function that runs jobs of the given kind."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None):
+    """Create a pending job. It becomes visible to workers when the transaction commits."""
+    RiskJob = get_model('core', 'RiskJob')
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown risk job kind: {kind}")
+    return RiskJob.objects.create(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=worker_setting('MAX_ATTEMPTS'),
+    )
+
+
+def enqueue_invalidation(kind, link_ids=(), **change):
+    """Enqueue the recomputation of what a change invalidates.
+
+    ``change`` holds the keys of the changed input, as taken by
+    dependencies.invalidate_change, e.g. ``barrier_ids``. Only these keys are
+    stored; the invalidated assessments and cells are resolved when the job
+    runs. The assets of ``link_ids`` are blended once the recompute is done,
+    so the linked scores are not overwritten by it.
+    """
+    from .dependencies import CHANGE_KINDS
+    if kind not in CHANGE_KINDS:
+        raise ValueError(f"Unknown change kind: {kind}")
+    payload = {'kind': kind}
+    for key, value in change.items():
+        payload[key] = value if value is None or isinstance(value, int) else sorted(value)
+    if link_ids:
+        payload['link_ids'] = sorted(link_ids)
+    return enqueue(RECOMPUTE_INVALIDATION, payload)
+
+
+def _claimable(now):
+    return (
+        Q(status='PENDING', run_after__lte=now) |
+        Q(status='RUNNING', lease_expires_at__lt=now)
+    )
+
+
+def claim_jobs(owner, limit, lease_seconds=None):
+    """Claim up to ``limit`` runnable jobs for ``owner`` and return their ids.
+
+    Jobs are pending jobs due to run and running jobs whose lease expired.
+    Each claim is a conditional UPDATE, so a job claimed concurrently by
+    another worker is skipped.
+    """
+    RiskJob = get_model('core', 'RiskJob')
+    if lease_seconds is None:
+        lease_seconds = worker_setting('LEASE_SECONDS')
+    now = timezone.now()
+    candidates = RiskJob.objects.filter(_claimable(now)).order_by(
+        'run_after', 'id'
+    ).values_list('id', flat=True)[:limit * 2]
+
+    claimed = []
+    for job_id in candidates:
+        updated = RiskJob.objects.filter(_claimable(now), id=job_id).update(
+            status='RUNNING',
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+            started_at=now,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def renew_leases(owner, job_ids, lease_seconds=None):
+    """Extend the leases ``owner`` holds on the given running jobs."""
+    RiskJob = get_model('core', 'RiskJob')
+    if lease_seconds is None:
+        lease_seconds = worker_setting('LEASE_SECONDS')
+    now = timezone.now()
+    return RiskJob.objects.filter(
+        id__in=job_ids, lease_owner=owner, status='RUNNING'
+    ).update(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+
+
+def release_leases(owner, job_ids):
+    """Give up the leases ``owner`` holds on jobs it can no longer run.
+
+    The jobs are retried after the usual backoff, or marked FAILED once they
+    reached max_attempts; claiming them already counted the attempt.
+    """
+    RiskJob = get_model('core', 'RiskJob')
+    now = timezone.now()
+    leased = RiskJob.objects.filter(id__in=job_ids, lease_owner=owner, status='RUNNING')
+    error = 'The worker process running the job died'
+    leased.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', last_error=error, finished_at=now, lease_expires_at=None, updated_at=now,
+    )
+    return leased.update(
+        status='PENDING', last_error=error, lease_owner='', lease_expires_at=None,
+        run_after=now + timedelta(seconds=worker_setting('RETRY_DELAY')), updated_at=now,
+    )
+
+
+def execute_job(job_id, owner):
+    """Run a claimed job and record its outcome. Returns the resulting status.
+
+    The outcome is only written while ``owner`` still holds the lease; a job
+    whose lease was lost and reclaimed by another worker is left alone.
+    """
+    RiskJob = get_model('core', 'RiskJob')
+    job = RiskJob.objects.get(id=job_id)
+    leased = RiskJob.objects.filter(id=job_id, lease_owner=owner, status='RUNNING')
+
+    try:
+        with transaction.atomic():
+            result = JOB_HANDLERS[job.kind](**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.error("Risk job %s (%s) failed on attempt %d: %s", job.id, job.kind, job.attempts, error)
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            status = 'FAILED'
+            leased.update(status=status, last_error=error, finished_at=now,
+                          lease_expires_at=None, updated_at=now)
+        else:
+            status = 'PENDING'
+            delay = worker_setting('RETRY_DELAY') * 2 ** (job.attempts - 1)
+            leased.update(status=status, last_error=error, lease_owner='',
+                          lease_expires_at=None, run_after=now + timedelta(seconds=delay),
+                          updated_at=now)
+        return status
+
+    now = timezone.now()
+    leased.update(status='SUCCEEDED', result=result, finished_at=now,
+                  lease_expires_at=None, updated_at=now)
+    return 'SUCCEEDED'
+
+
+@job_handler(RECOMPUTE_ASSETS)
+def run_recompute_assets(asset_ids, matrix_asset_ids=(), assessment_ids=(), cells=()):
+    from .recompute import PendingRecompute
+    pending = PendingRecompute()
+    pending.asset_ids.update(asset_ids)
+    pending.matrix_asset_ids.update(matrix_asset_ids)
+    pending.assessment_ids.update(assessment_ids)
+    pending.cells.update(tuple(cell) for cell in cells)
+    pending.flush()
+    return {'assets': len(asset_ids), 'matrix_assets': len(matrix_asset_ids),
+            'assessments': len(assessment_ids), 'cells': len(cells)}
+
+
+@job_handler(RECOMPUTE_INVALIDATION)
+def run_recompute_invalidation(kind, link_ids=(), **change):
+    from .dependencies import invalidate_change, recompute_invalidated
+    from .links import propagate_links
+    invalidation = recompute_invalidated(invalidate_change(kind, **change))
+    result = {'assessments': len(invalidation.assessment_ids), 'cells': len(invalidation.cells)}
+    if link_ids:
+        result['links'] = propagate_links(link_ids=link_ids)
+    return result
+
+
+@job_handler(UPDATE_LINKED_ASSETS)
+def run_update_linked_assets(asset_link_id):
+    from .links import propagate_links
+    AssetLink = get_model('core', 'AssetLink')
+    asset_link = AssetLink.objects.get(id=asset_link_id)
+    return propagate_links(link_ids=[asset_link.id])
+
+
+@job_handler(RECOMPUTE_SUBMISSIONS)
+def run_recompute_submissions(asset_ids, baseline_threats, barrier_scores):
+    from .submissions import recompute_submissions
+    return recompute_submissions(
+        asset_ids, [tuple(key) for key in baseline_threats], [tuple(key) for key in barrier_scores]
+    )
@@ -0,0 +1,214 @@
+"""
+Linked-asset risk propagation.
+
+Assets joined by an AssetLink influence each other's assessments: for every
+risk type the link shares, an assessment's likelihood and impact are blended
+70/30 with the mean scores of the linked assets, and for every barrier the
+link shares, the barrier's effectiveness is blended 70/30 with the linked
+assets' effectiveness of that barrier.
+
+Links are treated as a graph. The connected components reachable from the
+changed assets or links are found once with a union-find, then every
+component is blended in a single in-memory pass from a snapshot of its
+assessments, so each asset is visited exactly once per propagation however
+many overlapping links it belongs to, and cycles cannot cause re-entry.
+Changed assessments are written with bulk_update and the matrices of their
+assets regenerated once on commit.
+"""
+
+from collections import defaultdict
+from statistics import mean
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .bulk import DEFAULT_BATCH_SIZE
+from .catalog import get_catalog
+from .recompute import mark_matrices_dirty
+from .scoring import residual_risk_scores
+
+# Share of an assessment's own score kept when blending with linked assets
+OWN_WEIGHT = 0.7
+
+BLENDED_FIELDS = [
+    'likelihood_score', 'impact_score', 'barrier_effectiveness', 'residual_risk_score', 'updated_at',
+]
+
+
+def _find(parents, node):
+    root = node
+    while parents[root] != root:
+        root = parents[root]
+    # Path compression
+    while parents[node] != root:
+        parents[node], node = root, parents[node]
+    return root
+
+
+def link_components(link_assets):
+    """Group assets into the connected components of the link graph.
+
+    ``link_assets`` maps link id to the ids of its assets. Returns a list of
+    (asset ids, link ids) pairs, one per component.
+    """
+    parents = {}
+    for asset_ids in link_assets.values():
+        for asset_id in asset_ids:
+            parents.setdefault(asset_id, asset_id)
+        for asset_id in asset_ids[1:]:
+            first, other = _find(parents, asset_ids[0]), _find(parents, asset_id)
+            if first != other:
+                parents[other] = first
+
+    components = defaultdict(lambda: (set(), set()))
+    for asset_id in parents:
+        components[_find(parents, asset_id)][0].add(asset_id)
+    for link_id, asset_ids in link_assets.items():
+        if asset_ids:
+            components[_find(parents, asset_ids[0])][1].add(link_id)
+    return list(components.values())
+
+
+def _load_link_graph(asset_ids=None, link_ids=None):
+    """Load the links of every component containing the given assets or links."""
+    AssetLink = get_model('core', 'AssetLink')
+    link_assets = defaultdict(list)
+    for link_id, asset_id in AssetLink.assets.through.objects.order_by('id').values_list(
+        'assetlink_id', 'asset_id'
+    ):
+        link_assets[link_id].append(asset_id)
+
+    seeds = set(asset_ids or ())
+    for link_id in link_ids or ():
+        seeds.update(link_assets.get(link_id, ()))
+    return [
+        (component_assets, component_links)
+        for component_assets, component_links in link_components(link_assets)
+        if component_assets & seeds
+    ], link_assets
+
+
+def propagate_links(asset_ids=None, link_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Blend the assessments of every asset linked, directly or not, to the given assets or links.
+
+    Returns a dict with the number of components, assets and assessments
+    updated.
+    """
+    AssetLink = get_model('core', 'AssetLink')
+    RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+
+    components, link_assets = _load_link_graph(asset_ids, link_ids)
+    stats = {'components': len(components), 'assets': 0, 'assessments': 0}
+    if not components:
+        return stats
+
+    component_link_ids = set().union(*(links for _, links in components))
+    shared_risks = defaultdict(set)
+    for link_id, risk_type_id in AssetLink.shared_risks.through.objects.filter(
+        assetlink_id__in=component_link_ids
+    ).values_list('assetlink_id', 'risktype_id'):
+        shared_risks[link_id].add(risk_type_id)
+    shared_barriers = defaultdict(set)
+    for link_id, barrier_id in AssetLink.shared_barriers.through.objects.filter(
+        assetlink_id__in=component_link_ids
+    ).values_list('assetlink_id', 'barrier_id'):
+        shared_barriers[link_id].add(str(barrier_id))
+
+    scenario_risk_types = get_catalog().scenario_risk_types
+    changed = []
+    for component_assets, component_links in components:
+        assessments = list(
+            RiskScenarioAssessment.objects.filter(asset_id__in=component_assets).order_by('id')
+        )
+        changed.extend(_blend_component(
+            assessments, component_links, link_assets, shared_risks, shared_barriers, scenario_risk_types
+        ))
+
+    if changed:
+        residual_scores = residual_risk_scores(
+            [a.likelihood_score for a in changed],
+            [a.impact_score for a in changed],
+            [a.vulnerability_score for a in changed],
+            [a.barrier_effectiveness for a in changed],
+        )
+        now = timezone.now()
+        for assessment, residual_score in zip(changed, residual_scores):
+            assessment.residual_risk_score = float(residual_score)
+            assessment.updated_at = now
+        with transaction.atomic():
+            RiskScenarioAssessment.objects.bulk_update(changed, BLENDED_FIELDS, batch_size=batch_size)
+            changed_asset_ids = {assessment.asset_id for assessment in changed}
+            invalidate_model(RiskScenarioAssessment, Asset=changed_asset_ids)
+            mark_matrices_dirty(changed_asset_ids)
+        stats['assets'] = len(changed_asset_ids)
+        stats['assessments'] = len(changed)
+    return stats
+
+
+def _blend_component(assessments, link_ids, link_assets, shared_risks, shared_barriers, scenario_risk_types):
+    """Blend one component in memory and return the assessments that changed.
+
+    All blends read the scores as they were before the propagation, so the
+    result does not depend on the order links or assets are visited in.
+    """
+    # Snapshot of the component's scores per asset
+    risk_scores = defaultdict(list)
+    barrier_scores = defaultdict(list)
+    for assessment in assessments:
+        for risk_type_id in set(scenario_risk_types.get(assessment.scenario_id, ())):
+            risk_scores[(assessment.asset_id, risk_type_id)].append(
+                (assessment.id, assessment.likelihood_score, assessment.impact_score)
+            )
+        for barrier_id, score in (assessment.barrier_effectiveness or {}).items():
+            barrier_scores[(assessment.asset_id, barrier_id)].append(score)
+
+    # Linked assets sharing each risk type and barrier, merged across overlapping links
+    risk_peers = defaultdict(set)
+    barrier_peers = defaultdict(set)
+    for link_id in link_ids:
+        members = set(link_assets[link_id])
+        for asset_id in members:
+            for risk_type_id in shared_risks[link_id]:
+                risk_peers[(asset_id, risk_type_id)].update(members - {asset_id})
+            for barrier_id in shared_barriers[link_id]:
+                barrier_peers[(asset_id, barrier_id)].update(members - {asset_id})
+
+    changed = []
+    for assessment in assessments:
+        # Linked assessments of the shared risk types, each counted once
+        linked = {
+            assessment_id: (likelihood, impact)
+            for risk_type_id in set(scenario_risk_types.get(assessment.scenario_id, ()))
+            for peer_id in risk_peers.get((assessment.asset_id, risk_type_id), ())
+            for assessment_id, likelihood, impact in risk_scores.get((peer_id, risk_type_id), ())
+        }
+
+        updated = False
+        if linked:
+            linked_likelihood = mean(likelihood for likelihood, _ in linked.values())
+            linked_impact = mean(impact for _, impact in linked.values())
+            assessment.likelihood_score = _blend(assessment.likelihood_score, linked_likelihood)
+            assessment.impact_score = _blend(assessment.impact_score, linked_impact)
+            updated = True
+
+        effectiveness = dict(assessment.barrier_effectiveness or {})
+        for barrier_id, score in effectiveness.items():
+            linked = [
+                peer_score
+                for peer_id in barrier_peers.get((assessment.asset_id, barrier_id), ())
+                for peer_score in barrier_scores.get((peer_id, barrier_id), ())
+            ]
+            if linked:
+                effectiveness[barrier_id] = _blend(score, mean(linked))
+                updated = True
+        assessment.barrier_effectiveness = effectiveness
+
+        if updated:
+            changed.append(assessment)
+    return changed
+
+
+def _blend(own, linked):
+    return round(own * OWN_WEIGHT + linked * (1 - OWN_WEIGHT), 2)
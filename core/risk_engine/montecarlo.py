@@ -0,0 +1,156 @@
+"""
+Monte Carlo residual-risk distributions.
+
+The stored scores are point estimates. In Monte Carlo mode every input is
+treated as a symmetric triangular distribution centred on its point estimate,
+with a half-width given by ``spread`` and clipped to the valid range:
+
+- likelihood, impact and vulnerability of every assessment (1-10),
+- the base effectiveness score of every (barrier, risk type) pair (0-10),
+  before the barrier's performance adjustment,
+- the latest baseline threat score of every (country, risk type) pair (1-10).
+
+Draws are sampled for all assessments of a RiskModel at once and pushed
+through the same formula as RiskModel.evaluate, giving a (draws, cells) array
+of final residual risk scores. Inputs shared between assets, such as barrier
+effectiveness and baseline threats, take the same value in a given draw for
+every asset of the model.
+
+The generator is seedable: the same seed, draws and assets always give the
+same distribution.
+"""
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from ..models.model_imports import get_model
+from .simulation import RiskModel
+
+DEFAULT_DRAWS = 1000
+
+DEFAULT_SPREAD = {
+    'likelihood': 1.0,
+    'impact': 1.0,
+    'vulnerability': 1.0,
+    'barrier_effectiveness': 1.0,
+    'baseline_threat': 1.0,
+}
+
+PERCENTILES = (5, 50, 95)
+
+
+def _sample(rng, point, spread, low, high, draws):
+    """Draw ``draws`` samples of every point estimate in ``point``."""
+    point = np.asarray(point, dtype=float)
+    # The sum of two uniforms is triangular; much faster than rng.triangular
+    size = (draws,) + point.shape
+    noise = rng.random(size) + rng.random(size) - 1.0
+    return np.clip(point + noise * spread, low, high)
+
+
+def sample_residual_risk(model, draws=DEFAULT_DRAWS, rng=None, spread=None,
+                         performance=None, baseline_threats=None):
+    """Sample the final residual risk score of every cell of ``model``.
+
+    ``performance`` and ``baseline_threats`` override the stored point
+    estimates like in RiskModel.evaluate. Returns an array of shape
+    (draws, len(model.cells)).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    spread = {**DEFAULT_SPREAD, **(spread or {})}
+
+    scores = np.stack([
+        _sample(rng, model._assessment_scores[:, column], spread[name], 1, 10, draws)
+        for column, name in enumerate(['likelihood', 'impact', 'vulnerability'])
+    ])
+    base_risks = np.power(scores.prod(axis=0), 1 / 3)[:, model._row_assessments]
+
+    # Barrier effectiveness per draw, then the mean over each scenario's barriers
+    adjustments = {**model.performance, **(performance or {})}
+    keys = list(model.base_effectiveness)
+    key_index = {key: index for index, key in enumerate(keys)}
+    effectiveness = np.round(_sample(
+        rng, [model.base_effectiveness[key] for key in keys], spread['barrier_effectiveness'], 0, 10, draws
+    ) * np.array([adjustments[barrier_id] for barrier_id, _ in keys]), 2)
+    point_effectiveness = model.barrier_effectiveness(performance)
+
+    scenario_effectiveness = np.zeros((draws, len(model.scenario_ids)))
+    for index, scenario_id in enumerate(model.scenario_ids):
+        barrier_scores = []
+        for barrier_id, covered in model.catalog.barrier_coverage(scenario_id):
+            covered_keys = [
+                key_index[(barrier_id, risk_type_id)]
+                for risk_type_id in covered
+                if point_effectiveness.get((barrier_id, risk_type_id), 0) > 0
+            ]
+            # Barriers count when their point estimate does, as in evaluate()
+            if covered_keys:
+                barrier_scores.append(effectiveness[:, covered_keys].max(axis=1))
+        if barrier_scores:
+            scenario_effectiveness[:, index] = np.mean(barrier_scores, axis=0)
+
+    residual = base_risks / (1 + scenario_effectiveness[:, model._row_scenarios])
+    order = np.argsort(model._row_cells, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(model._row_cells[order]) != 0])
+    cell_scores = np.add.reduceat(residual[:, order], starts, axis=1) / model._cell_counts
+
+    # Baseline threats per (country, risk type), shared by the cells they feed
+    bta_points = {**model.baseline_threats, **(baseline_threats or {})}
+    bta_keys = [key for key in bta_points if key in model._bta_cells]
+    bta = np.full((draws, len(model.cells)), np.nan)
+    if bta_keys:
+        samples = _sample(rng, [bta_points[key] for key in bta_keys], spread['baseline_threat'], 1, 10, draws)
+        for column, key in enumerate(bta_keys):
+            bta[:, model._bta_cells[key]] = samples[:, [column]]
+    return np.where(np.isnan(bta), cell_scores, (cell_scores + bta) / 2)
+
+
+def residual_risk_distribution(asset_ids=None, draws=DEFAULT_DRAWS, seed=None, spread=None,
+                               performance=None, baseline_threats=None):
+    """Percentiles of the final residual risk of every (asset, risk type) cell.
+
+    Returns a dict mapping (asset id, risk type id) to a dict with the mean
+    and the p5, p50 and p95 residual risk scores.
+    """
+    model = RiskModel(asset_ids)
+    if not model.cells:
+        return {}
+    samples = sample_residual_risk(
+        model, draws, np.random.default_rng(seed), spread, performance, baseline_threats
+    )
+    percentiles = np.percentile(samples, PERCENTILES, axis=0)
+    means = samples.mean(axis=0)
+    return {
+        cell: {
+            'mean': float(means[index]),
+            **{f'p{p}': float(percentiles[row, index]) for row, p in enumerate(PERCENTILES)},
+        }
+        for index, cell in enumerate(model.cells)
+    }
+
+
+def store_residual_risk_distribution(asset_ids, draws=DEFAULT_DRAWS, seed=None, batch=0, spread=None):
+    """Compute and store the distributions of the given assets.
+
+    ``batch`` numbers the asset batch of a portfolio run; together with
+    ``seed`` it selects an independent random stream, so a run is reproducible
+    whatever the number of processes it is spread over. Returns the number of
+    distributions stored.
+    """
+    ResidualRiskDistribution = get_model('core', 'ResidualRiskDistribution')
+    asset_ids = list(asset_ids)
+    distribution = residual_risk_distribution(
+        asset_ids, draws, np.random.SeedSequence(seed, spawn_key=(batch,)), spread
+    )
+    computed_at = timezone.now()
+    with transaction.atomic():
+        ResidualRiskDistribution.objects.filter(asset_id__in=asset_ids).delete()
+        ResidualRiskDistribution.objects.bulk_create([
+            ResidualRiskDistribution(
+                asset_id=asset_id, risk_type_id=risk_type_id, draws=draws, seed=seed,
+                computed_at=computed_at, **scores,
+            )
+            for (asset_id, risk_type_id), scores in distribution.items()
+        ])
+    return len(distribution)
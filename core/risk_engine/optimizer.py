@@ -0,0 +1,169 @@
+"""
+Portfolio barrier-investment optimizer.
+
+An upgrade raises a barrier's performance adjustment by one step, up to 1.0,
+at a cost given per barrier. The optimizer greedily picks the upgrade with the
+largest reduction of the portfolio's total final residual risk per unit of
+cost until the budget or the maximum number of upgrades is used up, using the
+RiskModel formula.
+
+Candidates are scored incrementally. The total is linear in each assessment's
+residual risk, and an assessment's barrier effectiveness depends only on its
+scenario, so the total is a weighted sum over scenarios:
+
+    total = constant + sum(weight(scenario) / (1 + effectiveness(scenario)))
+
+where weight(scenario) sums the base risks of the scenario's assessments,
+divided by the number of assessments in their cell and halved where a BTA
+is averaged in. Upgrading a barrier only changes the effectiveness of the
+scenarios it applies to, so a candidate is scored from those scenarios alone,
+and after an upgrade only the candidates sharing one of them are re-scored.
+"""
+
+from collections import ChainMap, defaultdict
+
+import numpy as np
+
+from .simulation import RiskModel
+
+DEFAULT_STEP = 0.1
+MAX_PERFORMANCE = 1.0
+
+# Reductions below this are rounding noise
+MIN_REDUCTION = 1e-9
+
+
+class BarrierOptimizer:
+    """Greedy search over barrier performance upgrades of a RiskModel."""
+
+    def __init__(self, model, step=DEFAULT_STEP, costs=None):
+        self.model = model
+        self.step = step
+        self.costs = costs or {}
+        self.performance = dict(model.performance)
+        self.effectiveness = model.barrier_effectiveness()
+
+        row_weights = 1 / np.maximum(model._cell_counts, 1)
+        row_weights = np.where(np.isnan(model._bta), row_weights, row_weights / 2)[model._row_cells]
+        self.scenario_weights = np.bincount(
+            model._row_scenarios, weights=model._base_risks * row_weights, minlength=len(model.scenario_ids)
+        )
+        self.scenario_effectiveness = np.array([
+            self._scenario_effectiveness(index, self.effectiveness)
+            for index in range(len(model.scenario_ids))
+        ])
+
+        # Scenario indices each barrier applies to, and risk types it has a base score for
+        self.barrier_scenarios = defaultdict(list)
+        for index, scenario_id in enumerate(model.scenario_ids):
+            for barrier_id in model.catalog.applicable_barriers(scenario_id):
+                if barrier_id in self.performance:
+                    self.barrier_scenarios[barrier_id].append(index)
+        self.barrier_risk_types = defaultdict(list)
+        for barrier_id, risk_type_id in model.base_effectiveness:
+            self.barrier_risk_types[barrier_id].append(risk_type_id)
+
+    def _scenario_effectiveness(self, index, barrier_scores):
+        scores = list(self.model.catalog.barrier_effectiveness(
+            self.model.scenario_ids[index], barrier_scores
+        ).values())
+        return sum(scores) / len(scores) if scores else 0
+
+    def _upgraded_scores(self, barrier_id, performance):
+        return {
+            (barrier_id, risk_type_id): round(
+                self.model.base_effectiveness[(barrier_id, risk_type_id)] * performance, 2
+            )
+            for risk_type_id in self.barrier_risk_types[barrier_id]
+        }
+
+    def candidate(self, barrier_id):
+        """Next upgrade of a barrier as (new performance, scenario effectiveness, reduction), or None."""
+        current = self.performance[barrier_id]
+        if current >= MAX_PERFORMANCE - MIN_REDUCTION:
+            return None
+        performance = round(min(current + self.step, MAX_PERFORMANCE), 6)
+        scores = ChainMap(self._upgraded_scores(barrier_id, performance), self.effectiveness)
+        indices = self.barrier_scenarios[barrier_id]
+        effectiveness = np.array([self._scenario_effectiveness(index, scores) for index in indices])
+        reduction = float(np.dot(
+            self.scenario_weights[indices],
+            1 / (1 + self.scenario_effectiveness[indices]) - 1 / (1 + effectiveness),
+        ))
+        return performance, effectiveness, reduction
+
+    def apply(self, barrier_id, performance, effectiveness):
+        self.performance[barrier_id] = performance
+        self.effectiveness.update(self._upgraded_scores(barrier_id, performance))
+        self.scenario_effectiveness[self.barrier_scenarios[barrier_id]] = effectiveness
+
+    def run(self, max_upgrades=None, budget=None):
+        """Pick upgrades until the budget or the number of upgrades runs out.
+
+        Returns the list of upgrades in the order they were picked, as dicts
+        with the barrier id, the performance before and after, the cost and
+        the reduction of the portfolio's total residual risk.
+        """
+        scenario_barriers = defaultdict(set)
+        for barrier_id, indices in self.barrier_scenarios.items():
+            for index in indices:
+                scenario_barriers[index].add(barrier_id)
+
+        candidates = {barrier_id: self.candidate(barrier_id) for barrier_id in self.barrier_scenarios}
+        upgrades = []
+        remaining = budget
+        while max_upgrades is None or len(upgrades) < max_upgrades:
+            best = None
+            for barrier_id, candidate in candidates.items():
+                cost = self.costs.get(barrier_id, 1.0)
+                if candidate is None or candidate[2] <= MIN_REDUCTION:
+                    continue
+                if remaining is not None and cost > remaining + MIN_REDUCTION:
+                    continue
+                value = (candidate[2] / cost, -barrier_id)
+                if best is None or value > best[0]:
+                    best = (value, barrier_id, cost)
+            if best is None:
+                break
+
+            _, barrier_id, cost = best
+            performance, effectiveness, reduction = candidates[barrier_id]
+            upgrades.append({
+                'barrier_id': barrier_id,
+                'performance_before': self.performance[barrier_id],
+                'performance_after': performance,
+                'cost': cost,
+                'risk_reduction': reduction,
+            })
+            self.apply(barrier_id, performance, effectiveness)
+            if remaining is not None:
+                remaining -= cost
+
+            # Only barriers sharing a scenario with the upgraded one change value
+            for index in self.barrier_scenarios[barrier_id]:
+                for other_id in scenario_barriers[index]:
+                    candidates[other_id] = self.candidate(other_id)
+        return upgrades
+
+
+def optimize_barriers(asset_ids=None, max_upgrades=None, budget=None, costs=None, step=DEFAULT_STEP):
+    """Greedy barrier upgrade plan for the given assets (default: the whole portfolio).
+
+    ``costs`` maps barrier id to the cost of one upgrade step (default 1).
+    Returns a dict with the upgrades, the total residual risk of the
+    portfolio before and after them, and the final performance adjustments.
+    """
+    model = RiskModel(asset_ids)
+    optimizer = BarrierOptimizer(model, step, costs)
+    upgrades = optimizer.run(max_upgrades, budget)
+    performance = {
+        barrier_id: optimizer.performance[barrier_id]
+        for barrier_id in dict.fromkeys(upgrade['barrier_id'] for upgrade in upgrades)
+    }
+    total_before = float(model.evaluate().sum())
+    return {
+        'upgrades': upgrades,
+        'performance': performance,
+        'total_before': total_before,
+        'total_after': total_before - sum(upgrade['risk_reduction'] for upgrade in upgrades),
+    }
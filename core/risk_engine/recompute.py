@@ -0,0 +1,179 @@
+"""
+Coalesced risk recomputation.
+
+Receivers and model methods mark assets dirty instead of regenerating their
+risk data on every save. Dirty assets are collected per thread and recomputed
+once, when the surrounding transaction commits:
+
+- inside an atomic block, the pending set is flushed by transaction.on_commit
+  and dropped if the transaction rolls back;
+- inside a coalesced() block (every request, through
+  core.middleware.CoalescedRecomputeMiddleware), the set is flushed when the
+  block exits, so autocommit saves made by a view are also coalesced. The
+  middleware's flush does not raise: when it fails, the work is logged and
+  queued as a RECOMPUTE_ASSETS job instead;
+- otherwise the work is done immediately.
+
+An asset marked dirty gets its missing scenario assessments created, all of its
+assessments re-scored and all of its matrices regenerated, exactly once per
+flush regardless of how many saves touched it.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..models.model_imports import get_model
+from .assessments import create_missing_assessments, recompute_assessments
+from .bulk import generate_matrices_bulk
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class PendingRecompute:
+    """Risk data waiting to be recomputed."""
+
+    def __init__(self):
+        # Assets whose assessments and matrices are all recomputed
+        self.asset_ids = set()
+        # Assets whose matrices only are regenerated
+        self.matrix_asset_ids = set()
+        # Individual assessments and (asset, risk type) cells from invalidations
+        self.assessment_ids = set()
+        self.cells = set()
+
+    def __bool__(self):
+        return bool(self.asset_ids or self.matrix_asset_ids or self.assessment_ids or self.cells)
+
+    def flush(self):
+        if getattr(_local, 'pending', None) is self:
+            _local.pending = None
+        if not self:
+            return
+
+        RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+        asset_ids = self.asset_ids
+        matrix_asset_ids = self.matrix_asset_ids - asset_ids
+        cells = {cell for cell in self.cells if cell[0] not in asset_ids | matrix_asset_ids}
+
+        if asset_ids:
+            create_missing_assessments(asset_ids)
+        if asset_ids or self.assessment_ids:
+            recompute_assessments(RiskScenarioAssessment.objects.filter(
+                Q(asset_id__in=asset_ids) | Q(id__in=self.assessment_ids)
+            ))
+        if asset_ids or matrix_asset_ids:
+            generate_matrices_bulk(sorted(asset_ids | matrix_asset_ids))
+        if cells:
+            generate_matrices_bulk(sorted({asset_id for asset_id, _ in cells}), cells=cells)
+
+    def enqueue(self):
+        """Queue a RECOMPUTE_ASSETS job doing this recompute and return it."""
+        from .jobs import RECOMPUTE_ASSETS, enqueue
+        return enqueue(RECOMPUTE_ASSETS, {
+            'asset_ids': sorted(self.asset_ids),
+            'matrix_asset_ids': sorted(self.matrix_asset_ids),
+            'assessment_ids': sorted(self.assessment_ids),
+            'cells': sorted(self.cells),
+        })
+
+    def flush_or_enqueue(self):
+        """Flush, or hand the recompute to a job when the flush fails.
+
+        Used where the data has already been committed, so a failed recompute,
+        such as one hitting a locked database, must not fail the caller.
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Recompute of %d assets failed, queueing it", len(self.asset_ids))
+            try:
+                self.enqueue()
+            except Exception:
+                logger.exception("Could not queue the failed recompute")
+
+
+def recompute_assets(asset_ids):
+    """Recompute the assessments and matrices of the given assets right away."""
+    pending = PendingRecompute()
+    pending.asset_ids.update(asset_ids)
+    pending.flush()
+
+
+def _is_scheduled(pending, connection):
+    return any(entry[1] == pending.flush for entry in connection.run_on_commit)
+
+
+def _pending():
+    """Return the pending set to add work to and whether to flush it right away."""
+    if getattr(_local, 'depth', 0):
+        return _local.pending, False
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return PendingRecompute(), True
+
+    pending = getattr(_local, 'pending', None)
+    if pending is None or not _is_scheduled(pending, connection):
+        # Nothing pending, or the transaction that scheduled it rolled back
+        pending = _local.pending = PendingRecompute()
+        transaction.on_commit(pending.flush)
+    return pending, False
+
+
+def mark_assets_dirty(asset_ids):
+    """Recompute the assessments and matrices of the given assets once, on commit."""
+    pending, immediate = _pending()
+    pending.asset_ids.update(asset_ids)
+    if immediate:
+        pending.flush()
+
+
+def mark_matrices_dirty(asset_ids):
+    """Regenerate the matrices of the given assets once, on commit."""
+    pending, immediate = _pending()
+    pending.matrix_asset_ids.update(asset_ids)
+    if immediate:
+        pending.flush()
+
+
+def schedule_invalidation(invalidation):
+    """Recompute the assessments and cells of a dependency invalidation on commit."""
+    pending, immediate = _pending()
+    pending.assessment_ids.update(invalidation.assessment_ids)
+    pending.cells.update(invalidation.cells)
+    if immediate:
+        pending.flush()
+
+
+@contextmanager
+def coalesced(fallback_to_job=False):
+    """Defer all recomputes marked inside the block to a single flush at its end.
+
+    With ``fallback_to_job`` a failing flush is logged and queued as a job
+    instead of raising.
+    """
+    depth = getattr(_local, 'depth', 0)
+    if depth == 0:
+        outer_pending = getattr(_local, 'pending', None)
+        _local.pending = PendingRecompute()
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        if depth == 0:
+            pending = _local.pending
+            _local.pending = outer_pending
+
+    if depth == 0 and pending:
+        flush = pending.flush_or_enqueue if fallback_to_job else pending.flush
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(flush)
+        else:
+            flush()
@@ -0,0 +1,170 @@
+"""
+Time-bucketed RiskLog rollups.
+
+Every RiskLog row is folded into one daily, one weekly and one monthly
+RiskLogRollup of its asset and risk type, which keep the count, minimum,
+maximum, sum and last value of each score. Folding is associative, so the
+rollups are maintained incrementally as logs are written and can be rebuilt
+from the raw logs by streaming them through the same code.
+
+Trend queries read the coarsest resolution that still gives a usable number
+of points for the requested timeframe, so a two-year chart reads about a
+hundred weekly rows per asset and risk type instead of every log.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models.model_imports import get_model
+from .bulk import DEFAULT_BATCH_SIZE
+
+METRICS = ['bta_score', 'vulnerability_score', 'criticality_score', 'residual_risk_score']
+
+RESOLUTIONS = ['DAY', 'WEEK', 'MONTH']
+
+# Approximate length of a bucket, used to pick the resolution of a timeframe
+BUCKET_DAYS = {'DAY': 1, 'WEEK': 7, 'MONTH': 30}
+
+# Minimum number of buckets a trend should show before a finer resolution is used
+MIN_POINTS = 30
+
+LOG_FIELDS = ['asset_id', 'risk_type_id', 'timestamp'] + METRICS
+
+
+def bucket_start(resolution, day):
+    """First day of the bucket of the given resolution containing ``day``."""
+    if resolution == 'WEEK':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'MONTH':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(resolution, first_day, last_day):
+    """Start of every bucket of the given resolution overlapping [first_day, last_day]."""
+    day = bucket_start(resolution, first_day)
+    while day <= last_day:
+        yield day
+        if resolution == 'WEEK':
+            day += timedelta(days=7)
+        elif resolution == 'MONTH':
+            day = (day + timedelta(days=31)).replace(day=1)
+        else:
+            day += timedelta(days=1)
+
+
+def resolution_for_timeframe(days):
+    """Coarsest resolution giving at least MIN_POINTS buckets over ``days`` days."""
+    for resolution in reversed(RESOLUTIONS):
+        if days >= BUCKET_DAYS[resolution] * MIN_POINTS:
+            return resolution
+    return 'DAY'
+
+
+def _fold(rollups, log, existing=None):
+    """Fold one log, a dict of LOG_FIELDS, into the rollups of its buckets.
+
+    ``rollups`` maps (asset id, risk type id, resolution, bucket start) to
+    RiskLogRollup instances and is updated in place; missing keys are taken
+    from ``existing`` or created.
+    """
+    RiskLogRollup = get_model('core', 'RiskLogRollup')
+    day = timezone.localdate(log['timestamp'])
+    for resolution in RESOLUTIONS:
+        key = (log['asset_id'], log['risk_type_id'], resolution, bucket_start(resolution, day))
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = (existing or {}).get(key)
+            if rollup is None:
+                rollup = RiskLogRollup(
+                    asset_id=key[0], risk_type_id=key[1], resolution=resolution, bucket_start=key[3],
+                    count=0, last_timestamp=log['timestamp'],
+                    **{f'{metric}_{stat}': log[metric] for metric in METRICS for stat in ('min', 'max', 'last')},
+                    **{f'{metric}_sum': 0 for metric in METRICS},
+                )
+            rollups[key] = rollup
+
+        rollup.count += 1
+        is_last = log['timestamp'] >= rollup.last_timestamp
+        if is_last:
+            rollup.last_timestamp = log['timestamp']
+        for metric in METRICS:
+            value = log[metric]
+            setattr(rollup, f'{metric}_min', min(getattr(rollup, f'{metric}_min'), value))
+            setattr(rollup, f'{metric}_max', max(getattr(rollup, f'{metric}_max'), value))
+            setattr(rollup, f'{metric}_sum', getattr(rollup, f'{metric}_sum') + value)
+            if is_last:
+                setattr(rollup, f'{metric}_last', value)
+
+
+def _rollup_fields():
+    return ['count', 'last_timestamp'] + [
+        f'{metric}_{stat}' for metric in METRICS for stat in ('min', 'max', 'sum', 'last')
+    ]
+
+
+def rollup_risk_logs(logs, batch_size=DEFAULT_BATCH_SIZE):
+    """Fold newly written RiskLog rows into their rollups.
+
+    ``logs`` is an iterable of RiskLog instances. Existing rollups of the
+    affected buckets are read in one query, and the folded rollups are
+    written with one upsert per batch.
+    """
+    RiskLogRollup = get_model('core', 'RiskLogRollup')
+    logs = [{field: getattr(log, field) for field in LOG_FIELDS} for log in logs]
+    if not logs:
+        return
+
+    with transaction.atomic():
+        days = {timezone.localdate(log['timestamp']) for log in logs}
+        candidates = RiskLogRollup.objects.select_for_update().filter(
+            asset_id__in={log['asset_id'] for log in logs},
+            risk_type_id__in={log['risk_type_id'] for log in logs},
+            bucket_start__in={bucket_start(resolution, day) for resolution in RESOLUTIONS for day in days},
+        )
+        existing = {
+            (rollup.asset_id, rollup.risk_type_id, rollup.resolution, rollup.bucket_start): rollup
+            for rollup in candidates
+        }
+
+        rollups = {}
+        for log in logs:
+            _fold(rollups, log, existing)
+        # One upsert on the bucket key: bulk_update would build a CASE per
+        # field and row. Existing rollups are matched by key, not by id.
+        for rollup in rollups.values():
+            rollup.pk = None
+        RiskLogRollup.objects.bulk_create(
+            rollups.values(), batch_size=batch_size, update_conflicts=True,
+            unique_fields=['asset', 'risk_type', 'resolution', 'bucket_start'],
+            update_fields=_rollup_fields(),
+        )
+
+
+def rebuild_risk_log_rollups(asset_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute the rollups of the given assets (default: all) from their logs.
+
+    Logs are streamed in timestamp order, so memory holds only the rollups.
+    Returns the number of logs read and rollups written.
+    """
+    RiskLog = get_model('core', 'RiskLog')
+    RiskLogRollup = get_model('core', 'RiskLogRollup')
+
+    logs = RiskLog.objects.order_by('timestamp', 'id')
+    rollups = RiskLogRollup.objects.all()
+    if asset_ids is not None:
+        logs = logs.filter(asset_id__in=asset_ids)
+        rollups = rollups.filter(asset_id__in=asset_ids)
+
+    rebuilt = {}
+    count = 0
+    for log in logs.values(*LOG_FIELDS).iterator(chunk_size=batch_size * 4):
+        _fold(rebuilt, log)
+        count += 1
+
+    with transaction.atomic():
+        rollups.delete()
+        RiskLogRollup.objects.bulk_create(rebuilt.values(), batch_size=batch_size)
+    return {'logs': count, 'rollups': len(rebuilt)}
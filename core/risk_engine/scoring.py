@@ -0,0 +1,58 @@
+"""
+Vectorized residual-risk scoring.
+
+NumPy implementation of the RiskScenarioAssessment formula for many
+(asset, scenario) pairs in one pass:
+
+    base_risk = (likelihood * impact * vulnerability) ** (1/3)
+    residual  = base_risk / (1 + mean(barrier effectiveness))
+
+Pairs without any barrier effectiveness keep their base risk.
+"""
+
+import numpy as np
+
+
+def pad_barrier_effectiveness(rows):
+    """Pack ragged per-pair barrier effectiveness values into a 2D array.
+
+    ``rows`` is a sequence with one entry per pair; each entry is a dict (as
+    stored in RiskScenarioAssessment.barrier_effectiveness), a sequence of
+    scores, or None. Missing slots are filled with NaN.
+    """
+    values = [
+        list(row.values()) if isinstance(row, dict) else list(row or [])
+        for row in rows
+    ]
+    width = max((len(row) for row in values), default=0)
+    padded = np.full((len(values), width), np.nan)
+    for index, row in enumerate(values):
+        padded[index, :len(row)] = row
+    return padded
+
+
+def residual_risk_scores(likelihood, impact, vulnerability, barrier_effectiveness=None):
+    """Return the residual risk score of every pair as a float array.
+
+    ``likelihood``, ``impact`` and ``vulnerability`` are 1D arrays of weighted
+    answer scores. ``barrier_effectiveness`` is either a NaN-padded 2D array
+    with one row per pair or anything accepted by pad_barrier_effectiveness.
+    """
+    likelihood = np.asarray(likelihood, dtype=float)
+    impact = np.asarray(impact, dtype=float)
+    vulnerability = np.asarray(vulnerability, dtype=float)
+
+    base_risk = np.power(likelihood * impact * vulnerability, 1 / 3)
+    if barrier_effectiveness is None:
+        return base_risk
+
+    if not isinstance(barrier_effectiveness, np.ndarray):
+        barrier_effectiveness = pad_barrier_effectiveness(barrier_effectiveness)
+
+    present = ~np.isnan(barrier_effectiveness)
+    counts = present.sum(axis=1)
+    totals = np.where(present, barrier_effectiveness, 0.0).sum(axis=1)
+    mean_effectiveness = np.divide(
+        totals, counts, out=np.zeros_like(base_risk), where=counts > 0
+    )
+    return base_risk / (1 + mean_effectiveness)
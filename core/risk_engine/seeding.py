@@ -0,0 +1,98 @@
+"""
+Set-based creation of default rows.
+
+Bulk counterparts of the receivers that seed default data one row at a time:
+baseline threat assessments for company-operated countries and blank
+questionnaire answers for every asset. Existing rows are found with one query
+per chunk and only the missing ones are inserted, with ignore_conflicts so a
+concurrent seeder inserting the same rows does not fail the transaction. Rows
+skipped that way are not created by this call, so the returned counts come from
+counting the chunk's rows right before and after the insert.
+"""
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .baseline import refresh_current_baseline_threats
+from .bulk import DEFAULT_BATCH_SIZE, chunked
+
+
+def seed_baseline_threats(country_ids, risk_type_ids=None,
+                          notes='Automatically created for new company-operated country.',
+                          batch_size=DEFAULT_BATCH_SIZE):
+    """Create a default BTA for every risk type a company-operated country lacks one for.
+
+    ``risk_type_ids`` restricts seeding to the given risk types, all by default.
+    Returns the number of assessments created.
+    """
+    Country = get_model('core', 'Country')
+    RiskType = get_model('core', 'RiskType')
+    BaselineThreatAssessment = get_model('core', 'BaselineThreatAssessment')
+
+    risk_types = RiskType.objects.all()
+    if risk_type_ids is not None:
+        risk_types = risk_types.filter(id__in=risk_type_ids)
+    risk_type_ids = list(risk_types.values_list('id', flat=True))
+    country_ids = Country.objects.filter(
+        id__in=country_ids, company_operated=True
+    ).order_by('id').values_list('id', flat=True)
+
+    created = 0
+    for chunk in chunked(country_ids, batch_size):
+        existing = set(
+            BaselineThreatAssessment.objects.filter(
+                country_id__in=chunk, risk_type_id__in=risk_type_ids
+            ).values_list('country_id', 'risk_type_id')
+        )
+        missing = [
+            BaselineThreatAssessment(
+                country_id=country_id,
+                risk_type_id=risk_type_id,
+                baseline_score=5,
+                impact_on_assets=True,
+                notes=notes,
+            )
+            for country_id in chunk
+            for risk_type_id in risk_type_ids
+            if (country_id, risk_type_id) not in existing
+        ]
+        chunk_rows = BaselineThreatAssessment.objects.filter(country_id__in=chunk, risk_type_id__in=risk_type_ids)
+        before = chunk_rows.count()
+        BaselineThreatAssessment.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        # bulk_create fires no post_save, so refresh the current BTA projection
+        # and invalidate cached responses here
+        invalidate_model(BaselineThreatAssessment, Country={bta.country_id for bta in missing})
+        refresh_current_baseline_threats(
+            [(bta.country_id, bta.risk_type_id) for bta in missing], batch_size=batch_size
+        )
+        created += chunk_rows.count() - before
+    return created
+
+
+def create_blank_answers(answer_model, question_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Create an unanswered ``answer_model`` row for every asset and question lacking one.
+
+    Returns the number of answers created.
+    """
+    Asset = get_model('core', 'Asset')
+    question_ids = list(question_ids)
+    asset_ids = Asset.objects.order_by('id').values_list('id', flat=True)
+
+    created = 0
+    for chunk in chunked(asset_ids, batch_size):
+        existing = set(
+            answer_model.objects.filter(
+                asset_id__in=chunk, question_id__in=question_ids
+            ).values_list('asset_id', 'question_id')
+        )
+        missing = [
+            answer_model(asset_id=asset_id, question_id=question_id)
+            for asset_id in chunk
+            for question_id in question_ids
+            if (asset_id, question_id) not in existing
+        ]
+        chunk_rows = answer_model.objects.filter(asset_id__in=chunk, question_id__in=question_ids)
+        before = chunk_rows.count()
+        answer_model.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        invalidate_model(answer_model, Asset={answer.asset_id for answer in missing})
+        created += chunk_rows.count() - before
+    return created
@@ -0,0 +1,151 @@
+"""
+In-memory risk model for what-if simulations.
+
+RiskModel loads the inputs of the Final Risk Matrix computation for a set of
+assets into NumPy arrays, once, and re-evaluates every (asset, risk type) cell
+under hypothetical barrier performance adjustments and baseline threat scores
+without writing anything:
+
+    effectiveness(barrier, risk type) = round(base score * performance adjustment, 2)
+    residual(assessment) = base_risk / (1 + mean(effectiveness of applicable barriers))
+    cell = mean(residual of the cell's assessments), averaged with the latest BTA
+
+Assessment likelihood, impact and vulnerability scores are taken as stored.
+The barrier effectiveness of an assessment depends only on its scenario, so it
+is computed once per scenario and the rest of the evaluation is vectorized.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+from ..models.model_imports import get_model
+from .bulk import load_latest_bta_scores
+from .catalog import get_catalog
+
+
+class RiskModel:
+    """Snapshot of the risk inputs of a portfolio, evaluated in memory."""
+
+    def __init__(self, asset_ids=None):
+        Asset = get_model('core', 'Asset')
+        Barrier = get_model('core', 'Barrier')
+        RiskScenarioAssessment = get_model('core', 'RiskScenarioAssessment')
+        BarrierRiskEffectiveness = get_model('core', 'BarrierRiskEffectiveness')
+
+        assets = Asset.objects.all()
+        if asset_ids is not None:
+            assets = assets.filter(id__in=asset_ids)
+        self.asset_countries = dict(assets.values_list('id', 'country_id'))
+
+        rows = list(RiskScenarioAssessment.objects.filter(
+            asset_id__in=self.asset_countries
+        ).order_by('id').values_list(
+            'asset_id', 'scenario_id', 'likelihood_score', 'impact_score', 'vulnerability_score'
+        ))
+        self.catalog = get_catalog()
+        self.scenario_ids = sorted({scenario_id for _, scenario_id, _, _, _ in rows})
+        scenario_index = {scenario_id: index for index, scenario_id in enumerate(self.scenario_ids)}
+
+        # Likelihood, impact and vulnerability of every assessment
+        self._assessment_scores = np.array([row[2:] for row in rows], dtype=float).reshape(-1, 3)
+        # One row per (assessment, risk type) pair, repeated per subtype like
+        # the scenario__risk_subtypes join of generate_matrices
+        cell_index = {}
+        row_assessments, row_scenarios, row_cells = [], [], []
+        for assessment_index, (asset_id, scenario_id, _, _, _) in enumerate(rows):
+            for risk_type_id in self.catalog.scenario_risk_types.get(scenario_id, ()):
+                cell = (asset_id, risk_type_id)
+                row_cells.append(cell_index.setdefault(cell, len(cell_index)))
+                row_scenarios.append(scenario_index[scenario_id])
+                row_assessments.append(assessment_index)
+        self.cells = list(cell_index)
+        self._row_assessments = np.array(row_assessments, dtype=int)
+        self._row_scenarios = np.array(row_scenarios, dtype=int)
+        self._row_cells = np.array(row_cells, dtype=int)
+        self._base_risks = np.power(self._assessment_scores.prod(axis=1), 1 / 3)[self._row_assessments]
+        self._cell_counts = np.bincount(self._row_cells, minlength=len(self.cells))
+
+        barrier_ids = {
+            barrier_id
+            for scenario_id in self.scenario_ids
+            for barrier_id in self.catalog.applicable_barriers(scenario_id)
+        }
+        self.performance = dict(
+            Barrier.objects.filter(id__in=barrier_ids).values_list('id', 'performance_adjustment')
+        )
+        self.base_effectiveness = {
+            (barrier_id, risk_type_id): base_score
+            for barrier_id, risk_type_id, base_score in BarrierRiskEffectiveness.objects.filter(
+                barrier_id__in=barrier_ids
+            ).values_list('barrier_id', 'risk_type_id', 'base_score')
+        }
+        self.baseline_threats = load_latest_bta_scores(set(self.asset_countries.values()))
+        # Cells fed by each (country, risk type) baseline threat
+        self._bta_cells = defaultdict(list)
+        for index, (asset_id, risk_type_id) in enumerate(self.cells):
+            self._bta_cells[(self.asset_countries[asset_id], risk_type_id)].append(index)
+        self._bta = np.full(len(self.cells), np.nan)
+        for key, baseline_score in self.baseline_threats.items():
+            self._bta[self._bta_cells.get(key, [])] = baseline_score
+
+    def barrier_effectiveness(self, performance=None):
+        """Map (barrier id, risk type id) to effectiveness under the given performance adjustments."""
+        adjustments = dict(self.performance)
+        adjustments.update(performance or {})
+        return {
+            (barrier_id, risk_type_id): round(base_score * adjustments[barrier_id], 2)
+            for (barrier_id, risk_type_id), base_score in self.base_effectiveness.items()
+        }
+
+    def evaluate(self, performance=None, baseline_threats=None):
+        """Final residual risk score of every cell, aligned with ``self.cells``.
+
+        ``performance`` maps barrier id to a performance adjustment and
+        ``baseline_threats`` maps (country id, risk type id) to a baseline
+        score; both override the stored values.
+        """
+        effectiveness = self.barrier_effectiveness(performance)
+        scenario_effectiveness = np.zeros(len(self.scenario_ids))
+        for index, scenario_id in enumerate(self.scenario_ids):
+            scores = list(self.catalog.barrier_effectiveness(scenario_id, effectiveness).values())
+            if scores:
+                scenario_effectiveness[index] = sum(scores) / len(scores)
+
+        residual = self._base_risks / (1 + scenario_effectiveness[self._row_scenarios])
+        cell_scores = np.bincount(self._row_cells, weights=residual, minlength=len(self.cells))
+        cell_scores = cell_scores / np.maximum(self._cell_counts, 1)
+
+        bta = self._bta.copy()
+        for key, baseline_score in (baseline_threats or {}).items():
+            bta[self._bta_cells.get(key, [])] = baseline_score
+        return np.where(np.isnan(bta), cell_scores, (cell_scores + bta) / 2)
+
+    def simulate(self, performance=None, baseline_threats=None, include_unchanged=False):
+        """Before and after scores of the cells affected by the given overrides.
+
+        Returns a list of dicts with the asset id, risk type id and the score
+        and risk level before and after, largest change first.
+        """
+        FinalRiskMatrix = get_model('core', 'FinalRiskMatrix')
+        before = self.evaluate()
+        after = self.evaluate(performance, baseline_threats)
+
+        changes = after - before
+        indices = np.arange(len(self.cells))
+        if not include_unchanged:
+            indices = indices[~np.isclose(before, after)]
+        indices = indices[np.argsort(-np.abs(changes[indices]), kind='stable')]
+
+        results = []
+        for index in indices.tolist():
+            asset_id, risk_type_id = self.cells[index]
+            old, new = float(before[index]), float(after[index])
+            results.append({
+                'asset_id': asset_id,
+                'risk_type_id': risk_type_id,
+                'before': {'residual_risk_score': old, 'risk_level': FinalRiskMatrix.calculate_risk_level(old)},
+                'after': {'residual_risk_score': new, 'risk_level': FinalRiskMatrix.calculate_risk_level(new)},
+                'change': new - old,
+            })
+        return results
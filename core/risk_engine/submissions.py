@@ -0,0 +1,486 @@
+"""
+Bulk risk assessment submissions.
+
+save_assessment_submissions() stores the assessments of many assets, such as
+those of a periodic review, in one pass instead of one save_risk_assessment
+call per asset:
+
+1. Every submission is validated up front against reference data loaded with
+   one query per table for the whole batch. Invalid submissions are reported
+   and skipped; the others are saved.
+2. Barrier effectiveness scores, which are shared by the submissions, are
+   upserted in one short transaction. Baseline threats and scenario and
+   questionnaire answers are then upserted with bulk writes, one transaction
+   per batch of submissions, so no transaction holds the write lock for the
+   whole request and a failed batch saves nothing of its submissions.
+3. A RECOMPUTE_SUBMISSIONS job is queued with the saved assets and the keys of
+   the saved baseline threats and barrier scores. It looks up the assessments
+   and matrix cells of other assets those invalidate, recomputes everything
+   once, in a single deduplicated pass, then writes a RiskLog row for every
+   matrix cell of the saved assets.
+
+A submission is a dict:
+
+    {"asset_id": 12,
+     "bta": {risk_type_id: score},
+     "scenario_answers": {scenario_id: {question_id: choice_id}},
+     "vulnerability": {question_id: choice},
+     "criticality": {question_id: choice}}
+
+Baseline threat scores are assessed today for the asset's country. When two
+submissions give different scores for the same country and risk type, the
+later one is rejected.
+"""
+
+from collections import defaultdict
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from ..caching import invalidate_model
+from ..models.model_imports import get_model
+from .baseline import refresh_current_baseline_threats
+from .bulk import DEFAULT_BATCH_SIZE, chunked, load_latest_bta_scores
+from .dependencies import BASELINE_THREAT, Invalidation, invalidate_barriers, invalidate_baseline_threat
+from .effectiveness import refresh_barrier_effectiveness
+from .jobs import RECOMPUTE_SUBMISSIONS, enqueue
+from .recompute import PendingRecompute
+from .rollups import rollup_risk_logs
+
+SUBMISSION_KEYS = {'asset_id', 'bta', 'scenario_answers', 'vulnerability', 'criticality'}
+
+# Questionnaire of each answer kind: answer model and question model
+QUESTIONNAIRES = {
+    'vulnerability': ('AssetVulnerabilityAnswer', 'AssetVulnerabilityQuestion'),
+    'criticality': ('AssetCriticalityAnswer', 'AssetCriticalityQuestion'),
+}
+
+# Barrier effectiveness score fields by submitted name, with the default
+# save_risk_assessment uses for missing ones
+EFFECTIVENESS_FIELDS = {
+    'preventive': 'preventive_capability',
+    'detection': 'detection_capability',
+    'response': 'response_capability',
+    'reliability': 'reliability',
+    'coverage': 'coverage',
+}
+DEFAULT_EFFECTIVENESS = 5
+
+
+def _id(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value}")
+
+
+def _by_id(mapping, name):
+    """Copy of a JSON object keyed by ids, with the keys as ints."""
+    if mapping is None:
+        return {}
+    if not isinstance(mapping, dict):
+        raise ValueError(f"{name} must be an object")
+    return {_id(key, f"{name} id"): value for key, value in mapping.items()}
+
+
+def _score(value, name):
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        score = None
+    if score is None or not 1 <= score <= 10:
+        raise ValueError(f"{name} must be an integer from 1 to 10")
+    return score
+
+
+def _parse_submission(submission):
+    """Submission with its ids as ints; raises ValueError for malformed ones."""
+    if not isinstance(submission, dict):
+        raise ValueError("Each submission must be an object")
+    unknown = set(submission) - SUBMISSION_KEYS
+    if unknown:
+        raise ValueError(f"Unknown keys: {', '.join(sorted(unknown))}")
+    return {
+        'asset_id': _id(submission.get('asset_id'), 'asset_id'),
+        'bta': {
+            risk_type_id: _score(score, f"Baseline threat score of risk type {risk_type_id}")
+            for risk_type_id, score in _by_id(submission.get('bta'), 'bta').items()
+        },
+        'scenario_answers': {
+            scenario_id: {
+                question_id: _id(choice_id, 'choice id')
+                for question_id, choice_id in _by_id(answers, f"scenario {scenario_id} answers").items()
+            }
+            for scenario_id, answers in _by_id(submission.get('scenario_answers'), 'scenario_answers').items()
+        },
+        **{kind: _by_id(submission.get(kind), kind) for kind in QUESTIONNAIRES},
+    }
+
+
+def validate_submissions(submissions):
+    """Check submissions against the reference data.
+
+    Returns the valid submissions by position, with ``country_id`` added and
+    questionnaire answers resolved to (choice, score) pairs, and the list of
+    errors of each invalid submission by position.
+    """
+    Asset = get_model('core', 'Asset')
+    RiskType = get_model('core', 'RiskType')
+    ScenarioQuestion = get_model('core', 'ScenarioQuestion')
+    QuestionChoice = get_model('core', 'QuestionChoice')
+
+    parsed = {}
+    errors = {}
+    for index, submission in enumerate(submissions):
+        try:
+            parsed[index] = _parse_submission(submission)
+        except ValueError as e:
+            errors[index] = [str(e)]
+
+    def referenced(key):
+        return {item_id for submission in parsed.values() for item_id in submission[key]}
+
+    asset_countries = dict(Asset.objects.filter(
+        id__in={submission['asset_id'] for submission in parsed.values()}
+    ).values_list('id', 'country_id'))
+    risk_type_ids = set(RiskType.objects.filter(id__in=referenced('bta')).values_list('id', flat=True))
+    scenario_answers = [submission['scenario_answers'] for submission in parsed.values()]
+    question_scenarios = dict(ScenarioQuestion.objects.filter(id__in={
+        question_id for answers in scenario_answers for questions in answers.values() for question_id in questions
+    }).values_list('id', 'scenario_id'))
+    choice_questions = dict(QuestionChoice.objects.filter(id__in={
+        choice_id for answers in scenario_answers for questions in answers.values() for choice_id in questions.values()
+    }).values_list('id', 'question_id'))
+    choice_scores = {
+        kind: {
+            question.id: question.get_choice_scores()
+            for question in get_model('core', question_model).objects.filter(id__in=referenced(kind))
+        }
+        for kind, (_, question_model) in QUESTIONNAIRES.items()
+    }
+
+    valid = {}
+    seen_assets = set()
+    bta_scores = {}
+    for index, submission in parsed.items():
+        problems = []
+        asset_id = submission['asset_id']
+        country_id = asset_countries.get(asset_id)
+        if country_id is None:
+            problems.append(f"Unknown asset: {asset_id}")
+        elif asset_id in seen_assets:
+            problems.append(f"Asset {asset_id} is submitted more than once")
+
+        for risk_type_id, score in submission['bta'].items():
+            if risk_type_id not in risk_type_ids:
+                problems.append(f"Unknown risk type: {risk_type_id}")
+            elif bta_scores.get((country_id, risk_type_id), score) != score:
+                problems.append(
+                    f"Conflicting baseline threat score for risk type {risk_type_id} in country {country_id}"
+                )
+
+        for scenario_id, answers in submission['scenario_answers'].items():
+            for question_id, choice_id in answers.items():
+                if question_scenarios.get(question_id) != scenario_id:
+                    problems.append(f"Question {question_id} is not a question of scenario {scenario_id}")
+                elif choice_questions.get(choice_id) != question_id:
+                    problems.append(f"Choice {choice_id} is not a choice of question {question_id}")
+
+        for kind in QUESTIONNAIRES:
+            for question_id, choice in submission[kind].items():
+                scores = choice_scores[kind].get(question_id)
+                if scores is None:
+                    problems.append(f"Unknown {kind} question: {question_id}")
+                elif choice and choice not in scores:
+                    problems.append(f"Invalid choice for {kind} question {question_id}: {choice}")
+                else:
+                    submission[kind][question_id] = (choice, scores[choice] if choice else None)
+
+        if problems:
+            errors[index] = problems
+            continue
+        seen_assets.add(asset_id)
+        for risk_type_id, score in submission['bta'].items():
+            bta_scores[(country_id, risk_type_id)] = score
+        valid[index] = dict(submission, country_id=country_id)
+    return valid, errors
+
+
+def parse_barrier_effectiveness(configurations):
+    """Effectiveness scores by (barrier id, risk type id) from a barrierConfigurations-style object.
+
+    ``configurations`` maps barrier ids to {risk_type_id: {"preventive": 1-10, ...}}.
+    Raises ValueError for malformed scores and unknown barriers or risk types.
+    """
+    Barrier = get_model('core', 'Barrier')
+    RiskType = get_model('core', 'RiskType')
+
+    scores = {}
+    for barrier_id, risk_types in _by_id(configurations, 'barrier_effectiveness').items():
+        for risk_type_id, values in _by_id(risk_types, f"barrier {barrier_id} effectiveness").items():
+            if not isinstance(values, dict):
+                raise ValueError(f"Effectiveness of barrier {barrier_id} must be an object")
+            unknown = set(values) - set(EFFECTIVENESS_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown effectiveness scores: {', '.join(sorted(unknown))}")
+            scores[(barrier_id, risk_type_id)] = {
+                field: _score(values.get(name, DEFAULT_EFFECTIVENESS), f"{name} of barrier {barrier_id}")
+                for name, field in EFFECTIVENESS_FIELDS.items()
+            }
+
+    barrier_ids = {barrier_id for barrier_id, _ in scores}
+    missing = barrier_ids - set(Barrier.objects.filter(id__in=barrier_ids).values_list('id', flat=True))
+    if missing:
+        raise ValueError(f"Unknown barrier ids: {sorted(missing)}")
+    risk_type_ids = {risk_type_id for _, risk_type_id in scores}
+    missing = risk_type_ids - set(RiskType.objects.filter(id__in=risk_type_ids).values_list('id', flat=True))
+    if missing:
+        raise ValueError(f"Unknown risk type ids: {sorted(missing)}")
+    return scores
+
+
+def _save_baseline_threats(scores, batch_size):
+    """Upsert today's BTAs of (country id, risk type id) pairs."""
+    BaselineThreatAssessment = get_model('core', 'BaselineThreatAssessment')
+    if not scores:
+        return
+
+    today = timezone.now().date()
+    BaselineThreatAssessment.objects.bulk_create(
+        [
+            BaselineThreatAssessment(
+                country_id=country_id, risk_type_id=risk_type_id, baseline_score=score, date_assessed=today,
+            )
+            for (country_id, risk_type_id), score in scores.items()
+        ],
+        batch_size=batch_size, update_conflicts=True,
+        unique_fields=['risk_type', 'country', 'date_assessed'],
+        update_fields=['baseline_score', 'updated_at'],
+    )
+    invalidate_model(BaselineThreatAssessment, Country={country_id for country_id, _ in scores})
+    refresh_current_baseline_threats(scores.keys(), batch_size=batch_size)
+
+
+def _save_scenario_answers(submissions, batch_size):
+    AssetScenarioAnswer = get_model('core', 'AssetScenarioAnswer')
+    answers = [
+        AssetScenarioAnswer(
+            asset_id=submission['asset_id'], scenario_id=scenario_id,
+            question_id=question_id, selected_choice_id=choice_id,
+        )
+        for submission in submissions
+        for scenario_id, questions in submission['scenario_answers'].items()
+        for question_id, choice_id in questions.items()
+    ]
+    AssetScenarioAnswer.objects.bulk_create(
+        answers, batch_size=batch_size, update_conflicts=True,
+        unique_fields=['asset', 'scenario', 'question'],
+        update_fields=['selected_choice', 'updated_at'],
+    )
+    invalidate_model(AssetScenarioAnswer, Asset={answer.asset_id for answer in answers})
+
+
+def _save_questionnaire_answers(submissions, batch_size):
+    """Upsert vulnerability and criticality answers; returns the ids of the assets answered."""
+    asset_ids = set()
+    for kind, (answer_model, _) in QUESTIONNAIRES.items():
+        answer_model = get_model('core', answer_model)
+        answers = [
+            answer_model(
+                asset_id=submission['asset_id'], question_id=question_id,
+                selected_choice=choice, selected_score=score,
+            )
+            for submission in submissions
+            for question_id, (choice, score) in submission[kind].items()
+        ]
+        answer_model.objects.bulk_create(
+            answers, batch_size=batch_size, update_conflicts=True,
+            unique_fields=['asset', 'question'],
+            update_fields=['selected_choice', 'selected_score', 'updated_at'],
+        )
+        answered = {answer.asset_id for answer in answers}
+        invalidate_model(answer_model, Asset=answered)
+        asset_ids |= answered
+    return asset_ids
+
+
+def _save_barrier_effectiveness(scores, batch_size):
+    """Upsert risk type wide effectiveness scores."""
+    BarrierEffectivenessScore = get_model('core', 'BarrierEffectivenessScore')
+    barrier_ids = {barrier_id for barrier_id, _ in scores}
+    risk_type_ids = {risk_type_id for _, risk_type_id in scores}
+
+    # risk_subtype is NULL, which unique constraints do not match, so
+    # existing rows are looked up instead of upserted
+    existing = {
+        (score.barrier_id, score.risk_type_id): score
+        for score in BarrierEffectivenessScore.objects.filter(
+            barrier_id__in=barrier_ids, risk_type_id__in=risk_type_ids, risk_subtype__isnull=True,
+        )
+    }
+    to_create = []
+    to_update = []
+    for (barrier_id, risk_type_id), values in scores.items():
+        score = existing.get((barrier_id, risk_type_id))
+        if score is None:
+            score = BarrierEffectivenessScore(barrier_id=barrier_id, risk_type_id=risk_type_id)
+            to_create.append(score)
+        else:
+            to_update.append(score)
+        for field, value in values.items():
+            setattr(score, field, value)
+        score.overall_effectiveness_score = score.calculate_overall_effectiveness()
+
+    BarrierEffectivenessScore.objects.bulk_create(to_create, batch_size=batch_size)
+    BarrierEffectivenessScore.objects.bulk_update(
+        to_update, list(EFFECTIVENESS_FIELDS.values()) + ['overall_effectiveness_score'], batch_size=batch_size,
+    )
+    invalidate_model(BarrierEffectivenessScore, Barrier=barrier_ids)
+    refresh_barrier_effectiveness(barrier_ids)
+
+
+def _log_risk(asset_ids, batch_size):
+    """Write a RiskLog row for every matrix cell of the assets; returns the number written."""
+    Asset = get_model('core', 'Asset')
+    FinalRiskMatrix = get_model('core', 'FinalRiskMatrix')
+    RiskLog = get_model('core', 'RiskLog')
+
+    assets = {
+        asset_id: (country_id, vulnerability_score, criticality_score)
+        for asset_id, country_id, vulnerability_score, criticality_score in Asset.objects.filter(
+            id__in=asset_ids
+        ).values_list('id', 'country_id', 'vulnerability_score', 'criticality_score')
+    }
+    bta_scores = load_latest_bta_scores({country_id for country_id, _, _ in assets.values()})
+
+    logs = []
+    now = timezone.now()
+    for asset_id, risk_type_id, residual_risk_score in FinalRiskMatrix.objects.filter(
+        asset_id__in=asset_ids
+    ).order_by('asset_id', 'risk_type_id').values_list('asset_id', 'risk_type_id', 'residual_risk_score'):
+        country_id, vulnerability_score, criticality_score = assets[asset_id]
+        bta_score = bta_scores.get((country_id, risk_type_id))
+        if bta_score is None:
+            # A log needs the baseline threat it was computed with
+            continue
+        logs.append(RiskLog(
+            asset_id=asset_id, risk_type_id=risk_type_id, bta_score=bta_score,
+            vulnerability_score=vulnerability_score, criticality_score=criticality_score,
+            residual_risk_score=residual_risk_score, timestamp=now,
+        ))
+
+    RiskLog.objects.bulk_create(logs, batch_size=batch_size)
+    # bulk_create skips the receiver that folds new logs into their rollups
+    rollup_risk_logs(logs, batch_size=batch_size)
+    return len(logs)
+
+
+def _save_batch(submissions, batch_size):
+    """Upsert the baseline threats and answers of some submissions and update their assets' scores.
+
+    Returns the (country id, risk type id) keys of the baseline threats saved.
+    """
+    Asset = get_model('core', 'Asset')
+    bta_scores = {
+        (submission['country_id'], risk_type_id): score
+        for submission in submissions for risk_type_id, score in submission['bta'].items()
+    }
+    _save_baseline_threats(bta_scores, batch_size)
+    _save_scenario_answers(submissions, batch_size)
+    answered = _save_questionnaire_answers(submissions, batch_size)
+    if answered:
+        Asset.update_scores_bulk(answered, recompute=False)
+    return set(bta_scores)
+
+
+def recompute_submissions(asset_ids, baseline_threats=(), barrier_scores=(), batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute saved assets and whatever their baseline threats and barrier scores invalidated.
+
+    ``baseline_threats`` holds the saved (country id, risk type id) keys and
+    ``barrier_scores`` the saved (barrier id, risk type id) keys. Everything
+    is recomputed once, then the risk of the saved assets is logged. Returns
+    the counts of assets, assessments, cells and logs.
+    """
+    invalidation = Invalidation(BASELINE_THREAT)
+    risk_types_by_country = defaultdict(set)
+    for country_id, risk_type_id in baseline_threats:
+        risk_types_by_country[country_id].add(risk_type_id)
+    for country_id, risk_type_ids in risk_types_by_country.items():
+        invalidation.merge(invalidate_baseline_threat(country_id, risk_type_ids))
+    if barrier_scores:
+        invalidation.merge(invalidate_barriers(
+            {barrier_id for barrier_id, _ in barrier_scores},
+            risk_type_ids={risk_type_id for _, risk_type_id in barrier_scores},
+        ))
+
+    pending = PendingRecompute()
+    pending.asset_ids.update(asset_ids)
+    pending.assessment_ids.update(invalidation.assessment_ids)
+    pending.cells.update(invalidation.cells)
+    pending.flush()
+    return {
+        'assets': len(pending.asset_ids),
+        'assessments': len(pending.assessment_ids),
+        'cells': len(pending.cells),
+        'logs': _log_risk(asset_ids, batch_size) if asset_ids else 0,
+    }
+
+
+def save_assessment_submissions(submissions, barrier_effectiveness=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Validate and save many assets' assessments, and queue the recompute of their risk.
+
+    ``submissions`` is a list of submission dicts as described in the module
+    docstring; ``barrier_effectiveness`` optionally holds barrier scores
+    shared by all of them, as taken by parse_barrier_effectiveness. Raises
+    ValueError for invalid barrier scores.
+
+    Returns one result per submission, in order, and the queued recompute
+    job, or None when nothing was saved. A result holds the errors of an
+    invalid submission or of a batch that failed to save, in which case none
+    of its values were saved, or the number of values saved.
+    """
+    effectiveness = parse_barrier_effectiveness(barrier_effectiveness) if barrier_effectiveness else {}
+    valid, errors = validate_submissions(submissions)
+
+    if effectiveness:
+        with transaction.atomic():
+            _save_barrier_effectiveness(effectiveness, batch_size)
+
+    asset_ids = []
+    baseline_threats = set()
+    for batch in chunked(valid.items(), batch_size):
+        try:
+            with transaction.atomic():
+                saved_threats = _save_batch([submission for _, submission in batch], batch_size)
+        except DatabaseError as e:
+            for index, _ in batch:
+                errors[index] = [f"Could not save the assessment: {e}"]
+        else:
+            asset_ids.extend(submission['asset_id'] for _, submission in batch)
+            baseline_threats |= saved_threats
+
+    job = None
+    if asset_ids or effectiveness:
+        job = enqueue(RECOMPUTE_SUBMISSIONS, {
+            'asset_ids': asset_ids,
+            'baseline_threats': sorted(baseline_threats),
+            'barrier_scores': sorted(effectiveness),
+        })
+
+    results = []
+    for index, submission in enumerate(submissions):
+        if index in errors:
+            asset_id = submission.get('asset_id') if isinstance(submission, dict) else None
+            results.append({'asset_id': asset_id, 'success': False, 'errors': errors[index]})
+            continue
+        submission = valid[index]
+        results.append({
+            'asset_id': submission['asset_id'],
+            'success': True,
+            'saved': {
+                'bta': len(submission['bta']),
+                'scenario_answers': sum(len(answers) for answers in submission['scenario_answers'].values()),
+                **{kind: len(submission[kind]) for kind in QUESTIONNAIRES},
+            },
+        })
+    return results, job
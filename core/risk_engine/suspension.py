@@ -0,0 +1,104 @@
+"""
+Suspension of derived-data receivers for bulk data operations.
+
+Inside a suspended() block, the receivers that maintain derived data record
+what they would have done instead of doing it row by row:
+
+- baseline threat seeding for company-operated countries,
+- blank questionnaire answers for new questions,
+- asset criticality and vulnerability score updates,
+- materialized barrier effectiveness refreshes,
+- scenario answer dependency invalidations,
+- asset and matrix recomputes (through coalesced()).
+
+When the block exits normally the deferred work is replayed once, with
+set-based operations, in the order above, followed by a single consolidated
+recompute of every dirty asset. If the block raises, the deferred work is
+dropped.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from ..models.model_imports import get_model
+from .recompute import coalesced
+
+_local = threading.local()
+_replay_handlers = {}
+
+
+def replay_handler(kind):
+    """Register the function that replays the deferred items of ``kind``.
+
+    Handlers are replayed in registration order.
+    """
+    def register(func):
+        _replay_handlers[kind] = func
+        return func
+    return register
+
+
+def is_suspended():
+    return getattr(_local, 'deferred', None) is not None
+
+
+def defer(kind, items):
+    """Record items for the replay handler of ``kind``."""
+    if kind not in _replay_handlers:
+        raise ValueError(f"No replay handler for deferred {kind}")
+    _local.deferred.setdefault(kind, set()).update(items)
+
+
+@contextmanager
+def suspended():
+    """Defer derived-data receivers and replay them once at the end of the block."""
+    if is_suspended():
+        yield
+        return
+
+    with coalesced():
+        _local.deferred = {}
+        try:
+            yield
+        finally:
+            deferred = _local.deferred
+            _local.deferred = None
+
+        for kind, handler in _replay_handlers.items():
+            if deferred.get(kind):
+                handler(deferred[kind])
+
+
+@replay_handler('baseline_threats')
+def replay_baseline_threats(country_ids):
+    from .seeding import seed_baseline_threats
+    seed_baseline_threats(country_ids)
+
+
+@replay_handler('blank_answers')
+def replay_blank_answers(items):
+    """Items are (answer model name, question id) pairs"""
+    from .seeding import create_blank_answers
+    question_ids = {}
+    for model_name, question_id in items:
+        question_ids.setdefault(model_name, []).append(question_id)
+    for model_name, ids in question_ids.items():
+        create_blank_answers(get_model('core', model_name), ids)
+
+
+@replay_handler('asset_scores')
+def replay_asset_scores(asset_ids):
+    get_model('core', 'Asset').update_scores_bulk(asset_ids)
+
+
+@replay_handler('barrier_effectiveness')
+def replay_barrier_effectiveness(barrier_ids):
+    from .effectiveness import refresh_barrier_effectiveness
+    refresh_barrier_effectiveness(barrier_ids)
+
+
+@replay_handler('scenario_answers')
+def replay_scenario_answers(pairs):
+    from .dependencies import invalidate_scenario_answers
+    from .recompute import schedule_invalidation
+    schedule_invalidation(invalidate_scenario_answers(pairs))
@@ -1,3 +1,1437 @@
-from django.test import TestCase
+import json
+import random
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import StringIO
+from statistics import mean
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .management.commands import risk_worker
+from .middleware import CoalescedRecomputeMiddleware
+from .models.asset_models import (
+    Asset, AssetLink, AssetType, AssetVulnerabilityAnswer, AssetVulnerabilityQuestion
+)
+from .models.barrier_models import (
+    BarrierEffectivenessSnapshot,
+    Barrier, BarrierCategory, BarrierEffectivenessScore, BarrierIssueReport,
+    BarrierRiskEffectiveness
+)
+from .models.cache_models import TableChangeCounter
+from .models.geo_models import Continent, Country
+from .models.job_models import RiskJob
+from .models.log_models import RiskLog, RiskLogRollup
+from .models.risk_models import (
+    AssetScenarioAnswer, BaselineThreatAssessment, CurrentBaselineThreat, FinalRiskMatrix, QuestionChoice,
+    ResidualRiskDistribution, RiskScenarioAssessment, RiskSubtype, RiskType, Scenario,
+    ScenarioQuestion
+)
+from .risk_engine import coalesced, mark_assets_dirty, recompute_assessments, suspended
+from . import caching as caching_module
+from .risk_engine import recompute as recompute_module
+from .risk_engine import submissions as submissions_module
+from .risk_engine.assessments import create_missing_assessments
+from .risk_engine.bulk import generate_matrices_bulk, load_latest_bta_scores
+from .risk_engine.catalog import CATALOG_RECHECK_SECONDS, get_catalog, invalidate_catalog
+from .risk_engine.dependencies import (
+    BARRIER_PERFORMANCE, BASELINE_THREAT, get_invalidation_stats, invalidate_barriers,
+    invalidate_baseline_threat, invalidate_scenario_answers, recompute_invalidated,
+    reset_invalidation_stats
+)
+from .risk_engine.effectiveness import (
+    compute_barrier_effectiveness, load_effectiveness_history, refresh_barrier_effectiveness
+)
+from .risk_engine.jobs import (
+    JOB_HANDLERS, RECOMPUTE_ASSETS, RECOMPUTE_INVALIDATION, claim_jobs, enqueue_invalidation, execute_job,
+    release_leases
+)
+from .risk_engine.links import propagate_links
+from .risk_engine.montecarlo import sample_residual_risk, store_residual_risk_distribution
+from .risk_engine.optimizer import optimize_barriers
+from .risk_engine.rollups import rebuild_risk_log_rollups, resolution_for_timeframe
+from .risk_engine.scoring import residual_risk_scores
+from .risk_engine.seeding import create_blank_answers, seed_baseline_threats
+from .risk_engine.simulation import RiskModel
+from .risk_engine.suspension import is_suspended
+from .views.analysis_views import get_trend_analysis
+from .views.asset_views import get_asset_form_data, get_global_assets
+from .views.barrier_views import (
+    MAX_TREND_DAYS, get_barrier_assessments, get_barrier_trends, report_barrier_issue,
+)
+from .views.batch_views import batch_requests
+from .views.dashboard_views import get_dashboard_data, get_security_manager_data
+from .views.export_views import export_dataset
+from .views.risk_views import save_risk_assessments_bulk
+
+
+class RiskFixtureMixin:
+    """Small but complete risk model: two countries, two assets, shared barriers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        continent = Continent.objects.create(name='Europe')
+        cls.country = Country.objects.create(name='Norway', code='NOR', continent=continent)
+        cls.other_country = Country.objects.create(name='Sweden', code='SWE', continent=continent)
+
+        cls.crime = RiskType.objects.create(name='Crime')
+        cls.cyber = RiskType.objects.create(name='Cyber')
+        robbery = RiskSubtype.objects.create(name='Robbery', description='', risk_type=cls.crime)
+        burglary = RiskSubtype.objects.create(name='Burglary', description='', risk_type=cls.crime)
+        breach = RiskSubtype.objects.create(name='Network Breach', description='', risk_type=cls.cyber)
+
+        category = BarrierCategory.objects.create(name='Physical Security')
+        cls.fence = Barrier.objects.create(name='Fence', description='', category=category)
+        cls.fence.risk_types.add(cls.crime)
+        cls.fence.risk_subtypes.add(burglary)
+        cls.firewall = Barrier.objects.create(
+            name='Firewall', description='', category=category, performance_adjustment=0.8
+        )
+        cls.firewall.risk_types.add(cls.cyber)
+        cls.firewall.risk_subtypes.add(breach)
+        for barrier, risk_type, subtype, capability in [
+            (cls.fence, cls.crime, None, 6),
+            (cls.fence, cls.crime, burglary, 8),
+            (cls.firewall, cls.cyber, None, 7),
+            (cls.firewall, cls.cyber, breach, 9),
+        ]:
+            BarrierEffectivenessScore.objects.create(
+                barrier=barrier, risk_type=risk_type, risk_subtype=subtype,
+                preventive_capability=capability, detection_capability=capability,
+                response_capability=capability, reliability=capability, coverage=capability,
+            )
+
+        # Break-in covers two crime subtypes, so it counts twice towards crime
+        break_in = Scenario.objects.create(name='Break-in', description='')
+        break_in.risk_subtypes.add(robbery, burglary)
+        break_in.barriers.add(cls.fence)
+        intrusion = Scenario.objects.create(name='Intrusion', description='')
+        intrusion.risk_subtypes.add(breach)
+        intrusion.barriers.add(cls.firewall, cls.fence)
+
+        asset_type = AssetType.objects.create(name='Office')
+        cls.assets = []
+        for name, country in [('HQ', cls.country), ('Depot', cls.other_country)]:
+            asset = Asset.objects.create(
+                name=name, description='', latitude=0, longitude=0,
+                asset_type=asset_type, country=country,
+            )
+            asset.barriers.add(cls.fence, cls.firewall)
+            asset.scenarios.add(break_in, intrusion)
+            for scenario in (break_in, intrusion):
+                RiskScenarioAssessment.objects.create(
+                    asset=asset, scenario=scenario, residual_risk_score=1,
+                    likelihood_score=1, impact_score=1, vulnerability_score=1,
+                )
+            cls.assets.append(asset)
+
+        BaselineThreatAssessment.objects.create(
+            risk_type=cls.crime, country=cls.country, baseline_score=4, date_assessed='2024-01-01'
+        )
+        BaselineThreatAssessment.objects.create(
+            risk_type=cls.crime, country=cls.country, baseline_score=7, date_assessed='2024-06-01'
+        )
+
+    def setUp(self):
+        super().setUp()
+        # Rolled back taxonomy changes send no signals
+        invalidate_catalog()
+        self.api_user = None
+
+    def api_get(self, view, path, data=None, headers=None, **kwargs):
+        """Response of ``view`` to an authenticated GET of ``path``.
+
+        ``headers`` are passed as request META, e.g. HTTP_IF_NONE_MATCH;
+        ``kwargs`` are the view's URL arguments.
+        """
+        return self.call_api(view, APIRequestFactory().get(path, data, **(headers or {})), **kwargs)
+
+    def api_post(self, view, path, data=None, **kwargs):
+        """Response of ``view`` to an authenticated JSON POST of ``data`` to ``path``."""
+        return self.call_api(view, APIRequestFactory().post(path, data, format='json'), **kwargs)
+
+    def call_api(self, view, request, **kwargs):
+        if self.api_user is None:
+            self.api_user = get_user_model().objects.create(username='analyst')
+        force_authenticate(request, user=self.api_user)
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def matrix_snapshot(self):
+        snapshot = {}
+        for matrix in FinalRiskMatrix.objects.all():
+            details = dict(matrix.sub_risk_details)
+            details['scenario_assessments'] = sorted(
+                details['scenario_assessments'], key=lambda a: a['scenario']
+            )
+            snapshot[(matrix.asset_id, matrix.risk_type_id)] = (
+                round(matrix.residual_risk_score, 9), matrix.risk_level,
+                details, matrix.barrier_details,
+            )
+        return snapshot
+
+
+class GenerateMatricesBulkTests(RiskFixtureMixin, TestCase):
+
+    def test_bulk_engine_matches_per_asset_path(self):
+        for asset in self.assets:
+            FinalRiskMatrix.generate_matrices(asset)
+        expected = self.matrix_snapshot()
+        FinalRiskMatrix.objects.all().delete()
+
+        stats = FinalRiskMatrix.generate_matrices_bulk(Asset.objects.all(), batch_size=1)
+
+        self.assertEqual(stats, {'created': 4, 'updated': 0})
+        self.assertEqual(self.matrix_snapshot(), expected)
+
+    def test_bulk_engine_updates_existing_matrices(self):
+        FinalRiskMatrix.generate_matrices_bulk(Asset.objects.all())
+        BaselineThreatAssessment.objects.create(
+            risk_type=self.crime, country=self.country, baseline_score=2, date_assessed='2024-09-01'
+        )
+
+        stats = FinalRiskMatrix.generate_matrices_bulk(Asset.objects.all())
+        bulk = self.matrix_snapshot()
+        for asset in self.assets:
+            FinalRiskMatrix.generate_matrices(asset)
+
+        self.assertEqual(stats, {'created': 0, 'updated': 4})
+        self.assertEqual(FinalRiskMatrix.objects.count(), 4)
+        self.assertEqual(self.matrix_snapshot(), bulk)
+
+
+def scalar_residual_risk(likelihood, impact, vulnerability, barrier_effectiveness):
+    """The original per-row formula from RiskScenarioAssessment.calculate_scores."""
+    base_risk = (likelihood * impact * vulnerability) ** (1/3)
+    if barrier_effectiveness:
+        return base_risk / (1 + mean(barrier_effectiveness.values()))
+    return base_risk
+
+
+class ResidualRiskKernelTests(SimpleTestCase):
+
+    def test_kernel_matches_scalar_formula(self):
+        rng = random.Random(42)
+        rows = []
+        for _ in range(2000):
+            effectiveness = {
+                str(barrier_id): round(rng.uniform(0, 10), 2)
+                for barrier_id in range(rng.randint(0, 6))
+            }
+            rows.append((
+                round(rng.uniform(1, 10), 2), round(rng.uniform(1, 10), 2),
+                round(rng.uniform(1, 10), 2), effectiveness,
+            ))
+
+        scores = residual_risk_scores(
+            [row[0] for row in rows], [row[1] for row in rows],
+            [row[2] for row in rows], [row[3] for row in rows],
+        )
+
+        self.assertEqual(len(scores), len(rows))
+        for row, score in zip(rows, scores):
+            self.assertAlmostEqual(score, scalar_residual_risk(*row), places=12)
+
+    def test_kernel_handles_empty_input(self):
+        self.assertEqual(len(residual_risk_scores([], [], [], [])), 0)
+
+
+class RecomputeAssessmentsTests(RiskFixtureMixin, TestCase):
+
+    def test_bulk_recompute_matches_save(self):
+        expected = {}
+        for assessment in RiskScenarioAssessment.objects.all():
+            assessment.save()
+            expected[assessment.id] = (
+                assessment.likelihood_score, assessment.residual_risk_score,
+                assessment.barrier_effectiveness,
+            )
+        RiskScenarioAssessment.objects.update(residual_risk_score=1, barrier_effectiveness={})
+
+        updated = recompute_assessments(RiskScenarioAssessment.objects.all())
+
+        self.assertEqual(updated, len(expected))
+        for assessment in RiskScenarioAssessment.objects.all():
+            likelihood, residual, effectiveness = expected[assessment.id]
+            self.assertEqual(assessment.likelihood_score, likelihood)
+            self.assertAlmostEqual(assessment.residual_risk_score, residual, places=12)
+            self.assertEqual(assessment.barrier_effectiveness, effectiveness)
+
+
+class BarrierRiskEffectivenessTests(RiskFixtureMixin, TestCase):
+
+    def materialized(self):
+        return {
+            (row.barrier_id, row.risk_type_id): row.effectiveness_score
+            for row in BarrierRiskEffectiveness.objects.all()
+        }
+
+    def assertMaterializedMatchesSource(self):
+        expected = {
+            key: effectiveness_score for key, (_, effectiveness_score)
+            in compute_barrier_effectiveness(Barrier.objects.values_list('id', flat=True)).items()
+        }
+        self.assertEqual(self.materialized(), expected)
+
+    def test_rows_follow_scores_and_performance(self):
+        self.assertEqual(self.materialized(), {
+            (self.fence.id, self.crime.id): 8.0,
+            (self.firewall.id, self.cyber.id): 7.2,
+        })
+
+        self.firewall.performance_adjustment = 0.5
+        self.firewall.save()
+        score = BarrierEffectivenessScore.objects.get(barrier=self.fence, risk_subtype__isnull=False)
+        score.delete()
+
+        self.assertEqual(self.fence.get_risk_category_effectiveness_score(self.crime), 6.0)
+        self.assertEqual(self.firewall.get_risk_category_effectiveness_score(self.cyber.id), 4.5)
+        self.assertMaterializedMatchesSource()
+
+    def test_rows_follow_risk_associations(self):
+        self.fence.risk_types.remove(self.crime)
+        self.assertEqual(self.fence.get_risk_category_effectiveness_score(self.crime), 8.0)
+
+        self.crime.barriers.clear()
+        self.fence.risk_subtypes.clear()
+        self.assertEqual(self.fence.get_risk_category_effectiveness_score(self.crime), 0)
+
+        self.cyber.barriers.add(self.fence)
+        self.assertMaterializedMatchesSource()
+
+
+class DependencyTrackingTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_invalidation_stats()
+        self.hq, self.depot = self.assets
+
+    def test_baseline_threat_invalidates_country_cells(self):
+        invalidation = invalidate_baseline_threat(self.country.id, [self.crime.id])
+
+        self.assertEqual(invalidation.assessment_ids, set())
+        self.assertEqual(invalidation.cells, {(self.hq.id, self.crime.id)})
+
+    def test_barrier_scores_invalidate_risk_type_cells(self):
+        invalidation = invalidate_barriers([self.firewall.id], risk_type_ids=[self.cyber.id])
+
+        self.assertEqual(
+            invalidation.assessment_ids,
+            set(RiskScenarioAssessment.objects.filter(
+                scenario__name='Intrusion'
+            ).values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            invalidation.cells, {(self.hq.id, self.cyber.id), (self.depot.id, self.cyber.id)}
+        )
+
+    def test_scenario_answer_invalidates_its_assessment(self):
+        assessment = RiskScenarioAssessment.objects.get(asset=self.hq, scenario__name='Break-in')
+
+        invalidation = invalidate_scenario_answers([(self.hq.id, assessment.scenario_id)])
+
+        self.assertEqual(invalidation.assessment_ids, {assessment.id})
+        self.assertEqual(invalidation.cells, {(self.hq.id, self.crime.id)})
+
+    def test_recompute_matches_full_recompute_and_counts(self):
+        FinalRiskMatrix.generate_matrices_bulk(Asset.objects.all())
+        self.fence.adjust_performance('MAJOR')
+
+        recompute_invalidated(invalidate_barriers([self.fence.id], kind=BARRIER_PERFORMANCE))
+        incremental = self.matrix_snapshot()
+        for assessment in RiskScenarioAssessment.objects.all():
+            assessment.save()
+        for asset in self.assets:
+            FinalRiskMatrix.generate_matrices(asset)
+
+        self.assertEqual(self.matrix_snapshot(), incremental)
+        stats = get_invalidation_stats()[BARRIER_PERFORMANCE]
+        self.assertEqual((stats['changes'], stats['assessments'], stats['cells']), (1, 4, 4))
+
+
+class CoalescedRecomputeTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The fixture's marks are scheduled on the class-wide transaction, which never commits
+        recompute_module._local.pending = None
+
+    def test_saves_in_a_transaction_recompute_each_asset_once(self):
+        hq = self.assets[0]
+        with mock.patch.object(
+            recompute_module, 'generate_matrices_bulk', wraps=recompute_module.generate_matrices_bulk
+        ) as generate:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                hq.save()
+                hq.save()
+                hq.barriers.remove(self.firewall)
+                issue = BarrierIssueReport.objects.create(barrier=self.fence, description='')
+                issue.affected_assets.add(hq)
+                self.assertEqual(generate.call_count, 0)
+
+        self.assertEqual(len(callbacks), 1)
+        generate.assert_called_once_with([hq.id])
+        self.assertEqual(
+            set(FinalRiskMatrix.objects.get(asset=hq, risk_type=self.cyber).barrier_details),
+            {'Fence'},
+        )
+
+    def test_new_asset_gets_assessments_and_matrices(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            asset = Asset.objects.create(
+                name='Annex', description='', latitude=0, longitude=0,
+                asset_type=self.assets[0].asset_type, country=self.country,
+            )
+            asset.barriers.add(self.fence)
+            asset.scenarios.set(Scenario.objects.all())
+        coalesced_snapshot = self.matrix_snapshot()
+
+        for assessment in RiskScenarioAssessment.objects.filter(asset=asset):
+            assessment.save()
+        FinalRiskMatrix.generate_matrices(asset)
+
+        self.assertEqual(RiskScenarioAssessment.objects.filter(asset=asset).count(), 2)
+        self.assertEqual(FinalRiskMatrix.objects.filter(asset=asset).count(), 2)
+        self.assertEqual(self.matrix_snapshot(), coalesced_snapshot)
+
+    def test_rolled_back_marks_are_dropped(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    mark_assets_dirty([self.assets[0].id])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with coalesced():
+                mark_assets_dirty([self.assets[1].id])
+                mark_assets_dirty([self.assets[1].id])
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(callbacks[0].__self__.asset_ids, {self.assets[1].id})
+
+
+    def test_failed_request_flush_is_queued_as_a_job(self):
+        hq = self.assets[0]
+
+        def view(request):
+            mark_assets_dirty([hq.id])
+            return HttpResponse('saved')
+
+        with mock.patch.object(
+            recompute_module.PendingRecompute, 'flush', side_effect=OperationalError('database is locked')
+        ), self.assertLogs('core.risk_engine.recompute', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = CoalescedRecomputeMiddleware(view)(APIRequestFactory().post('/api/assets/'))
+
+        self.assertEqual(response.content, b'saved')
+        job = RiskJob.objects.get(kind=RECOMPUTE_ASSETS)
+        self.assertEqual(job.payload['asset_ids'], [hq.id])
+
+class RiskJobTests(RiskFixtureMixin, TestCase):
+
+    def test_claims_are_exclusive_until_the_lease_expires(self):
+        job = enqueue_invalidation(BASELINE_THREAT, country_id=self.country.id, risk_type_ids=[self.crime.id])
+
+        self.assertEqual(claim_jobs('worker-a', 5), [job.id])
+        self.assertEqual(claim_jobs('worker-b', 5), [])
+
+        RiskJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs('worker-b', 5), [job.id])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lease_owner, job.attempts), ('RUNNING', 'worker-b', 2))
+
+    def test_executed_job_recomputes_invalidated_cells(self):
+        job = enqueue_invalidation(BARRIER_PERFORMANCE, barrier_ids=[self.firewall.id])
+        # Only the changed barrier is stored; its dependents are looked up by the job
+        self.assertEqual(job.payload, {'kind': BARRIER_PERFORMANCE, 'barrier_ids': [self.firewall.id]})
+        claim_jobs('worker', 1)
+
+        self.assertEqual(execute_job(job.id, 'worker'), 'SUCCEEDED')
+
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'assessments': 2, 'cells': 4})
+        self.assertEqual(FinalRiskMatrix.objects.count(), 4)
+        self.assertIsNone(job.lease_expires_at)
+
+    def test_worker_releases_its_jobs_when_the_pool_breaks(self):
+        job = enqueue_invalidation(BASELINE_THREAT, country_id=self.country.id, risk_type_ids=[self.crime.id])
+        pools = []
+
+        class BrokenPool:
+            def submit(self, *args):
+                raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+
+            def shutdown(self, **kwargs):
+                pass
+
+        def create_pool(command, processes):
+            pools.append(BrokenPool())
+            return pools[-1]
+
+        with mock.patch.object(risk_worker.Command, '_create_pool', create_pool):
+            call_command('risk_worker', once=True, poll_interval=0.01, stdout=StringIO(), stderr=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(len(pools), 2)
+        self.assertEqual((job.status, job.lease_owner, job.attempts), ('PENDING', '', 1))
+        self.assertGreater(job.run_after, timezone.now())
+
+        RiskJob.objects.filter(id=job.id).update(max_attempts=1, run_after=timezone.now())
+        claim_jobs('worker', 1)
+        release_leases('worker', [job.id])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+
+    def test_barrier_issue_blends_linked_assets_after_the_recompute(self):
+        hq, depot = self.assets
+        break_in = Scenario.objects.get(name='Break-in')
+        question = ScenarioQuestion.objects.create(
+            scenario=break_in, text='Likelihood', question_type='LIKELIHOOD', weight=1.0
+        )
+        choice = QuestionChoice.objects.create(question=question, text='9', score=9)
+        AssetScenarioAnswer.objects.create(asset=hq, scenario=break_in, question=question, selected_choice=choice)
+        link = AssetLink.objects.create(name='HQ-Depot')
+        link.assets.add(hq, depot)
+        link.shared_risks.add(self.crime)
+        link.shared_barriers.add(self.fence)
+        response = self.api_post(report_barrier_issue, '/api/barriers/report-issue/', {
+            'barrier_id': self.fence.id, 'description': 'Cut', 'impact_rating': 'MAJOR',
+        })
+
+        job = RiskJob.objects.get(id=json.loads(response.content)['job_id'])
+
+        def likelihoods():
+            return dict(RiskScenarioAssessment.objects.filter(
+                scenario=break_in
+            ).values_list('asset_id', 'likelihood_score'))
+
+        self.assertEqual(job.payload['link_ids'], [link.id])
+        self.assertEqual(likelihoods(), {hq.id: 5, depot.id: 5})
+        claim_jobs('worker', 1)
+        self.assertEqual(execute_job(job.id, 'worker'), 'SUCCEEDED')
+        job.refresh_from_db()
+        self.assertEqual(job.result['links']['components'], 1)
+        self.assertEqual(likelihoods(), {hq.id: 7.8, depot.id: 6.2})
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        job = enqueue_invalidation(BASELINE_THREAT, country_id=self.country.id, risk_type_ids=[self.crime.id])
+        RiskJob.objects.filter(id=job.id).update(max_attempts=2)
+
+        def fail(**payload):
+            raise RuntimeError('boom')
+
+        with mock.patch.dict(JOB_HANDLERS, {RECOMPUTE_INVALIDATION: fail}), \
+                self.assertLogs('core.risk_engine.jobs', 'ERROR'):
+            claim_jobs('worker', 1)
+            self.assertEqual(execute_job(job.id, 'worker'), 'PENDING')
+            job.refresh_from_db()
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertEqual(claim_jobs('worker', 1), [])
+
+            RiskJob.objects.filter(id=job.id).update(run_after=timezone.now())
+            claim_jobs('worker', 1)
+            self.assertEqual(execute_job(job.id, 'worker'), 'FAILED')
+
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('boom', job.last_error)
+
+
+class BulkSaveAnswersTests(RiskFixtureMixin, TestCase):
+
+    def create_question(self, text):
+        fields = {}
+        for index, score in enumerate([2, 4, 6, 8, 10], start=1):
+            fields[f'choice{index}'] = f'Option {index}'
+            fields[f'score{index}'] = score
+        return AssetVulnerabilityQuestion.objects.create(
+            question_text=text, risk_type=self.crime, **fields
+        )
+
+    def test_answers_are_scored_and_asset_updated_once(self):
+        hq = self.assets[0]
+        questions = [self.create_question(f'Question {index}') for index in range(3)]
+        AssetVulnerabilityAnswer.objects.filter(asset=hq, question=questions[0]).delete()
+
+        with mock.patch.object(Asset, 'update_scores', autospec=True,
+                               side_effect=Asset.update_scores) as update_scores:
+            stats = AssetVulnerabilityAnswer.bulk_save_answers(hq, {
+                str(questions[0].id): 'Option 5',
+                questions[1].id: 'Option 3',
+                questions[2].id: 'Option 3',
+            })
+
+        self.assertEqual(stats, {'created': 1, 'updated': 2})
+        update_scores.assert_called_once()
+        self.assertEqual(
+            dict(hq.asset_vulnerability_answers.values_list('question_id', 'selected_score')),
+            {questions[0].id: 10, questions[1].id: 6, questions[2].id: 6},
+        )
+        hq.refresh_from_db()
+        self.assertEqual(hq.vulnerability_score, 7)
+
+    def test_unknown_choice_is_rejected(self):
+        question = self.create_question('Question')
+
+        with self.assertRaises(ValueError):
+            AssetVulnerabilityAnswer.bulk_save_answers(self.assets[0], {question.id: 'Option 9'})
+
+
+class SuspendedReceiversTests(RiskFixtureMixin, TestCase):
+
+    create_question = BulkSaveAnswersTests.create_question
+
+    def setUp(self):
+        super().setUp()
+        recompute_module._local.pending = None
+
+    def test_suspended_block_replays_once_and_matches_live_path(self):
+        hq, depot = self.assets
+        live_question = self.create_question('Live question')
+        AssetVulnerabilityAnswer.objects.filter(asset=depot, question=live_question).update(
+            selected_choice='Option 4', selected_score=8
+        )
+        depot.update_scores()
+
+        with mock.patch.object(Asset, 'update_scores', autospec=True) as update_scores, \
+                mock.patch.object(recompute_module, 'generate_matrices_bulk',
+                                  wraps=recompute_module.generate_matrices_bulk) as generate:
+            with self.captureOnCommitCallbacks(execute=True), suspended():
+                questions = [self.create_question(f'Question {index}') for index in range(3)]
+                self.assertFalse(AssetVulnerabilityAnswer.objects.filter(question__in=questions).exists())
+                for question, choice in zip(questions, ['Option 2', 'Option 5', 'Option 5']):
+                    AssetVulnerabilityAnswer.objects.filter(asset=hq, question=question).delete()
+                    AssetVulnerabilityAnswer.objects.create(asset=hq, question=question, selected_choice=choice)
+
+        update_scores.assert_not_called()
+        generate.assert_called_once()
+        self.assertEqual(
+            AssetVulnerabilityAnswer.objects.filter(question__in=questions).count(), 2 * len(questions)
+        )
+        hq.refresh_from_db()
+        depot.refresh_from_db()
+        self.assertEqual(hq.vulnerability_score, hq.calculate_vulnerability_score())
+        self.assertEqual(hq.vulnerability_score, 8)
+        self.assertEqual(depot.vulnerability_score, 8)
+
+    def test_suspended_block_drops_deferred_work_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with suspended():
+                question = self.create_question('Question')
+                raise RuntimeError
+
+        self.assertFalse(AssetVulnerabilityAnswer.objects.filter(question=question).exists())
+        self.assertFalse(is_suspended())
+
+
+class SeedingTests(RiskFixtureMixin, TestCase):
+
+    def test_blank_answers_are_created_only_where_missing(self):
+        question = BulkSaveAnswersTests.create_question(self, 'Question')
+        AssetVulnerabilityAnswer.objects.filter(question=question, asset=self.assets[0]).delete()
+
+        created = create_blank_answers(AssetVulnerabilityAnswer, [question.id], batch_size=1)
+
+        self.assertEqual(created, 1)
+        self.assertEqual(
+            sorted(AssetVulnerabilityAnswer.objects.filter(question=question).values_list('asset_id', flat=True)),
+            sorted(asset.id for asset in self.assets),
+        )
+
+    def test_baseline_threats_are_seeded_for_operated_countries_only(self):
+        Country.objects.filter(id=self.country.id).update(company_operated=True)
+
+        created = seed_baseline_threats([self.country.id, self.other_country.id], batch_size=1)
+
+        # The country already had crime assessments, so only cyber is missing
+        self.assertEqual(created, 1)
+        self.assertEqual(seed_baseline_threats([self.country.id]), 0)
+        self.assertTrue(BaselineThreatAssessment.objects.filter(
+            country=self.country, risk_type=self.cyber, baseline_score=5
+        ).exists())
+        self.assertFalse(BaselineThreatAssessment.objects.filter(country=self.other_country).exists())
+
+
+class WeightedScoresTests(RiskFixtureMixin, TestCase):
+
+    def answer(self, asset, scenario, question_type, weight, score):
+        question = ScenarioQuestion.objects.create(
+            scenario=scenario, text=f'{question_type} {weight}', question_type=question_type, weight=weight
+        )
+        choice = QuestionChoice.objects.create(question=question, text=str(score), score=score)
+        AssetScenarioAnswer.objects.create(asset=asset, scenario=scenario, question=question, selected_choice=choice)
+
+    def test_weighted_scores_are_aggregated_per_pair_in_one_query(self):
+        hq, depot = self.assets
+        break_in = Scenario.objects.get(name='Break-in')
+        intrusion = Scenario.objects.get(name='Intrusion')
+        self.answer(hq, break_in, 'LIKELIHOOD', 2.0, 9)
+        self.answer(hq, break_in, 'LIKELIHOOD', 1.0, 3)
+        self.answer(hq, break_in, 'IMPACT', 0.5, 4)
+        self.answer(depot, break_in, 'VULNERABILITY', 3.0, 8)
+
+        with self.assertNumQueries(1):
+            scores = RiskScenarioAssessment.weighted_scores_bulk(
+                [(hq.id, break_in.id), (depot.id, break_in.id), (hq.id, intrusion.id)]
+            )
+
+        self.assertEqual(scores, {
+            (hq.id, break_in.id): {'likelihood_score': 7.0, 'impact_score': 4.0, 'vulnerability_score': 5},
+            (depot.id, break_in.id): {'likelihood_score': 5, 'impact_score': 5, 'vulnerability_score': 8.0},
+            (hq.id, intrusion.id): {'likelihood_score': 5, 'impact_score': 5, 'vulnerability_score': 5},
+        })
+        assessment = RiskScenarioAssessment.objects.get(asset=hq, scenario=break_in)
+        assessment.calculate_scores()
+        self.assertEqual((assessment.likelihood_score, assessment.impact_score), (7.0, 4.0))
+
+
+class ScenarioCatalogTests(RiskFixtureMixin, TestCase):
+
+    def test_catalog_follows_taxonomy_changes(self):
+        break_in = Scenario.objects.get(name='Break-in')
+        catalog = get_catalog()
+        self.assertEqual(catalog.applicable_barriers(break_in.id), [self.fence.id])
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalog(), catalog)
+
+        # m2m_changed drops the catalog right away
+        break_in.barriers.add(self.firewall)
+        self.firewall.risk_types.add(self.crime)
+        self.assertEqual(
+            sorted(get_catalog().applicable_barriers(break_in.id)), [self.fence.id, self.firewall.id]
+        )
+
+        # Changes that bypass signals, e.g. from another process, change the
+        # fingerprint, which is checked again once the catalog is old enough
+        catalog = get_catalog()
+        Scenario.risk_subtypes.through.objects.filter(scenario=break_in).delete()
+        self.assertIs(get_catalog(), catalog)
+        catalog.checked_at -= CATALOG_RECHECK_SECONDS
+        self.assertIsNot(get_catalog(), catalog)
+        self.assertEqual(get_catalog().applicable_barriers(break_in.id), [])
+
+
+class LinkPropagationTests(RiskFixtureMixin, TestCase):
+
+    def test_overlapping_and_cyclic_links_blend_each_asset_once(self):
+        hq, depot = self.assets
+        annex = Asset.objects.create(
+            name='Annex', description='', latitude=0, longitude=0,
+            asset_type=hq.asset_type, country=self.country,
+        )
+        annex.scenarios.add(*hq.scenarios.all())
+        create_missing_assessments([annex.id])
+        for asset, score, effectiveness in [
+            (hq, 2, {str(self.fence.id): 0.4}), (depot, 4, {}), (annex, 8, {str(self.fence.id): 0.8}),
+        ]:
+            RiskScenarioAssessment.objects.filter(asset=asset).update(
+                likelihood_score=score, impact_score=score, vulnerability_score=1,
+                barrier_effectiveness=effectiveness,
+            )
+        for name, assets, shared_risk, shared_barrier in [
+            ('HQ-Depot', [hq, depot], self.crime, None),
+            ('Depot-Annex', [depot, annex], self.crime, None),
+            ('Annex-HQ', [annex, hq], None, self.fence),
+        ]:
+            link = AssetLink.objects.create(name=name)
+            link.assets.add(*assets)
+            if shared_risk:
+                link.shared_risks.add(shared_risk)
+            if shared_barrier:
+                link.shared_barriers.add(shared_barrier)
+
+        stats = propagate_links(asset_ids=[hq.id])
+
+        self.assertEqual(stats, {'components': 1, 'assets': 3, 'assessments': 5})
+        scores = {
+            (a.asset_id, a.scenario.name): (a.likelihood_score, a.barrier_effectiveness)
+            for a in RiskScenarioAssessment.objects.select_related('scenario')
+        }
+        fence = str(self.fence.id)
+        self.assertEqual(scores[(hq.id, 'Break-in')], (2.6, {fence: 0.52}))
+        self.assertEqual(scores[(hq.id, 'Intrusion')], (2, {fence: 0.52}))
+        self.assertEqual(scores[(depot.id, 'Break-in')], (4.3, {}))
+        self.assertEqual(scores[(depot.id, 'Intrusion')], (4, {}))
+        self.assertEqual(scores[(annex.id, 'Break-in')], (6.8, {fence: 0.68}))
+
+
+class RiskSimulationTests(RiskFixtureMixin, TestCase):
+
+    def recompute_all(self):
+        recompute_assessments(RiskScenarioAssessment.objects.all())
+        FinalRiskMatrix.generate_matrices_bulk(Asset.objects.all())
+        return {
+            (matrix.asset_id, matrix.risk_type_id): matrix.residual_risk_score
+            for matrix in FinalRiskMatrix.objects.all()
+        }
+
+    def test_simulation_matches_recompute_after_the_change(self):
+        before = self.recompute_all()
+        model = RiskModel()
+        self.assertEqual(
+            dict(zip(model.cells, model.evaluate().round(9))),
+            {cell: round(score, 9) for cell, score in before.items()},
+        )
+
+        cells = model.simulate(
+            performance={self.fence.id: 0.6},
+            baseline_threats={(self.other_country.id, self.cyber.id): 8},
+        )
+        # Nothing is written
+        self.assertEqual({
+            (matrix.asset_id, matrix.risk_type_id): matrix.residual_risk_score
+            for matrix in FinalRiskMatrix.objects.all()
+        }, before)
+
+        Barrier.objects.filter(id=self.fence.id).update(performance_adjustment=0.6)
+        refresh_barrier_effectiveness([self.fence.id])
+        BaselineThreatAssessment.objects.create(
+            risk_type=self.cyber, country=self.other_country, baseline_score=8
+        )
+        after = self.recompute_all()
+        changed = {cell: score for cell, score in after.items() if abs(score - before[cell]) > 1e-9}
+        self.assertEqual(
+            {(cell['asset_id'], cell['risk_type_id']): round(cell['after']['residual_risk_score'], 9)
+             for cell in cells},
+            {cell: round(score, 9) for cell, score in changed.items()},
+        )
+
+
+class MonteCarloTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        recompute_assessments(RiskScenarioAssessment.objects.all())
+
+    def test_zero_spread_reproduces_the_point_estimate(self):
+        model = RiskModel()
+        spread = dict.fromkeys(
+            ['likelihood', 'impact', 'vulnerability', 'barrier_effectiveness', 'baseline_threat'], 0
+        )
+        samples = sample_residual_risk(
+            model, draws=3, rng=np.random.default_rng(1), spread=spread,
+            performance={self.fence.id: 0.5},
+        )
+        for row in samples:
+            np.testing.assert_allclose(row, model.evaluate({self.fence.id: 0.5}))
+
+    def test_stored_distributions_are_seeded_and_ordered(self):
+        asset_ids = [asset.id for asset in self.assets]
+        self.assertEqual(store_residual_risk_distribution(asset_ids, draws=200, seed=7), 4)
+        first = list(ResidualRiskDistribution.objects.order_by('asset_id', 'risk_type_id').values(
+            'asset_id', 'risk_type_id', 'mean', 'p5', 'p50', 'p95'
+        ))
+        store_residual_risk_distribution(asset_ids, draws=200, seed=7)
+        second = list(ResidualRiskDistribution.objects.order_by('asset_id', 'risk_type_id').values(
+            'asset_id', 'risk_type_id', 'mean', 'p5', 'p50', 'p95'
+        ))
+        self.assertEqual(first, second)
+        for row in first:
+            self.assertLessEqual(row['p5'], row['p50'])
+            self.assertLessEqual(row['p50'], row['p95'])
+            self.assertLess(row['p5'], row['p95'])
+
+
+class BarrierOptimizerTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        recompute_assessments(RiskScenarioAssessment.objects.all())
+
+    def test_incremental_reductions_match_full_evaluation(self):
+        Barrier.objects.filter(id=self.fence.id).update(performance_adjustment=0.5)
+        refresh_barrier_effectiveness([self.fence.id])
+        plan = optimize_barriers(max_upgrades=4, costs={self.fence.id: 2})
+
+        self.assertEqual(len(plan['upgrades']), 4)
+        self.assertTrue(all(upgrade['risk_reduction'] > 0 for upgrade in plan['upgrades']))
+        model = RiskModel()
+        self.assertAlmostEqual(plan['total_before'], model.evaluate().sum())
+        self.assertAlmostEqual(plan['total_after'], model.evaluate(plan['performance']).sum())
+
+    def test_budget_limits_the_plan(self):
+        plan = optimize_barriers(budget=1.5, costs={self.firewall.id: 1})
+        self.assertEqual(plan['upgrades'], [{
+            'barrier_id': self.firewall.id, 'performance_before': 0.8, 'performance_after': 0.9,
+            'cost': 1, 'risk_reduction': plan['upgrades'][0]['risk_reduction'],
+        }])
+        self.assertEqual(optimize_barriers(budget=0.5)['upgrades'], [])
+
+
+class RiskLogRollupTests(RiskFixtureMixin, TestCase):
+
+    def log(self, residual_risk_score, timestamp):
+        log = RiskLog.objects.create(
+            asset=self.assets[0], risk_type=self.crime, bta_score=7, vulnerability_score=3,
+            criticality_score=4, residual_risk_score=residual_risk_score,
+        )
+        # timestamp is auto_now_add; tests backdate it and rebuild the rollups
+        RiskLog.objects.filter(id=log.id).update(timestamp=timestamp)
+        return log
+
+    def snapshot(self):
+        return {
+            (rollup.resolution, rollup.bucket_start): (
+                rollup.count, rollup.residual_risk_score_min, rollup.residual_risk_score_max,
+                rollup.average('residual_risk_score'), rollup.residual_risk_score_last,
+            )
+            for rollup in RiskLogRollup.objects.all()
+        }
+
+    def test_rollups_are_maintained_on_write(self):
+        for score in (5, 2, 6):
+            RiskLog.objects.create(
+                asset=self.assets[0], risk_type=self.crime, bta_score=7, vulnerability_score=3,
+                criticality_score=4, residual_risk_score=score,
+            )
+        incremental = self.snapshot()
+        self.assertEqual(len(incremental), 3)
+        for rollup in incremental.values():
+            self.assertEqual(rollup, (3, 2, 6, 13 / 3, 6))
+
+        rebuild_risk_log_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_buckets_by_day_week_and_month(self):
+        for score, timestamp in [
+            (2, '2024-01-29T08:00Z'),  # Monday
+            (6, '2024-01-31T08:00Z'),
+            (4, '2024-01-31T09:00Z'),
+            (8, '2024-02-02T08:00Z'),
+        ]:
+            self.log(score, timestamp)
+        self.assertEqual(rebuild_risk_log_rollups(), {'logs': 4, 'rollups': 6})
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot[('DAY', timezone.datetime(2024, 1, 31).date())], (2, 4, 6, 5, 4))
+        self.assertEqual(snapshot[('WEEK', timezone.datetime(2024, 1, 29).date())], (4, 2, 8, 5, 8))
+        self.assertEqual(snapshot[('MONTH', timezone.datetime(2024, 1, 1).date())], (3, 2, 6, 4, 4))
+        self.assertEqual(snapshot[('MONTH', timezone.datetime(2024, 2, 1).date())], (1, 8, 8, 8, 8))
+
+    def test_trend_summary_covers_the_timeframe_only(self):
+        self.log(2, '2024-05-16T08:00Z')
+        self.log(6, '2024-06-01T08:00Z')
+        rebuild_risk_log_rollups()
+
+        now = timezone.datetime(2024, 6, 15, 12, tzinfo=timezone.get_current_timezone())
+        with mock.patch('core.views.analysis_views.timezone.now', return_value=now):
+            trend = self.api_get(get_trend_analysis, '/api/analysis/trends/', {
+                'asset_id': self.assets[0].id, 'risk_type_id': self.crime.id,
+            }).data['trend_analysis']
+
+        # The day bucket of May 16 starts before the timeframe, which starts at noon
+        self.assertEqual(trend['resolution'], 'day')
+        self.assertEqual([point['date'] for point in trend['data_points']], ['2024-05-16', '2024-06-01'])
+        self.assertEqual(trend['summary']['average_residual_risk'], 6)
+
+    def test_resolution_for_timeframe(self):
+        self.assertEqual(resolution_for_timeframe(30), 'DAY')
+        self.assertEqual(resolution_for_timeframe(365), 'WEEK')
+        self.assertEqual(resolution_for_timeframe(730), 'WEEK')
+        self.assertEqual(resolution_for_timeframe(1095), 'MONTH')
+
+
+class BarrierEffectivenessHistoryTests(RiskFixtureMixin, TestCase):
+
+    def history(self):
+        return list(BarrierEffectivenessSnapshot.objects.filter(barrier=self.fence).order_by('id').values_list(
+            'overall_effectiveness', 'performance_adjustment', 'risk_effectiveness'
+        ))
+
+    def test_snapshots_follow_changes(self):
+        initial = self.history()
+        self.assertEqual(initial[-1], (7.0, 1.0, {str(self.crime.id): 8.0}))
+
+        # Saving without a change records nothing
+        self.fence.save()
+        self.assertEqual(self.history(), initial)
+
+        self.fence.adjust_performance('MAJOR')
+        score = self.fence.effectiveness_scores.get(risk_subtype__isnull=False)
+        score.preventive_capability = 2
+        score.save()
+        self.assertEqual(self.history()[len(initial):], [
+            (4.2, 0.6, {str(self.crime.id): 4.8}),
+            (round(mean([6, score.overall_effectiveness_score]) * 0.6, 2), 0.6,
+             {str(self.crime.id): round(score.overall_effectiveness_score * 0.6, 2)}),
+        ])
+        self.assertEqual(self.history()[-1][0], self.fence.get_overall_effectiveness_score())
+
+    def test_history_window_includes_the_state_at_its_start(self):
+        self.fence.adjust_performance('MAJOR')
+        BarrierEffectivenessSnapshot.objects.filter(barrier=self.fence).update(
+            recorded_at=timezone.now() - timedelta(days=10)
+        )
+        self.fence.adjust_performance('COMPROMISED')
+
+        start = timezone.now() - timedelta(days=5)
+        snapshots = load_effectiveness_history(self.fence.id, start, timezone.now())
+        self.assertEqual([snapshot.performance_adjustment for snapshot in snapshots], [0.6, 0.12])
+        self.assertLess(snapshots[0].recorded_at, start)
+
+    def test_trend_window_is_bounded(self):
+        def get(**params):
+            return self.api_get(
+                get_barrier_trends, f'/api/barriers/{self.fence.id}/trends/', params, barrier_id=self.fence.id
+            )
+
+        response = get(days=999999999)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['trend_data']['dates']), MAX_TREND_DAYS + 1)
+        self.assertEqual(get(days=-1).status_code, 400)
+        self.assertEqual(get(start='2024-06-01', end='2024-01-01').status_code, 400)
+        response = get(start='0001-01-01', end='2024-12-31', resolution='month')
+        self.assertEqual(len(json.loads(response.content)['trend_data']['dates']), 120)
+        self.assertEqual(get(end='9999-12-31', resolution='month').status_code, 400)
+
+
+class CurrentBaselineThreatTests(RiskFixtureMixin, TestCase):
+
+    def test_projection_follows_assessments(self):
+        key = (self.country.id, self.crime.id)
+        self.assertEqual(load_latest_bta_scores([self.country.id]), {key: 7})
+
+        # An older assessment does not replace the current one
+        BaselineThreatAssessment.objects.create(
+            risk_type=self.crime, country=self.country, baseline_score=2, date_assessed='2023-01-01'
+        )
+        latest = BaselineThreatAssessment.objects.create(
+            risk_type=self.crime, country=self.country, baseline_score=9, date_assessed='2025-01-01'
+        )
+        self.assertEqual(load_latest_bta_scores([self.country.id]), {key: 9})
+
+        latest.delete()
+        self.assertEqual(load_latest_bta_scores([self.country.id]), {key: 7})
+        BaselineThreatAssessment.objects.filter(country=self.country).delete()
+        self.assertFalse(CurrentBaselineThreat.objects.exists())
+
+    def test_seeding_and_as_of_lookups(self):
+        Country.objects.filter(id=self.other_country.id).update(company_operated=True)
+        seed_baseline_threats([self.other_country.id])
+        self.assertEqual(load_latest_bta_scores([self.other_country.id]), {
+            (self.other_country.id, self.crime.id): 5,
+            (self.other_country.id, self.cyber.id): 5,
+        })
+
+        self.assertEqual(load_latest_bta_scores([self.country.id], as_of='2024-03-01'), {
+            (self.country.id, self.crime.id): 4,
+        })
+        self.assertEqual(load_latest_bta_scores([self.country.id], as_of='2023-12-31'), {})
+
+
+class DashboardDataTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # The fixture's bumps are scheduled on the class-wide transaction, which never commits
+        caching_module._local.pending = None
+
+    def get_dashboard(self):
+        return json.loads(self.api_get(get_dashboard_data, '/api/dashboard/data/').content)
+
+    def test_cached_payload_follows_its_inputs(self):
+        Country.objects.filter(id=self.country.id).update(company_operated=True)
+        data = self.get_dashboard()
+        self.assertEqual(data['avg_global_risk_score'], 7)
+        self.assertEqual([country['name'] for country in data['countries']], ['Norway'])
+        hq = next(asset for asset in data['assets'] if asset['name'] == 'HQ')
+        self.assertEqual(hq['country']['bta_scores'], [
+            {'risk_group': 'Crime', 'bta_score': 7, 'date_assessed': '01-06-2024'}
+        ])
+
+        # Served from the cache while nothing changes; only the recent updates are read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_dashboard(), data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BaselineThreatAssessment.objects.create(
+                risk_type=self.crime, country=self.country, baseline_score=3, date_assessed='2025-01-01'
+            )
+        self.assertEqual(self.get_dashboard()['avg_global_risk_score'], 3)
+        # Bulk writers invalidate their tags themselves
+        with self.captureOnCommitCallbacks(execute=True):
+            Asset.objects.filter(id=self.assets[0].id).update(name='Head Office', updated_at=timezone.now())
+            caching_module.invalidate_model(Asset, Asset=[self.assets[0].id])
+        self.assertIn('Head Office', [asset['name'] for asset in self.get_dashboard()['assets']])
+
+
+class ResponseCacheTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # The fixture's bumps are scheduled on the class-wide transaction, which never commits
+        caching_module._local.pending = None
+
+    def get(self, view, path, **kwargs):
+        return json.loads(self.api_get(view, path, **kwargs).content)
+
+    def test_response_is_served_until_a_tag_changes(self):
+        data = self.get(get_barrier_assessments, '/api/barriers/assessments/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(get_barrier_assessments, '/api/barriers/assessments/'), data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Barrier.objects.filter(id=self.fence.id).update(name='Wall')
+        # Queryset updates fire no signals, so the cached response is still served
+        self.assertEqual(self.get(get_barrier_assessments, '/api/barriers/assessments/'), data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fence.refresh_from_db()
+            self.fence.save()
+        barriers = self.get(get_barrier_assessments, '/api/barriers/assessments/')['barriers']
+        self.assertIn('Wall', [barrier['name'] for barrier in barriers])
+
+    def test_row_tags_and_m2m_changes_invalidate(self):
+        asset = self.assets[0]
+        path = f'/api/assets/form-data/{asset.id}/'
+        other_path = f'/api/assets/form-data/{self.assets[1].id}/'
+        self.get(get_asset_form_data, other_path, asset_id=self.assets[1].id)
+        self.assertEqual(self.get(get_asset_form_data, path, asset_id=asset.id)['asset']['barriers'],
+                         sorted(asset.barriers.values_list('id', flat=True)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.barriers.clear()
+        self.assertEqual(self.get(get_asset_form_data, path, asset_id=asset.id)['asset']['barriers'], [])
+        self.get(get_asset_form_data, other_path, asset_id=self.assets[1].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            caching_module.invalidate_model('FinalRiskMatrix', Asset=[asset.id])
+        # The other asset's response depends on none of the bumped tags; only
+        # the change counters of its ETag are read
+        with self.assertNumQueries(1):
+            self.get(get_asset_form_data, other_path, asset_id=self.assets[1].id)
+        self.assertEqual(self.get(get_asset_form_data, path, asset_id=asset.id)['asset']['barriers'], [])
+
+        # No tag is invalidated before the transaction commits
+        tags = ['Asset_barriers', f'Asset:{asset.id}']
+        versions = caching_module.tag_versions(tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.barriers.add(self.fence)
+            self.assertEqual(caching_module.tag_versions(tags), versions)
+        self.assertEqual(self.get(get_asset_form_data, path, asset_id=asset.id)['asset']['barriers'],
+                         [self.fence.id])
+
+    def test_conditional_get_answers_304_until_a_table_changes(self):
+        asset = self.assets[0]
+        path = f'/api/assets/form-data/{asset.id}/'
+
+        def get(**headers):
+            return self.api_get(get_asset_form_data, path, headers=headers, asset_id=asset.id)
+
+        etag = get()['ETag']
+        # Only the change counters are read
+        with self.assertNumQueries(1):
+            response = get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Writes reaching the asset only through its row tag leave the ETag alone
+        version = TableChangeCounter.objects.get(table='Asset').version
+        with self.captureOnCommitCallbacks(execute=True):
+            caching_module.invalidate_model('FinalRiskMatrix', Asset=[asset.id])
+        self.assertEqual(TableChangeCounter.objects.get(table='Asset').version, version)
+        self.assertEqual(get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Counted once in the transaction that made the changes
+        with self.captureOnCommitCallbacks(execute=True):
+            asset.name = 'Head Office'
+            asset.save()
+            asset.save()
+        self.assertEqual(TableChangeCounter.objects.get(table='Asset').version, version + 1)
+        response = get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response.data['asset']['name'], 'Head Office')
+
+    def test_counter_bumped_by_another_process_is_not_served_a_stale_body(self):
+        Country.objects.filter(id=self.country.id).update(company_operated=True)
+
+        def get(**headers):
+            return self.api_get(get_security_manager_data, '/api/security-manager/', headers=headers)
+
+        etag = get()['ETag']
+        # A write committed by another process: the local cache is not told
+        Country.objects.filter(id=self.country.id).update(name='Kingdom of Norway')
+        TableChangeCounter.objects.filter(table='Country').update(
+            version=F('version') + 1, changed_at=timezone.now()
+        )
+
+        response = get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['countries'][0]['name'], 'Kingdom of Norway')
+        self.assertEqual(get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_failed_counter_bump_does_not_fail_the_write(self):
+        versions = caching_module.tag_versions(['Country'])
+        with mock.patch.object(
+            TableChangeCounter.objects, 'bulk_create', side_effect=OperationalError('database is locked')
+        ), self.assertLogs('core.caching', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            self.country.name = 'Kingdom of Norway'
+            self.country.save()
+
+        self.assertEqual(Country.objects.get(id=self.country.id).name, 'Kingdom of Norway')
+        self.assertNotEqual(caching_module.tag_versions(['Country']), versions)
+
+    def test_conditional_views_declare_the_tables_of_their_row_tags(self):
+        with self.assertRaises(ValueError):
+            caching_module.cached_response(['Asset:{asset_id}', 'Country'], conditional=True)
+
+
+class AssetListingTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        asset_type = AssetType.objects.get(name='Office')
+        Asset.objects.bulk_create([
+            Asset(name=f'Depot {index}', description='', latitude=0, longitude=0,
+                  asset_type=asset_type, country=self.other_country)
+            for index in range(5)
+        ])
+
+    def get(self, **params):
+        return self.api_get(get_global_assets, '/api/assets/', params)
+
+    def pages(self, **params):
+        rows, cursor = [], None
+        while True:
+            response = self.get(**params, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data['assets'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return rows
+
+    def test_cursors_walk_every_asset_once_in_order(self):
+        expected = list(Asset.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in self.pages(page_size=2)], expected)
+
+        # Assets sharing an updated_at are separated by id
+        Asset.objects.update(updated_at=timezone.now())
+        Asset.objects.filter(id=expected[0]).update(updated_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(
+            [row['id'] for row in self.pages(page_size=3, ordering='updated_at')], expected[1:] + expected[:1]
+        )
+
+    def test_fields_and_filters(self):
+        response = self.get(fields='id,country', country=self.other_country.id, page_size=10)
+        self.assertEqual(len(response.data['assets']), 6)
+        self.assertEqual(response.data['assets'][0], {'id': response.data['assets'][0]['id'], 'country': 'Sweden'})
+        self.assertIsNone(response.data['next_cursor'])
+
+        FinalRiskMatrix.generate_matrices(self.assets[0])
+        matrix = FinalRiskMatrix.objects.get(asset=self.assets[0], risk_type=self.crime)
+        response = self.get(fields='id', risk_level=matrix.risk_level.lower())
+        self.assertEqual(response.data['assets'], [{'id': self.assets[0].id}])
+
+        self.assertEqual(self.get(fields='id,secret').status_code, 400)
+        self.assertEqual(self.get(cursor='not-a-cursor').status_code, 400)
+
+
+class ExportTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for asset in self.assets:
+            FinalRiskMatrix.generate_matrices(asset)
+
+    def export(self, dataset, **params):
+        return self.api_get(export_dataset, f'/api/export/{dataset}/', params, dataset=dataset)
+
+    def test_ndjson_and_csv_stream_every_row(self):
+        response = self.export('matrices')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            sorted(row['id'] for row in rows), sorted(FinalRiskMatrix.objects.values_list('id', flat=True))
+        )
+        self.assertIsInstance(rows[0]['sub_risk_details'], dict)
+
+        response = self.export('assets', output='csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'description'])
+        self.assertEqual(len(lines), 1 + Asset.objects.count())
+
+    def test_since_exports_only_later_changes(self):
+        Asset.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.assets[0].save()
+        response = self.export('assets', since=(timezone.now() - timedelta(days=1)).isoformat())
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.assets[0].id])
+        # The next pull overlaps this one by a job lease, for rows committed late
+        self.assertEqual(
+            timezone.datetime.fromisoformat(response['X-Export-Started-At'])
+            - timezone.datetime.fromisoformat(response['X-Export-Next-Since']),
+            timedelta(seconds=300),
+        )
+
+        self.assertEqual(self.export('assets', since='yesterday').status_code, 400)
+        self.assertEqual(self.export('users').status_code, 404)
+
+
+class BatchRequestTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def batch(self, requests):
+        return self.api_post(batch_requests, '/api/batch/', {'requests': requests})
+
+    def test_sub_requests_report_their_own_status(self):
+        asset = self.assets[0]
+        response = self.batch([
+            {'id': 'details', 'path': f'/api/assets/{asset.id}/'},
+            {'id': 'barriers', 'path': f'/api/assets/{asset.id}/barriers/'},
+            {'path': '/api/assets/0/'},
+            {'path': '/api/nowhere/'},
+            {'path': f'/api/assets/{asset.id}/', 'method': 'DELETE'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.data['responses']
+        self.assertEqual([result['status'] for result in results], [200, 200, 404, 404, 405])
+        self.assertEqual(results[0]['id'], 'details')
+        self.assertEqual(results[2]['id'], 2)
+        self.assertEqual(results[0]['body']['asset']['name'], asset.name)
+
+    def test_rows_are_read_once_per_batch(self):
+        asset = self.assets[0]
+        paths = [f'/api/assets/{asset.id}/', f'/api/assets/{asset.id}/risk-data/',
+                 f'/api/assets/{asset.id}/barriers/']
+        with mock.patch('core.request_cache.get_object_or_404', wraps=get_object_or_404) as lookup:
+            response = self.batch([{'path': path} for path in paths])
+        self.assertEqual([result['status'] for result in response.data['responses']], [200, 200, 200])
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_rejects_oversized_and_nested_batches(self):
+        self.assertEqual(self.batch([{'path': '/api/assets/'}] * 26).status_code, 400)
+        response = self.batch([{'path': '/api/batch/'}])
+        self.assertEqual(response.data['responses'][0]['status'], 400)
+
+
+class BulkRiskAssessmentTests(RiskFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        recompute_module._local.pending = None
+        caching_module._local.pending = None
+        self.break_in = Scenario.objects.get(name='Break-in')
+        self.question = ScenarioQuestion.objects.create(
+            scenario=self.break_in, text='Fence height', question_type='LIKELIHOOD', weight=1
+        )
+        self.choice = QuestionChoice.objects.create(question=self.question, text='Low', score=9)
+        fields = {}
+        for index, score in enumerate([2, 4, 6, 8, 10], start=1):
+            fields[f'choice{index}'] = f'Option {index}'
+            fields[f'score{index}'] = score
+        self.vulnerability_question = AssetVulnerabilityQuestion.objects.create(
+            question_text='Lighting', risk_type=self.crime, **fields
+        )
+
+    def save(self, assessments, **data):
+        return self.api_post(
+            save_risk_assessments_bulk, '/api/risk-assessment/bulk-save/', {'assessments': assessments, **data}
+        )
+
+    def test_valid_assessments_are_saved_and_recomputed_once_by_a_job(self):
+        hq, depot = self.assets
+        with self.captureOnCommitCallbacks(execute=True), mock.patch(
+            'core.risk_engine.recompute.generate_matrices_bulk', wraps=generate_matrices_bulk
+        ) as generate:
+            response = self.save([
+                {'asset_id': hq.id, 'bta': {str(self.cyber.id): 6},
+                 'scenario_answers': {str(self.break_in.id): {str(self.question.id): self.choice.id}},
+                 'vulnerability': {str(self.vulnerability_question.id): 'Option 4'}},
+                {'asset_id': depot.id, 'bta': {str(self.crime.id): 11}},
+                {'asset_id': 0},
+            ], barrier_effectiveness={str(self.fence.id): {str(self.crime.id): {'preventive': 9}}})
+
+            self.assertEqual((response.data['saved'], response.data['failed']), (1, 2))
+            results = response.data['results']
+            self.assertEqual(results[0]['saved']['scenario_answers'], 1)
+            self.assertNotIn('risk_matrices', results[0])
+            self.assertFalse(results[1]['success'])
+            self.assertEqual(results[2]['errors'], ['Unknown asset: 0'])
+            self.assertFalse(generate.called)
+            self.assertFalse(RiskLog.objects.exists())
+
+            job_id = response.data['job_id']
+            claim_jobs('worker', 1)
+            self.assertEqual(execute_job(job_id, 'worker'), 'SUCCEEDED')
+
+        # HQ is recomputed whole and Depot, which holds the fence too, only
+        # for the invalidated cells, in a single pass
+        self.assertEqual([call.args[0] for call in generate.call_args_list], [[hq.id], [depot.id]])
+        self.assertEqual(RiskJob.objects.get(id=job_id).result['logs'], 2)
+        self.assertEqual(CurrentBaselineThreat.objects.get(country=self.country, risk_type=self.cyber).baseline_score, 6)
+        self.assertEqual(AssetScenarioAnswer.objects.get(asset=hq).selected_choice, self.choice)
+        self.assertEqual(
+            RiskScenarioAssessment.objects.get(asset=hq, scenario=self.break_in).likelihood_score, 9
+        )
+        hq.refresh_from_db()
+        self.assertEqual(hq.vulnerability_score, 8)
+        fence_score = BarrierEffectivenessScore.objects.get(
+            barrier=self.fence, risk_type=self.crime, risk_subtype__isnull=True
+        )
+        self.assertEqual((fence_score.preventive_capability, fence_score.overall_effectiveness_score), (9, 6.2))
+        self.assertEqual(RiskLog.objects.filter(asset=hq).count(), 2)
+        self.assertFalse(RiskLog.objects.filter(asset=depot).exists())
+
+    def test_conflicting_baseline_threats_reject_the_later_assessment(self):
+        hq, depot = self.assets
+        depot.country = self.country
+        depot.save()
+        response = self.save([
+            {'asset_id': hq.id, 'bta': {str(self.crime.id): 3}},
+            {'asset_id': depot.id, 'bta': {str(self.crime.id): 5}},
+        ])
+        self.assertEqual([result['success'] for result in response.data['results']], [True, False])
+        self.assertEqual(
+            CurrentBaselineThreat.objects.get(country=self.country, risk_type=self.crime).baseline_score, 3
+        )
+        self.assertEqual(self.save([]).status_code, 400)
+
+    def test_answers_are_committed_per_batch(self):
+        hq, depot = self.assets
+        save_answers = submissions_module._save_questionnaire_answers
+
+        def fail_for_depot(submissions, batch_size):
+            if submissions[0]['asset_id'] == depot.id:
+                raise DatabaseError('database is locked')
+            return save_answers(submissions, batch_size)
+
+        with mock.patch.object(submissions_module, '_save_questionnaire_answers', side_effect=fail_for_depot):
+            results, job = submissions_module.save_assessment_submissions([
+                {'asset_id': asset.id, 'bta': {str(self.crime.id): 7},
+                 'vulnerability': {str(self.vulnerability_question.id): 'Option 4'}}
+                for asset in (hq, depot)
+            ], batch_size=1)
+
+        self.assertEqual([result['success'] for result in results], [True, False])
+        self.assertIn('database is locked', results[1]['errors'][0])
+        self.assertEqual(list(AssetVulnerabilityAnswer.objects.filter(
+            selected_choice='Option 4'
+        ).values_list('asset_id', flat=True)), [hq.id])
+        # The failed batch's baseline threat was rolled back with its answers
+        self.assertEqual(list(CurrentBaselineThreat.objects.filter(
+            risk_type=self.crime, baseline_score=7
+        ).values_list('country_id', flat=True)), [self.country.id])
+        job.refresh_from_db()
+        self.assertEqual(job.payload, {
+            'asset_ids': [hq.id], 'baseline_threats': [[self.country.id, self.crime.id]], 'barrier_scores': [],
+        })
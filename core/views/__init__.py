@@ -8,6 +8,10 @@ This package contains all the views for the GEMS application, organized by funct
 - risk_views: Risk assessment API endpoints
 - barrier_views: Barrier management API endpoints
 - analysis_views: Analysis and recommendations API endpoints
+- engine_views: Risk engine statistics and background job API endpoints
+- simulation_views: What-if risk simulation and barrier optimization API endpoints
+- export_views: Streaming bulk-export API endpoints
+- batch_views: Multiplexed batch API endpoint
 """
 
 from .dashboard_views import (
@@ -38,11 +42,13 @@ from .asset_views import (
     remove_asset_barrier,
     manage_asset_links,
     update_linked_assets,
+    save_asset_answers,
 )
 
 from .risk_views import (
     get_risk_assessment_data,
     save_risk_assessment,
+    save_risk_assessments_bulk,
     get_risk_matrix_data,
     generate_risk_matrix,
     save_step_data,
@@ -64,6 +70,25 @@ from .barrier_views import (
     get_barriers_by_category,
 )
 
+from .engine_views import (
+    get_risk_engine_stats,
+    get_risk_job,
+)
+
+from .simulation_views import (
+    optimize_barrier_investments,
+    simulate_risk,
+    simulate_risk_distribution,
+)
+
+from .export_views import (
+    export_dataset,
+)
+
+from .batch_views import (
+    batch_requests,
+)
+
 # For convenience, expose all views at the package level
 __all__ = [
     # Dashboard views
@@ -92,10 +117,12 @@ __all__ = [
     'remove_asset_barrier',
     'manage_asset_links',
     'update_linked_assets',
+    'save_asset_answers',
     
     # Risk views
     'get_risk_assessment_data',
     'save_risk_assessment',
+    'save_risk_assessments_bulk',
     'get_risk_matrix_data',
     'generate_risk_matrix',
     'save_step_data',
@@ -113,4 +140,19 @@ __all__ = [
     'report_barrier_issue',
     'resolve_barrier_issue',
     'get_barriers_by_category',
+    
+    # Risk engine views
+    'get_risk_engine_stats',
+    'get_risk_job',
+    
+    # Simulation views
+    'optimize_barrier_investments',
+    'simulate_risk',
+    'simulate_risk_distribution',
+    
+    # Export views
+    'export_dataset',
+    
+    # Batch views
+    'batch_requests',
 ]
@@ -10,7 +10,6 @@ from rest_framework.decorators import api_view, authentication_classes, permissi
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
 from django.db.models import Avg
 from django.utils import timezone
 from datetime import timedelta
@@ -18,28 +17,70 @@ from datetime import timedelta
 from ..models.asset_models import Asset
 from ..models.barrier_models import Barrier
 from ..models.risk_models import RiskType, RiskScenarioAssessment
-from ..models.log_models import RiskLog
+from ..models.log_models import RiskLog, RiskLogRollup
+from ..request_cache import get_cached_object
+from ..risk_engine.rollups import METRICS, RESOLUTIONS, bucket_start, resolution_for_timeframe
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_trend_analysis(request):
-    """API endpoint to get trend analysis data for risk assessments."""
+    """API endpoint to get trend analysis data for risk assessments.
+
+    Reads the daily, weekly or monthly RiskLog rollups, by default the coarsest
+    resolution that still gives enough points for the timeframe. Pass
+    resolution=raw for the individual logs. The summary is averaged over the
+    logs of the timeframe itself, whatever the resolution.
+    """
     asset_id = request.GET.get('asset_id')
     risk_type_id = request.GET.get('risk_type_id')
     timeframe = request.GET.get('timeframe', '30')  # Default to 30 days
     
-    asset = get_object_or_404(Asset, id=asset_id)
-    risk_type = get_object_or_404(RiskType, id=risk_type_id)
+    asset = get_cached_object(Asset, id=asset_id)
+    risk_type = get_cached_object(RiskType, id=risk_type_id)
     
     end_date = timezone.now()
     start_date = end_date - timedelta(days=int(timeframe))
+    resolution = request.GET.get('resolution', '').upper() or resolution_for_timeframe(int(timeframe))
     
     risk_logs = RiskLog.objects.filter(
         asset=asset,
         risk_type=risk_type,
         timestamp__range=(start_date, end_date)
-    ).order_by('timestamp')
+    )
+    if resolution == 'RAW':
+        data_points = [{
+            'date': log.timestamp.strftime('%Y-%m-%d'),
+            'bta_score': log.bta_score,
+            'vulnerability_score': log.vulnerability_score,
+            'criticality_score': log.criticality_score,
+            'residual_risk_score': log.residual_risk_score,
+        } for log in risk_logs.order_by('timestamp')]
+    elif resolution in RESOLUTIONS:
+        # Buckets overlapping the timeframe; the first one may start before it
+        rollups = list(RiskLogRollup.objects.filter(
+            asset=asset,
+            risk_type=risk_type,
+            resolution=resolution,
+            bucket_start__range=(
+                bucket_start(resolution, timezone.localdate(start_date)), timezone.localdate(end_date)
+            ),
+        ).order_by('bucket_start'))
+        data_points = [{
+            'date': rollup.bucket_start.strftime('%Y-%m-%d'),
+            'count': rollup.count,
+            **{metric: rollup.average(metric) for metric in METRICS},
+            **{stat: {metric: getattr(rollup, f'{metric}_{stat}') for metric in METRICS}
+               for stat in ('min', 'max', 'last')},
+        } for rollup in rollups]
+    else:
+        return Response({
+            'success': False,
+            'error': f"Unknown resolution: {resolution.lower()}"
+        }, status=400)
+    
+    # The first bucket may start before the timeframe, so it is not summed
+    averages = risk_logs.aggregate(**{metric: Avg(metric) for metric in METRICS})
     
     trend_data = {
         'asset_info': {
@@ -52,18 +93,13 @@ def get_trend_analysis(request):
             'name': risk_type.name
         },
         'timeframe': timeframe,
-        'data_points': [{
-            'date': log.timestamp.strftime('%Y-%m-%d'),
-            'bta_score': log.bta_score,
-            'vulnerability_score': log.vulnerability_score,
-            'criticality_score': log.criticality_score,
-            'residual_risk_score': log.residual_risk_score,
-        } for log in risk_logs],
+        'resolution': resolution.lower(),
+        'data_points': data_points,
         'summary': {
-            'average_bta': risk_logs.aggregate(Avg('bta_score'))['bta_score__avg'],
-            'average_vulnerability': risk_logs.aggregate(Avg('vulnerability_score'))['vulnerability_score__avg'],
-            'average_criticality': risk_logs.aggregate(Avg('criticality_score'))['criticality_score__avg'],
-            'average_residual_risk': risk_logs.aggregate(Avg('residual_risk_score'))['residual_risk_score__avg'],
+            'average_bta': averages['bta_score'],
+            'average_vulnerability': averages['vulnerability_score'],
+            'average_criticality': averages['criticality_score'],
+            'average_residual_risk': averages['residual_risk_score'],
         }
     }
     
@@ -77,7 +113,7 @@ def get_trend_analysis(request):
 @permission_classes([IsAuthenticated])
 def get_recommendations(request, asset_id):
     """API endpoint to get recommendations based on risk assessment."""
-    asset = get_object_or_404(Asset, id=asset_id)
+    asset = get_cached_object(Asset, id=asset_id)
     
     # Get high-risk scenarios
     high_risk_scenarios = RiskScenarioAssessment.objects.filter(
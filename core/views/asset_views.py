@@ -24,6 +24,7 @@ import logging
 
 logger = logging.getLogger('core')
 
+from ..caching import cached_response
 from ..models.asset_models import (
     Asset, AssetType, AssetVulnerabilityAnswer,
     AssetCriticalityAnswer, AssetLink
@@ -32,36 +33,75 @@ from ..models.geo_models import Country
 from ..models.barrier_models import (
     Barrier, BarrierEffectivenessScore, BarrierCategory
 )
-from ..models.risk_models import RiskType, Scenario, FinalRiskMatrix
+from ..models.risk_models import RiskType, Scenario, FinalRiskMatrix, ResidualRiskDistribution
+from ..pagination import paginate_keyset, parse_fields
+from ..request_cache import get_cached_object
+from ..risk_engine.jobs import UPDATE_LINKED_ASSETS, enqueue
+
+# Fields asset listings can return, and the lookups they are read from
+ASSET_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'asset_type': 'asset_type__name',
+    'asset_type_id': 'asset_type_id',
+    'country': 'country__name',
+    'country_id': 'country_id',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'criticality_score': 'criticality_score',
+    'vulnerability_score': 'vulnerability_score',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+DEFAULT_ASSET_FIELDS = [
+    'id', 'name', 'asset_type', 'country', 'latitude', 'longitude', 'criticality_score', 'vulnerability_score',
+]
+
+
+def filter_assets(assets, params):
+    """Apply the country, asset_type and risk_level filters of a listing request."""
+    if params.get('country'):
+        assets = assets.filter(country_id=int(params['country']))
+    if params.get('asset_type'):
+        assets = assets.filter(asset_type_id=int(params['asset_type']))
+    if params.get('risk_level'):
+        risk_level = params['risk_level'].upper()
+        if risk_level not in dict(FinalRiskMatrix.RISK_LEVELS):
+            raise ValueError(f"Unknown risk level: {params['risk_level']}")
+        assets = assets.filter(id__in=FinalRiskMatrix.objects.filter(
+            risk_level=risk_level
+        ).values('asset_id'))
+    return assets
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_global_assets(request):
-    """API endpoint to get all assets data."""
-    assets = Asset.objects.all()
-    
-    assets_data = []
-    for asset in assets:
-        assets_data.append({
-            'id': asset.id,
-            'name': asset.name,
-            'asset_type': asset.asset_type.name,
-            'country': asset.country.name,
-            'latitude': asset.latitude,
-            'longitude': asset.longitude,
-            'criticality_score': asset.criticality_score,
-            'vulnerability_score': asset.vulnerability_score
-        })
-    
-    return Response({'assets': assets_data})
+    """API endpoint to get a page of assets.
+
+    Accepts "fields" (comma-separated names from ASSET_FIELDS), the filters
+    "country", "asset_type" and "risk_level" (assets with a risk matrix cell
+    at that level), "ordering" (id or updated_at), "page_size" and the
+    "cursor" returned as next_cursor by the previous page.
+    """
+    try:
+        fields = parse_fields(request, ASSET_FIELDS, DEFAULT_ASSET_FIELDS)
+        assets, next_cursor = paginate_keyset(
+            filter_assets(Asset.objects.all(), request.GET), request, fields, ASSET_FIELDS,
+            ordering=request.GET.get('ordering', 'id'),
+        )
+        return Response({'assets': assets, 'next_cursor': next_cursor})
+    except (TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_asset_details(request, asset_id):
     """API endpoint to get detailed information about a specific asset."""
-    asset = get_object_or_404(Asset, id=asset_id)
+    asset = get_cached_object(Asset, id=asset_id)
     scenarios = asset.scenarios.all()
     
     asset_data = {
@@ -85,7 +125,7 @@ def get_asset_details(request, asset_id):
 @permission_classes([IsAuthenticated])
 def get_asset_risk_data(request, asset_id):
     """API endpoint to get risk data for a specific asset."""
-    asset = get_object_or_404(Asset, id=asset_id)
+    asset = get_cached_object(Asset, id=asset_id)
     risk_types = RiskType.objects.all()
     
     matrices_data = {
@@ -103,7 +143,11 @@ def get_asset_risk_data(request, asset_id):
         ).values())
     }
     
-    return Response({'matrices': matrices_data})
+    distributions = list(ResidualRiskDistribution.objects.filter(
+        asset=asset
+    ).values('risk_type_id', 'draws', 'mean', 'p5', 'p50', 'p95', 'computed_at'))
+    
+    return Response({'matrices': matrices_data, 'distributions': distributions})
 
 @api_view(['GET', 'POST'])
 @authentication_classes([TokenAuthentication])
@@ -143,12 +187,13 @@ def update_linked_assets(request, asset_link_id):
     """API endpoint to update all assets linked via a specific asset link."""
     try:
         asset_link = get_object_or_404(AssetLink, id=asset_link_id)
-        assets = asset_link.assets.all()
-
-        for asset in assets:
-            asset.update_risk_assessment_based_on_link()
+        job = enqueue(UPDATE_LINKED_ASSETS, {'asset_link_id': asset_link.id})
 
-        return Response({'success': True, 'message': 'Linked assets updated successfully'})
+        return Response({
+            'success': True,
+            'job_id': job.id,
+            'message': 'Linked assets update queued'
+        })
     except Exception as e:
         return Response({'success': False, 'error': str(e)})
 
@@ -210,9 +255,48 @@ def delete_asset(request):
     except Exception as e:
         return Response({'success': False, 'error': str(e)})
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def save_asset_answers(request, asset_id):
+    """API endpoint to save many vulnerability and criticality answers of an asset at once.
+
+    Expects {"vulnerability": {question_id: choice}, "criticality": {question_id: choice}}.
+    The asset's scores and risk are updated once for the whole submission.
+    """
+    try:
+        asset = get_object_or_404(Asset, id=asset_id)
+        vulnerability_answers = request.data.get('vulnerability', {})
+        criticality_answers = request.data.get('criticality', {})
+        
+        with transaction.atomic():
+            vulnerability = AssetVulnerabilityAnswer.bulk_save_answers(
+                asset, vulnerability_answers, update_scores=False
+            )
+            criticality = AssetCriticalityAnswer.bulk_save_answers(
+                asset, criticality_answers, update_scores=False
+            )
+            asset.update_scores()
+        
+        return Response({
+            'success': True,
+            'vulnerability': vulnerability,
+            'criticality': criticality,
+            'vulnerability_score': asset.vulnerability_score,
+            'criticality_score': asset.criticality_score,
+        })
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'success': False, 'error': str(e)})
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@cached_response(['Asset:{asset_id}', 'Asset', 'Asset_barriers', 'Asset_scenarios', 'AssetCriticalityAnswer',
+                  'AssetVulnerabilityAnswer', 'AssetType', 'Country', 'Barrier', 'Scenario',
+                  'AssetCriticalityQuestion', 'AssetVulnerabilityQuestion'],
+                 conditional=True)
 def get_asset_form_data(request, asset_id=None):
     """API endpoint to get data needed for asset form."""
     try:
@@ -255,7 +339,7 @@ def get_asset_form_data(request, asset_id=None):
 def get_asset_barriers(request, asset_id):
     """API endpoint to get barriers for a specific asset."""
     try:
-        asset = get_object_or_404(Asset, id=asset_id)
+        asset = get_cached_object(Asset, id=asset_id)
         logger.debug(f"Found asset: {asset.name} (ID: {asset.id})")
         
         # Get all barrier categories with their barriers
@@ -422,12 +506,9 @@ def remove_asset_barrier(request):
         asset = get_object_or_404(Asset, id=asset_id)
         barrier = get_object_or_404(Barrier, id=barrier_id)
         
-        # Remove barrier from asset
+        # Remove barrier from asset; its risk matrices are updated on commit
         asset.barriers.remove(barrier)
         
-        # Update risk matrices
-        FinalRiskMatrix.generate_matrices(asset)
-        
         return Response({'success': True})
     except Exception as e:
         return Response({'success': False, 'error': str(e)})
@@ -12,15 +12,23 @@ from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Avg, Q
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
 import json
 
+from ..caching import cached_response
 from ..models.barrier_models import (
     Barrier, BarrierCategory, BarrierEffectivenessScore,
     BarrierIssueReport, BarrierScenarioEffectiveness
 )
 from ..models.asset_models import Asset
 from ..models.risk_models import RiskType, RiskSubtype, Scenario, FinalRiskMatrix
+from ..risk_engine.dependencies import BARRIER_EFFECTIVENESS, BARRIER_PERFORMANCE
+from ..risk_engine.effectiveness import load_effectiveness_history
+from ..risk_engine.jobs import enqueue_invalidation
+from ..risk_engine.rollups import RESOLUTIONS, bucket_starts
+
+# Longest trend window served, in days; longer ones are cut to their last days
+MAX_TREND_DAYS = 3650
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -35,6 +43,8 @@ def get_risk_subtypes(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response(['Barrier', 'BarrierCategory', 'BarrierEffectivenessScore', 'RiskType', 'RiskSubtype',
+                  'Asset_barriers', 'Barrier_risk_types', 'Barrier_risk_subtypes'])
 def get_barrier_assessments(request):
     """API endpoint to get list of barrier assessments"""
     barriers = Barrier.objects.select_related(
@@ -167,8 +177,11 @@ def save_barrier_effectiveness(request, barrier_id):
         barrier = get_object_or_404(Barrier, id=barrier_id)
         
         with transaction.atomic():
+            changed_risk_types = set()
+            
             # Handle risk type level scores
             for risk_type_id, scores in data.get('risk_types', {}).items():
+                changed_risk_types.add(int(risk_type_id))
                 BarrierEffectivenessScore.objects.update_or_create(
                     barrier=barrier,
                     risk_type_id=risk_type_id,
@@ -185,6 +198,7 @@ def save_barrier_effectiveness(request, barrier_id):
             # Handle risk subtype level scores
             for subtype_id, scores in data.get('risk_subtypes', {}).items():
                 subtype = get_object_or_404(RiskSubtype, id=subtype_id)
+                changed_risk_types.add(subtype.risk_type_id)
                 BarrierEffectivenessScore.objects.update_or_create(
                     barrier=barrier,
                     risk_type=subtype.risk_type,
@@ -199,35 +213,79 @@ def save_barrier_effectiveness(request, barrier_id):
                 )
             
             barrier.update_overall_effectiveness()
+            
+            # Queue the recompute of the assessments and matrix cells using these scores
+            job = enqueue_invalidation(
+                BARRIER_EFFECTIVENESS, barrier_ids=[barrier.id], risk_type_ids=changed_risk_types
+            )
         
-        return JsonResponse({'success': True})
+        return JsonResponse({'success': True, 'job_id': job.id})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_barrier_trends(request, barrier_id):
-    """API endpoint to get trend data for a specific barrier"""
+    """API endpoint to get trend data for a specific barrier
+
+    Serves the recorded effectiveness snapshots of the barrier. The window is
+    the last ``days`` days (default 30) or ``start``/``end`` dates, cut to
+    the last MAX_TREND_DAYS days; ``resolution`` is raw (every snapshot), day
+    (default), week or month, each bucket taking the value in effect at its end.
+    """
     barrier = get_object_or_404(Barrier, id=barrier_id)
     
     # Calculate date range
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=30)
+    try:
+        end_date = timezone.now()
+        days = int(request.GET.get('days', 30))
+        if days < 0:
+            raise ValueError("days must not be negative")
+        start_date = end_date - timedelta(days=min(days, MAX_TREND_DAYS))
+        if request.GET.get('start'):
+            start_date = timezone.make_aware(datetime.combine(date.fromisoformat(request.GET['start']), time.min))
+        if request.GET.get('end'):
+            end_date = timezone.make_aware(datetime.combine(date.fromisoformat(request.GET['end']), time.max))
+        if start_date > end_date:
+            raise ValueError("start must not be after end")
+        start_date = max(start_date, end_date - timedelta(days=MAX_TREND_DAYS))
+    except (ValueError, OverflowError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    resolution = request.GET.get('resolution', 'day').upper()
+    if resolution != 'RAW' and resolution not in RESOLUTIONS:
+        return JsonResponse({'success': False, 'error': f"Unknown resolution: {resolution.lower()}"}, status=400)
     
     # Get historical effectiveness scores
+    snapshots = load_effectiveness_history(barrier.id, start_date, end_date)
     effectiveness_data = []
+    performance_data = []
     dates = []
-    current_date = start_date
-    while current_date <= end_date:
-        score = barrier.get_overall_effectiveness_score()
-        effectiveness_data.append(score)
-        dates.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
+    if resolution == 'RAW':
+        for snapshot in snapshots:
+            if snapshot.recorded_at >= start_date:
+                dates.append(snapshot.recorded_at.isoformat())
+                effectiveness_data.append(snapshot.overall_effectiveness)
+                performance_data.append(snapshot.performance_adjustment)
+    else:
+        # Step function: each bucket shows the last snapshot recorded before it ends
+        index = -1
+        try:
+            starts = list(bucket_starts(resolution, timezone.localdate(start_date), timezone.localdate(end_date)))
+        except OverflowError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        for bucket, next_bucket in zip(starts, starts[1:] + [None]):
+            bucket_end = end_date if next_bucket is None else timezone.make_aware(datetime.combine(next_bucket, time.min))
+            while index + 1 < len(snapshots) and snapshots[index + 1].recorded_at < bucket_end:
+                index += 1
+            dates.append(bucket.strftime('%Y-%m-%d'))
+            effectiveness_data.append(snapshots[index].overall_effectiveness if index >= 0 else None)
+            performance_data.append(snapshots[index].performance_adjustment if index >= 0 else None)
     
     # Calculate trend
-    if len(effectiveness_data) >= 2:
-        trend_change = effectiveness_data[-1] - effectiveness_data[0]
-        trend_percentage = (trend_change / effectiveness_data[0]) * 100 if effectiveness_data[0] > 0 else 0
+    known = [score for score in effectiveness_data if score is not None]
+    if len(known) >= 2:
+        trend_change = known[-1] - known[0]
+        trend_percentage = (trend_change / known[0]) * 100 if known[0] > 0 else 0
         trend_direction = 'up' if trend_change > 0 else 'down' if trend_change < 0 else 'stable'
     else:
         trend_percentage = 0
@@ -236,9 +294,11 @@ def get_barrier_trends(request, barrier_id):
     # Get risk impacts for both types and subtypes
     risk_impacts = []
     
+    effectiveness = barrier.get_risk_effectiveness_scores()
+    
     # Risk type impacts
     for risk_type in barrier.risk_types.all():
-        score = barrier.get_risk_category_effectiveness_score(risk_type)
+        score = effectiveness.get(risk_type.id, 0)
         risk_impacts.append({
             'name': risk_type.name,
             'type': 'risk_type',
@@ -246,8 +306,8 @@ def get_barrier_trends(request, barrier_id):
         })
     
     # Risk subtype impacts
-    for subtype in barrier.risk_subtypes.all():
-        score = barrier.get_risk_category_effectiveness_score(subtype.risk_type)
+    for subtype in barrier.risk_subtypes.select_related('risk_type'):
+        score = effectiveness.get(subtype.risk_type_id, 0)
         risk_impacts.append({
             'name': f"{subtype.risk_type.name} - {subtype.name}",
             'type': 'risk_subtype',
@@ -257,7 +317,7 @@ def get_barrier_trends(request, barrier_id):
     # Get recent issues
     issues = list(BarrierIssueReport.objects.filter(
         barrier=barrier,
-        reported_at__gte=start_date
+        reported_at__range=(start_date, end_date)
     ).order_by('-reported_at').values())
     
     return JsonResponse({
@@ -265,6 +325,8 @@ def get_barrier_trends(request, barrier_id):
         'trend_data': {
             'dates': dates,
             'effectiveness_scores': effectiveness_data,
+            'performance_adjustments': performance_data,
+            'resolution': resolution.lower(),
             'trend': {
                 'direction': trend_direction,
                 'percentage': trend_percentage
@@ -296,12 +358,18 @@ def report_barrier_issue(request):
         # Adjust barrier performance based on the impact rating
         barrier.adjust_performance(impact_rating)
         
-        # Trigger the update of barrier effectiveness and risk matrices
-        barrier.propagate_effectiveness()
-        for asset in barrier.assets.all():
-            FinalRiskMatrix.generate_matrices(asset)
+        # Queue the recompute of the assessments and risk matrix cells that depend
+        # on this barrier, followed by the update of the assets linked through it
+        job = enqueue_invalidation(
+            BARRIER_PERFORMANCE, barrier_ids=[barrier.id],
+            link_ids=barrier.asset_links.values_list('id', flat=True),
+        )
         
-        return JsonResponse({'success': True, 'message': 'Issue reported successfully'})
+        return JsonResponse({
+            'success': True,
+            'job_id': job.id,
+            'message': 'Issue reported successfully'
+        })
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
@@ -319,11 +387,16 @@ def resolve_barrier_issue(request, issue_id):
         issue.resolution_notes = resolution_notes
         issue.save()
         
-        # Trigger the update of barrier effectiveness
-        issue.barrier.update_overall_effectiveness()
-        issue.barrier.propagate_effectiveness()
+        # Trigger the update of barrier effectiveness and queue the recompute of
+        # its dependents, followed by the update of the assets linked through it
+        barrier = issue.barrier
+        barrier.update_overall_effectiveness()
+        job = enqueue_invalidation(
+            BARRIER_PERFORMANCE, barrier_ids=[barrier.id],
+            link_ids=barrier.asset_links.values_list('id', flat=True),
+        )
         
-        return JsonResponse({'success': True, 'message': 'Issue resolved successfully'})
+        return JsonResponse({'success': True, 'job_id': job.id, 'message': 'Issue resolved successfully'})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
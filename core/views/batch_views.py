@@ -0,0 +1,106 @@
+"""
+Batch API Views.
+
+This module contains the multiplexed batch endpoint. A page that needs several
+API resources sends them as one request; the sub-requests are resolved against
+the normal URL patterns and run in one request_scope(), so the rows they look
+up with get_cached_object() are read once for the whole batch.
+"""
+
+import json
+
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.http import HttpRequest, Http404, QueryDict
+from django.urls import Resolver404, resolve
+
+from ..request_cache import request_scope
+
+MAX_BATCH_REQUESTS = 25
+
+# Headers of the batch request that must not leak into its sub-requests
+_DROPPED_META = (
+    'CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE',
+)
+
+
+def _sub_request(request, path, query):
+    """GET request for a sub-request, authenticated as the batch request."""
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {key: value for key, value in request.META.items() if key not in _DROPPED_META}
+    sub.META.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query})
+    sub.GET = QueryDict(query)
+    # DRF uses these instead of authenticating the request again
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _response_body(response):
+    if isinstance(response, Response):
+        return response.data
+    if response['Content-Type'].startswith('application/json') or response['Content-Type'].endswith('+json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset)
+
+
+def _run_sub_request(request, item):
+    """Status and body of one sub-request."""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return 400, {'success': False, 'error': "Each request needs a path"}
+    if item.get('method', 'GET').upper() != 'GET':
+        return 405, {'success': False, 'error': "Only GET requests can be batched"}
+
+    path, _, query = item['path'].partition('?')
+    if not path.startswith('/api/') or path.rstrip('/') == '/api/batch':
+        return 400, {'success': False, 'error': f"Cannot batch {path}"}
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return 404, {'success': False, 'error': f"Not found: {path}"}
+
+    try:
+        response = match.func(_sub_request(request, path, query), *match.args, **match.kwargs)
+    except Http404 as e:
+        return 404, {'success': False, 'error': str(e)}
+    except Exception as e:
+        return 500, {'success': False, 'error': str(e)}
+    if response.streaming:
+        return 400, {'success': False, 'error': f"{path} streams its response and cannot be batched"}
+    return response.status_code, _response_body(response)
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def batch_requests(request):
+    """API endpoint running several GET requests in one round trip.
+
+    Expects {"requests": [{"id": ..., "path": "/api/assets/1/?a=b"}, ...]}.
+    Returns one entry per sub-request, in order, with its id, path, status
+    and body; a failing sub-request does not fail the others.
+    """
+    try:
+        items = request.data.get('requests')
+        if not isinstance(items, list) or not items:
+            raise ValueError("requests must be a non-empty list")
+        if len(items) > MAX_BATCH_REQUESTS:
+            raise ValueError(f"At most {MAX_BATCH_REQUESTS} requests can be batched")
+
+        responses = []
+        with request_scope():
+            for index, item in enumerate(items):
+                status, body = _run_sub_request(request, item)
+                responses.append({
+                    'id': item.get('id', index) if isinstance(item, dict) else index,
+                    'path': item.get('path') if isinstance(item, dict) else None,
+                    'status': status,
+                    'body': body,
+                })
+        return Response({'success': True, 'responses': responses})
+    except (TypeError, ValueError, AttributeError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
@@ -9,12 +9,14 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
 import json
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+from ..caching import cached_response
 from ..models.geo_models import Country
 from ..models.asset_models import Asset
 from ..models.risk_models import (
@@ -22,6 +24,8 @@ from ..models.risk_models import (
     RiskType,
     FinalRiskMatrix
 )
+from ..risk_engine.dependencies import BASELINE_THREAT
+from ..risk_engine.jobs import enqueue_invalidation
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
@@ -116,6 +120,7 @@ def get_country_geojson(request, country_id):
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@cached_response(['Country'])
 def get_operated_countries_geojson(request):
     """API endpoint to get GeoJSON data for all operated countries."""
     try:
@@ -317,20 +322,18 @@ def save_bta(request):
                 'error': 'No valid BTA scores provided'
             }, status=400)
         
-        # Update risk matrices
-        logger.info("Updating risk matrices for country %s", country.name)
-        assets = Asset.objects.filter(country=country)
-        for asset in assets:
-            try:
-                FinalRiskMatrix.generate_matrices(asset)
-                logger.debug("Generated risk matrices for asset %s", asset.name)
-            except Exception as e:
-                logger.error("Error generating risk matrices for asset %s: %s", asset.name, str(e))
+        # Queue the update of the risk matrix cells fed by the new scores
+        job = enqueue_invalidation(
+            BASELINE_THREAT, country_id=country.id,
+            risk_type_ids=[score['risk_type_id'] for score in updated_scores],
+        )
+        logger.info("Queued job %s to update the risk matrix cells of country %s", job.id, country.name)
         
         logger.info("Successfully saved %d BTAs for country %s", len(updated_scores), country.name)
         return Response({
             'success': True,
             'scores': updated_scores,
+            'job_id': job.id,
             'message': 'BTA scores updated successfully'
         })
         
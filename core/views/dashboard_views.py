@@ -5,132 +5,123 @@ Dashboard API Views.
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg, Max
+from django.http import HttpResponse
+from django.db.models import Avg
 import json
 
+from ..caching import cached_content, cached_response
 from ..models.asset_models import (
     Asset, AssetType, AssetVulnerabilityQuestion, AssetCriticalityQuestion
 )
 from ..models.barrier_models import Barrier, BarrierCategory
 from ..models.geo_models import Country
-from ..models.risk_models import BaselineThreatAssessment, RiskType, Scenario
+from ..models.risk_models import CurrentBaselineThreat, RiskType, Scenario
 from ..models.log_models import RiskLog
 
-@api_view(['GET'])
-@authentication_classes([TokenAuthentication])
-@permission_classes([IsAuthenticated])
-def get_dashboard_data(request):
-    """API endpoint returning global risk summary data."""
-    total_countries = Country.objects.filter(company_operated=True).count()
-    
-    # Get the latest BTA scores for global risk average
-    latest_bta_dates = BaselineThreatAssessment.objects.values(
-        'country', 'risk_type'
-    ).annotate(
-        latest_date=Max('date_assessed')
-    )
-    
-    latest_bta_scores = []
-    for date_info in latest_bta_dates:
-        bta = BaselineThreatAssessment.objects.get(
-            country_id=date_info['country'],
-            risk_type_id=date_info['risk_type'],
-            date_assessed=date_info['latest_date']
-        )
-        latest_bta_scores.append(bta.baseline_score)
+# Seconds an assembled dashboard payload is kept at most; it is replaced as
+# soon as one of DASHBOARD_TAGS changes
+DASHBOARD_CACHE_TIMEOUT = 600
+
+# Tables the cached part of the dashboard payload is built from
+DASHBOARD_TAGS = ['Asset', 'Country', 'AssetType', 'RiskType', 'BaselineThreatAssessment', 'CurrentBaselineThreat']
+
+
+def build_dashboard_data():
+    """Assemble the cacheable part of the dashboard payload in a fixed number of queries."""
+    # Get the latest BTA scores of every country, by country id
+    country_bta_scores = {}
+    for country_id, risk_group, bta_score, date_assessed in CurrentBaselineThreat.objects.order_by(
+        'country_id', 'risk_type_id'
+    ).values_list('country_id', 'risk_type__name', 'baseline_score', 'date_assessed'):
+        country_bta_scores.setdefault(country_id, []).append({
+            'risk_group': risk_group,
+            'bta_score': bta_score,
+            'date_assessed': date_assessed.strftime("%d-%m-%Y")
+        })
+    country_avg_bta_scores = {
+        country_id: sum(score['bta_score'] for score in bta_scores) / len(bta_scores)
+        for country_id, bta_scores in country_bta_scores.items()
+    }
     
+    # Global risk average over the latest BTA scores
+    latest_bta_scores = [score['bta_score'] for scores in country_bta_scores.values() for score in scores]
     avg_global_risk_score = sum(latest_bta_scores) / len(latest_bta_scores) if latest_bta_scores else 0
 
-    # Fetch recent risk updates
-    recent_updates = list(RiskLog.objects.order_by('-timestamp')[:5].values())
-
-    # Fetch data for Interactive World Map
-    countries = Country.objects.filter(company_operated=True)
-
-    # Serialize country data
-    country_data = []
-    for country in countries:
-        # Get latest BTA scores for each risk type
-        latest_dates = BaselineThreatAssessment.objects.filter(
-            country=country
-        ).values('risk_type').annotate(latest_date=Max('date_assessed'))
-        
-        bta_scores = []
-        for date_info in latest_dates:
-            bta = BaselineThreatAssessment.objects.get(
-                country=country,
-                risk_type_id=date_info['risk_type'],
-                date_assessed=date_info['latest_date']
-            )
-            bta_scores.append({
-                'risk_group': bta.risk_type.name,
-                'bta_score': bta.baseline_score,
-                'date_assessed': bta.date_assessed.strftime("%d-%m-%Y")
-            })
-
-        country_dict = {
-            'name': country.name,
-            'avg_bta_score': sum(score['bta_score'] for score in bta_scores) / len(bta_scores) if bta_scores else 0,
-            'geo_data': country.geo_data,
-            'bta_scores': bta_scores
-        }
-        country_data.append(country_dict)
-
-    # Fetch and serialize asset data
-    assets = Asset.objects.all()
-    asset_data = []
-    for asset in assets:
-        # Get latest BTA scores for the asset's country
-        latest_dates = BaselineThreatAssessment.objects.filter(
-            country=asset.country
-        ).values('risk_type').annotate(latest_date=Max('date_assessed'))
-        
-        country_bta_scores = []
-        for date_info in latest_dates:
-            bta = BaselineThreatAssessment.objects.get(
-                country=asset.country,
-                risk_type_id=date_info['risk_type'],
-                date_assessed=date_info['latest_date']
-            )
-            country_bta_scores.append({
-                'risk_group': bta.risk_type.name,
-                'bta_score': bta.baseline_score,
-                'date_assessed': bta.date_assessed.strftime("%d-%m-%Y")
-            })
-
-        asset_dict = {
-            'id': asset.id,  # Added the asset ID here
-            'name': asset.name,
-            'asset_type': asset.asset_type.name,
-            'latitude': asset.latitude,
-            'longitude': asset.longitude,
-            'criticality_score': asset.criticality_score,
-            'vulnerability_score': asset.vulnerability_score,
-            'country': {
-                'name': asset.country.name,
-                'avg_bta_score': sum(score['bta_score'] for score in country_bta_scores) / len(country_bta_scores) if country_bta_scores else 0,
-                'bta_scores': country_bta_scores
-            }
+    # Serialize country data for the world map; the country shapes are served
+    # by the operated countries GeoJSON endpoint
+    country_data = [{
+        'id': country_id,
+        'name': name,
+        'code': code,
+        'avg_bta_score': country_avg_bta_scores.get(country_id, 0),
+        'bta_scores': country_bta_scores.get(country_id, [])
+    } for country_id, name, code in Country.objects.filter(
+        company_operated=True
+    ).order_by('id').values_list('id', 'name', 'code')]
+
+    # Serialize asset data
+    asset_data = [{
+        'id': asset_id,
+        'name': name,
+        'asset_type': asset_type,
+        'latitude': latitude,
+        'longitude': longitude,
+        'criticality_score': criticality_score,
+        'vulnerability_score': vulnerability_score,
+        'country': {
+            'name': country_name,
+            'avg_bta_score': country_avg_bta_scores.get(country_id, 0),
+            'bta_scores': country_bta_scores.get(country_id, [])
         }
-        asset_data.append(asset_dict)
-
-    # Fetch risk types
-    risk_types = list(RiskType.objects.values())
-
-    return Response({
-        'total_countries': total_countries,
+    } for (
+        asset_id, name, asset_type, latitude, longitude, criticality_score, vulnerability_score,
+        country_id, country_name,
+    ) in Asset.objects.order_by('id').values_list(
+        'id', 'name', 'asset_type__name', 'latitude', 'longitude', 'criticality_score',
+        'vulnerability_score', 'country_id', 'country__name',
+    )]
+
+    return {
+        'total_countries': len(country_data),
         'avg_global_risk_score': round(avg_global_risk_score, 2),
-        'recent_updates': recent_updates,
         'countries': country_data,
         'assets': asset_data,
-        'risk_types': risk_types,
+        'risk_types': list(RiskType.objects.values()),
+    }
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_dashboard_data(request):
+    """API endpoint returning global risk summary data.
+
+    The rest of the payload is cached as rendered JSON until one of
+    DASHBOARD_TAGS changes. Only the recent risk updates are read on every
+    request.
+    """
+    content = cached_content(
+        'dashboard_data', DASHBOARD_TAGS,
+        lambda: JSONRenderer().render(build_dashboard_data()), DASHBOARD_CACHE_TIMEOUT,
+    )
+
+    # Fetch recent risk updates
+    recent_updates = JSONRenderer().render({
+        'recent_updates': list(RiskLog.objects.order_by('-timestamp')[:5].values())
     })
 
+    # Splice the two JSON objects rather than re-encoding the cached part
+    return HttpResponse(recent_updates[:-1] + b',' + content[1:], content_type='application/json')
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@cached_response(['Country', 'Barrier', 'AssetVulnerabilityQuestion', 'AssetCriticalityQuestion', 'Scenario',
+                  'AssetType', 'RiskType', 'Asset', 'BaselineThreatAssessment', 'CurrentBaselineThreat'],
+                 conditional=True)
 def get_security_manager_data(request):
     """API endpoint for security manager dashboard data."""
     countries = Country.objects.filter(company_operated=True)
@@ -164,20 +155,21 @@ def get_security_manager_data(request):
             risk_types = RiskType.objects.all()
             
             # Create a list of BTAs
+            current_btas = {
+                bta.risk_type_id: bta
+                for bta in CurrentBaselineThreat.objects.filter(country=country).select_related('assessment')
+            }
             bta_list = []
             for risk_type in risk_types:
-                latest_bta = BaselineThreatAssessment.objects.filter(
-                    country=country,
-                    risk_type=risk_type
-                ).order_by('-date_assessed').first()
+                latest_bta = current_btas.get(risk_type.id)
                 
                 if latest_bta:
                     bta_list.append({
                         'country_id': country.id,
                         'risk_type_id': risk_type.id,
                         'baseline_score': latest_bta.baseline_score,
-                        'impact_on_assets': latest_bta.impact_on_assets,
-                        'notes': latest_bta.notes,
+                        'impact_on_assets': latest_bta.assessment.impact_on_assets,
+                        'notes': latest_bta.assessment.notes,
                         'date_assessed': latest_bta.date_assessed.strftime("%Y-%m-%d")
                     })
                 else:
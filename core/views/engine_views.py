@@ -0,0 +1,46 @@
+"""
+Risk Engine API Views.
+
+This module contains API endpoints exposing the state of the risk computation engine.
+"""
+
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+
+from ..models.job_models import RiskJob
+from ..risk_engine.dependencies import get_invalidation_stats
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_risk_engine_stats(request):
+    """API endpoint returning how many assessments and matrix cells each kind of change invalidated."""
+    return Response({
+        'success': True,
+        'invalidations': get_invalidation_stats(),
+    })
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_risk_job(request, job_id):
+    """API endpoint returning the status of a background risk recomputation job."""
+    job = get_object_or_404(RiskJob, id=job_id)
+    return Response({
+        'success': True,
+        'job': {
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'result': job.result,
+            'error': job.last_error if job.status == 'FAILED' else None,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+    })
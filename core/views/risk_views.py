@@ -12,6 +12,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Avg
 import json
 
+from ..caching import cached_response
 from ..models.asset_models import (
     Asset, AssetVulnerabilityAnswer, AssetCriticalityAnswer
 )
@@ -23,10 +24,24 @@ from ..models.risk_models import (
     Scenario, RiskScenarioAssessment, FinalRiskMatrix
 )
 from ..models.log_models import RiskLog
+from ..pagination import paginate_keyset, parse_fields
+from ..risk_engine.recompute import mark_assets_dirty
+from ..risk_engine.submissions import save_assessment_submissions
+from .asset_views import ASSET_FIELDS, filter_assets
+
+# The risk matrix page names the asset type field after its lookup
+MATRIX_ASSET_FIELDS = {**ASSET_FIELDS, 'asset_type__name': 'asset_type__name'}
+
+# Assessments accepted by one bulk save request
+MAX_BULK_ASSESSMENTS = 5000
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@cached_response(['Asset', 'AssetType', 'Country', 'Barrier', 'BarrierCategory', 'BarrierEffectivenessScore',
+                  'RiskType', 'RiskSubtype', 'Scenario', 'Barrier_risk_types', 'Barrier_risk_subtypes',
+                  'Scenario_risk_subtypes', 'Scenario_barriers'],
+                 conditional=True)
 def get_risk_assessment_data(request):
     """API endpoint for risk assessment workflow data."""
     assets = Asset.objects.select_related(
@@ -199,9 +214,9 @@ def save_risk_assessment(request):
             RiskLog.objects.create(
                 asset=asset,
                 risk_type_id=data.get('primaryRiskType'),
-                bta_score=asset.country.baseline_threats.filter(
+                bta_score=asset.country.current_baseline_threats.get(
                     risk_type_id=data.get('primaryRiskType')
-                ).first().baseline_score,
+                ).baseline_score,
                 vulnerability_score=asset.vulnerability_score,
                 criticality_score=asset.criticality_score,
                 residual_risk_score=FinalRiskMatrix.objects.filter(
@@ -214,17 +229,60 @@ def save_risk_assessment(request):
     except Exception as e:
         return Response({'success': False, 'error': str(e)}, status=400)
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def save_risk_assessments_bulk(request):
+    """API endpoint to save the risk assessments of many assets at once.
+
+    Expects {"assessments": [{"asset_id", "bta", "scenario_answers",
+    "vulnerability", "criticality"}, ...], "barrier_effectiveness":
+    {barrier_id: {risk_type_id: scores}}}; see core.risk_engine.submissions.
+    Everything is validated first; invalid assessments are reported and
+    skipped. The risk of the saved ones is recomputed once by a background
+    job. Returns one result per assessment, in order, and the job id.
+    """
+    try:
+        assessments = request.data.get('assessments')
+        if not isinstance(assessments, list) or not assessments:
+            raise ValueError("assessments must be a non-empty list")
+        if len(assessments) > MAX_BULK_ASSESSMENTS:
+            raise ValueError(f"At most {MAX_BULK_ASSESSMENTS} assessments can be saved at once")
+
+        results, job = save_assessment_submissions(assessments, request.data.get('barrier_effectiveness'))
+        saved = sum(1 for result in results if result['success'])
+        return Response({
+            'success': True,
+            'job_id': job.id if job else None,
+            'saved': saved,
+            'failed': len(results) - saved,
+            'results': results,
+        })
+    except (TypeError, ValueError, AttributeError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_risk_matrix_data(request):
-    """API endpoint to get risk matrix data."""
-    assets = Asset.objects.all()
-    risk_types = RiskType.objects.all()
-    
+    """API endpoint to get risk matrix data.
+
+    The asset list is paged and filtered like get_global_assets; "fields"
+    defaults to id, name and asset_type__name.
+    """
+    try:
+        fields = parse_fields(request, MATRIX_ASSET_FIELDS, ['id', 'name', 'asset_type__name'])
+        assets, next_cursor = paginate_keyset(
+            filter_assets(Asset.objects.all(), request.GET), request, fields, MATRIX_ASSET_FIELDS,
+            ordering=request.GET.get('ordering', 'id'),
+        )
+    except (TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+
     return Response({
-        'assets': list(assets.values('id', 'name', 'asset_type__name')),
-        'risk_types': list(risk_types.values()),
+        'assets': assets,
+        'next_cursor': next_cursor,
+        'risk_types': list(RiskType.objects.values()),
     })
 
 @api_view(['GET'])
@@ -283,22 +341,10 @@ def save_step_data(request):
         
         with transaction.atomic():
             if step == 'vulnerability':
-                for question_id, answer in step_data.items():
-                    AssetVulnerabilityAnswer.objects.update_or_create(
-                        asset=asset,
-                        question_id=question_id,
-                        defaults={'answer': answer}
-                    )
-                asset.update_vulnerability_score()
+                AssetVulnerabilityAnswer.bulk_save_answers(asset, step_data)
             
             elif step == 'criticality':
-                for question_id, answer in step_data.items():
-                    AssetCriticalityAnswer.objects.update_or_create(
-                        asset=asset,
-                        question_id=question_id,
-                        defaults={'answer': answer}
-                    )
-                asset.update_criticality_score()
+                AssetCriticalityAnswer.bulk_save_answers(asset, step_data)
             
             elif step == 'barriers':
                 asset.barriers.set(step_data.get('selected_barriers', []))
@@ -312,8 +358,8 @@ def save_step_data(request):
                             defaults=scores
                         )
             
-            # Generate final risk matrices
-            FinalRiskMatrix.generate_matrices(asset)
+            # Generate final risk matrices once the step is committed
+            mark_assets_dirty([asset.id])
         
         return Response({'success': True})
     except Exception as e:
@@ -0,0 +1,182 @@
+"""
+Simulation API Views.
+
+This module contains API endpoints for read-only what-if analysis of the risk model.
+Hypothetical changes are evaluated in memory and never written to the database.
+"""
+
+import secrets
+import time
+
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from ..models.asset_models import Asset
+from ..models.barrier_models import Barrier
+from ..models.risk_models import RiskType
+from ..risk_engine.montecarlo import DEFAULT_DRAWS, DEFAULT_SPREAD, residual_risk_distribution
+from ..risk_engine.optimizer import DEFAULT_STEP, optimize_barriers
+from ..risk_engine.simulation import RiskModel
+
+# Bounds of on-demand distributions; portfolio-wide runs use the
+# simulate_risk_distributions command
+MAX_DRAWS = 10000
+MAX_ASSETS = 500
+
+
+def parse_simulation_overrides(data):
+    """Read barrier performance and BTA overrides from a simulation request.
+
+    Expects {"barriers": {barrier_id: performance_adjustment},
+    "baseline_threats": [{"country_id", "risk_type_id", "baseline_score"}]}.
+    Raises ValueError for out-of-range values.
+    """
+    performance = {}
+    for barrier_id, adjustment in (data.get('barriers') or {}).items():
+        adjustment = float(adjustment)
+        if not 0 <= adjustment <= 1:
+            raise ValueError(f"Performance adjustment of barrier {barrier_id} must be between 0 and 1")
+        performance[int(barrier_id)] = adjustment
+
+    baseline_threats = {}
+    for override in data.get('baseline_threats') or []:
+        score = float(override['baseline_score'])
+        if not 1 <= score <= 10:
+            raise ValueError("Baseline score must be between 1 and 10")
+        baseline_threats[(int(override['country_id']), int(override['risk_type_id']))] = score
+    return performance, baseline_threats
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def simulate_risk(request):
+    """API endpoint returning the risk matrix cells changed by hypothetical barrier and BTA changes."""
+    try:
+        started = time.perf_counter()
+        performance, baseline_threats = parse_simulation_overrides(request.data)
+        model = RiskModel(request.data.get('asset_ids'))
+        cells = model.simulate(
+            performance, baseline_threats,
+            include_unchanged=bool(request.data.get('include_unchanged')),
+        )
+
+        asset_names = dict(
+            Asset.objects.filter(id__in={cell['asset_id'] for cell in cells}).values_list('id', 'name')
+        )
+        risk_type_names = dict(RiskType.objects.values_list('id', 'name'))
+        for cell in cells:
+            cell['asset_name'] = asset_names.get(cell['asset_id'])
+            cell['risk_type_name'] = risk_type_names.get(cell['risk_type_id'])
+
+        return Response({
+            'success': True,
+            'cells_evaluated': len(model.cells),
+            'cells': cells,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'success': False, 'error': str(e)})
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def simulate_risk_distribution(request):
+    """API endpoint returning Monte Carlo p5/p50/p95 residual risk per asset and risk type.
+
+    Accepts the same overrides as simulate_risk, plus "asset_ids" (required),
+    "draws", "seed" and "spread" ({input: half-width of its triangular
+    distribution}). The seed used is returned so a run can be repeated.
+    """
+    try:
+        started = time.perf_counter()
+        performance, baseline_threats = parse_simulation_overrides(request.data)
+        draws = int(request.data.get('draws', DEFAULT_DRAWS))
+        if not 1 <= draws <= MAX_DRAWS:
+            raise ValueError(f"draws must be between 1 and {MAX_DRAWS}")
+        spread = {key: float(value) for key, value in (request.data.get('spread') or {}).items()}
+        unknown = set(spread) - set(DEFAULT_SPREAD)
+        if unknown:
+            raise ValueError(f"Unknown spread inputs: {', '.join(sorted(unknown))}")
+        asset_ids = [int(asset_id) for asset_id in request.data.get('asset_ids') or []]
+        if not 1 <= len(asset_ids) <= MAX_ASSETS:
+            raise ValueError(f"asset_ids must list between 1 and {MAX_ASSETS} assets")
+        seed = request.data.get('seed')
+        seed = secrets.randbits(63) if seed is None else int(seed)
+
+        distribution = residual_risk_distribution(
+            asset_ids, draws, seed, spread, performance, baseline_threats
+        )
+        return Response({
+            'success': True,
+            'draws': draws,
+            'seed': seed,
+            'cells': [
+                {'asset_id': asset_id, 'risk_type_id': risk_type_id, **scores}
+                for (asset_id, risk_type_id), scores in distribution.items()
+            ],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'success': False, 'error': str(e)})
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def optimize_barrier_investments(request):
+    """API endpoint returning the barrier upgrades that most reduce portfolio residual risk.
+
+    Accepts "budget" and/or "max_upgrades", "costs" ({barrier_id: cost of one
+    upgrade step}), "step" (performance adjustment gained per upgrade) and
+    optional "asset_ids". Nothing is written.
+    """
+    try:
+        started = time.perf_counter()
+        budget = request.data.get('budget')
+        max_upgrades = request.data.get('max_upgrades')
+        if budget is None and max_upgrades is None:
+            raise ValueError("Either budget or max_upgrades is required")
+        budget = None if budget is None else float(budget)
+        max_upgrades = None if max_upgrades is None else int(max_upgrades)
+        step = float(request.data.get('step', DEFAULT_STEP))
+        if not 0 < step <= 1:
+            raise ValueError("step must be between 0 and 1")
+        costs = {}
+        for barrier_id, cost in (request.data.get('costs') or {}).items():
+            cost = float(cost)
+            if cost <= 0:
+                raise ValueError(f"Cost of barrier {barrier_id} must be positive")
+            costs[int(barrier_id)] = cost
+
+        plan = optimize_barriers(request.data.get('asset_ids'), max_upgrades, budget, costs, step)
+
+        barrier_names = dict(
+            Barrier.objects.filter(id__in=plan['performance']).values_list('id', 'name')
+        )
+        for upgrade in plan['upgrades']:
+            upgrade['barrier_name'] = barrier_names.get(upgrade['barrier_id'])
+        return Response({
+            'success': True,
+            'upgrades': plan['upgrades'],
+            'barriers': [
+                {'barrier_id': barrier_id, 'barrier_name': barrier_names.get(barrier_id),
+                 'performance_adjustment': performance}
+                for barrier_id, performance in plan['performance'].items()
+            ],
+            'total_cost': sum(upgrade['cost'] for upgrade in plan['upgrades']),
+            'total_risk_before': plan['total_before'],
+            'total_risk_after': plan['total_after'],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'success': False, 'error': str(e)})
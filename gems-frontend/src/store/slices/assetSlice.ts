@@ -41,8 +41,17 @@ const initialState: AssetState = {
 export const fetchAssets = createAsyncThunk(
   'asset/fetchAssets',
   async () => {
-    const response = await axios.get<{ assets: AssetResponse[] }>('/api/assets/');
-    return response.data.assets.map(asset => ({
+    // The list is paged; follow the cursors to load every asset
+    const assets: AssetResponse[] = [];
+    let cursor: string | null = null;
+    do {
+      const response: { data: { assets: AssetResponse[]; next_cursor: string | null } } = await axios.get(
+        '/api/assets/', { params: { page_size: 1000, ...(cursor ? { cursor } : {}) } }
+      );
+      assets.push(...response.data.assets);
+      cursor = response.data.next_cursor;
+    } while (cursor);
+    return assets.map(asset => ({
       ...asset,
       type: asset.asset_type,
       riskScore: calculateAssetRiskScore(asset),
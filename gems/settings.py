@@ -40,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.CoalescedRecomputeMiddleware',
 ]
 
 # CORS settings
@@ -78,6 +79,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock up front so the web process and risk workers
+        # wait for each other instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+# Cache used by the dashboard and the tag-versioned response cache (core.caching).
+# Local memory keeps each process's invalidations to itself; use a
+# FileBasedCache directory shared with the risk workers when they run as
+# separate processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
     }
 }
 
@@ -104,6 +122,15 @@ REST_FRAMEWORK = {
     'UNAUTHENTICATED_USER': None,
 }
 
+# Background risk recomputation worker (python manage.py risk_worker)
+RISK_WORKER = {
+    'PROCESSES': 2,
+    'LEASE_SECONDS': 300,
+    'POLL_INTERVAL': 2,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
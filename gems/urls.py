@@ -8,6 +8,10 @@ from core.views import (
     dashboard_views,
     analysis_views,
     barrier_views,
+    engine_views,
+    simulation_views,
+    export_views,
+    batch_views,
 )
 
 urlpatterns = [
@@ -33,6 +37,7 @@ urlpatterns = [
     path('api/assets/', asset_views.get_global_assets, name='get_global_assets'),
     path('api/assets/<int:asset_id>/', asset_views.get_asset_details, name='get_asset_details'),
     path('api/assets/<int:asset_id>/risk-data/', asset_views.get_asset_risk_data, name='get_asset_risk_data'),
+    path('api/assets/<int:asset_id>/answers/bulk/', asset_views.save_asset_answers, name='save_asset_answers'),
     path('api/assets/save/', asset_views.save_asset, name='save_asset'),
     path('api/assets/delete/', asset_views.delete_asset, name='delete_asset'),
     path('api/assets/form-data/', asset_views.get_asset_form_data, name='get_asset_form_data'),
@@ -47,6 +52,7 @@ urlpatterns = [
     # Risk Assessment API Endpoints
     path('api/risk-assessment/data/', risk_views.get_risk_assessment_data, name='get_risk_assessment_data'),
     path('api/risk-assessment/save/', risk_views.save_risk_assessment, name='save_risk_assessment'),
+    path('api/risk-assessment/bulk-save/', risk_views.save_risk_assessments_bulk, name='save_risk_assessments_bulk'),
     path('api/risk-matrix/data/', risk_views.get_risk_matrix_data, name='get_risk_matrix_data'),
     path('api/risk-matrix/generate/', risk_views.generate_risk_matrix, name='generate_risk_matrix'),
     path('api/risk-matrix/step/save/', risk_views.save_step_data, name='save_step_data'),
@@ -65,4 +71,19 @@ urlpatterns = [
     path('api/barriers/issues/<int:issue_id>/resolve/', barrier_views.resolve_barrier_issue, name='resolve_barrier_issue'),
     path('api/barriers/category/<int:category_id>/', barrier_views.get_barriers_by_category, name='get_barriers_by_category'),
     path('admin/core/risksubtype/', barrier_views.get_risk_subtypes, name='admin_get_risk_subtypes'),  # New endpoint for admin interface
+    
+    # Risk Engine API Endpoints
+    path('api/risk-engine/stats/', engine_views.get_risk_engine_stats, name='get_risk_engine_stats'),
+    path('api/risk-engine/jobs/<int:job_id>/', engine_views.get_risk_job, name='get_risk_job'),
+    
+    # Simulation API Endpoints
+    path('api/simulate/', simulation_views.simulate_risk, name='simulate_risk'),
+    path('api/simulate/distribution/', simulation_views.simulate_risk_distribution, name='simulate_risk_distribution'),
+    path('api/optimize/barriers/', simulation_views.optimize_barrier_investments, name='optimize_barrier_investments'),
+    
+    # Export API Endpoints
+    path('api/export/<str:dataset>/', export_views.export_dataset, name='export_dataset'),
+    
+    # Batch API Endpoints
+    path('api/batch/', batch_views.batch_requests, name='batch_requests'),
 ]